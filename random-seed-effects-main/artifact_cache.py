@@ -0,0 +1,167 @@
+import ast
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from static import *
+
+
+def parse_size(size):
+    # sizes are given like the SLURM memory settings, e.g. "500M" or "64G", plain numbers are bytes
+    if size is None or size == "":
+        return None
+    size = str(size).strip().upper()
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    if size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def cache_index_path():
+    # the index is kept on local disk like the catalog, as SQLite locking is unreliable on the shared network file
+    # system, one index per cache folder in the folder set by RSE_CATALOG_FOLDER or the temporary folder
+    cache_folder = str(Path(f"./{CACHE_FOLDER}").resolve())
+    index_folder = Path(os.environ.get("RSE_CATALOG_FOLDER", tempfile.gettempdir()))
+    index_folder.mkdir(parents=True, exist_ok=True)
+    return index_folder / f"rse_{hashlib.sha1(cache_folder.encode()).hexdigest()[:16]}_{CACHE_INDEX_FILE}"
+
+
+def connect_cache():
+    Path(f"./{CACHE_FOLDER}/{CACHE_OBJECT_FOLDER}").mkdir(parents=True, exist_ok=True)
+    new_index = not cache_index_path().exists()
+    connection = sqlite3.connect(cache_index_path(), timeout=60)
+    connection.execute("CREATE TABLE IF NOT EXISTS artifacts "
+                       "(key TEXT PRIMARY KEY, size INTEGER, last_used REAL)")
+    connection.execute("CREATE TABLE IF NOT EXISTS aliases (key TEXT, path TEXT, PRIMARY KEY (key, path))")
+    connection.execute("CREATE TABLE IF NOT EXISTS file_hashes "
+                       "(path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, hash TEXT)")
+    if new_index:
+        # a new index takes over the cached objects, e.g. on another machine, last used by their modification time
+        with connection:
+            connection.executemany("INSERT OR IGNORE INTO artifacts VALUES (?, ?, ?)", [
+                (cached_file.name, cached_file.stat().st_size, cached_file.stat().st_mtime)
+                for cached_file in Path(f"./{CACHE_FOLDER}/{CACHE_OBJECT_FOLDER}").glob("*/*")])
+    return connection
+
+
+def object_path(key):
+    return f"./{CACHE_FOLDER}/{CACHE_OBJECT_FOLDER}/{key[:2]}/{key}"
+
+
+def file_hash(connection, path):
+    # content hashes are remembered per file size and modification time, so unchanged files are only read once
+    stat = os.stat(path)
+    path = str(Path(path).resolve())
+    row = connection.execute("SELECT hash FROM file_hashes WHERE path = ? AND size = ? AND mtime = ?",
+                             (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+    if row is not None:
+        return row[0]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+    with connection:
+        connection.execute("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)",
+                           (path, stat.st_size, stat.st_mtime_ns, content_hash))
+    return content_hash
+
+
+def stage_code_files(*stage_files):
+    # the files of a stage and of every project module they import, directly or through other project modules, so
+    # that a change to any code the stage runs gives new keys
+    project_folder = Path(__file__).resolve().parent
+    code_files = set()
+    pending_files = [Path(stage_file).resolve() for stage_file in stage_files]
+    while len(pending_files) > 0:
+        code_file = pending_files.pop()
+        if code_file in code_files:
+            continue
+        code_files.add(code_file)
+        for node in ast.walk(ast.parse(code_file.read_text())):
+            if isinstance(node, ast.Import):
+                module_names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module is not None and node.level == 0:
+                module_names = [node.module]
+            else:
+                continue
+            pending_files += [project_folder / f"{module_name}.py" for module_name in module_names
+                              if (project_folder / f"{module_name}.py").exists()]
+    return sorted(str(code_file) for code_file in code_files)
+
+
+def artifact_key(connection, stage, parameters, upstream_files, code_files):
+    # reading a cached upstream artifact counts as using it
+    with connection:
+        for upstream_file in upstream_files:
+            connection.execute("UPDATE artifacts SET last_used = ? WHERE key IN "
+                               "(SELECT key FROM aliases WHERE path = ?)",
+                               (time.time(), str(Path(upstream_file).resolve())))
+    # the key only depends on what goes into a stage, not on the names of the files involved
+    key_data = {
+        "stage": stage,
+        "parameters": parameters,
+        "upstream": [file_hash(connection, upstream_file) for upstream_file in upstream_files],
+        "code": [file_hash(connection, code_file) for code_file in code_files]
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def link_or_copy(source_path, target_path):
+    Path(target_path).parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+
+def fetch_artifact(connection, key, target_path):
+    # place a cached artifact at the target path, returns whether the artifact was in the cache
+    if connection.execute("SELECT key FROM artifacts WHERE key = ?", (key,)).fetchone() is None:
+        return False
+    if not Path(object_path(key)).exists():
+        with connection:
+            connection.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+        return False
+    if not Path(target_path).exists():
+        link_or_copy(object_path(key), target_path)
+    with connection:
+        connection.execute("UPDATE artifacts SET last_used = ? WHERE key = ?", (time.time(), key))
+        connection.execute("INSERT OR IGNORE INTO aliases VALUES (?, ?)", (key, str(Path(target_path).resolve())))
+    print(f"Reused cached artifact for {target_path}.")
+    return True
+
+
+def store_artifact(connection, key, source_path, size_limit):
+    # add a freshly written artifact to the cache and evict the least recently used ones above the size limit
+    if not Path(object_path(key)).exists():
+        link_or_copy(source_path, object_path(key))
+    with connection:
+        connection.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?)",
+                           (key, os.stat(object_path(key)).st_size, time.time()))
+        connection.execute("INSERT OR IGNORE INTO aliases VALUES (?, ?)", (key, str(Path(source_path).resolve())))
+    evict_artifacts(connection, size_limit, [key])
+
+
+def evict_artifacts(connection, size_limit, keep_keys=()):
+    if size_limit is None:
+        return
+    total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+    if total_size <= size_limit:
+        return
+    for key, size in connection.execute("SELECT key, size FROM artifacts ORDER BY last_used ASC").fetchall():
+        if total_size <= size_limit:
+            break
+        if key in keep_keys:
+            continue
+        # only the cached object is removed, the linked files in the data folder may still be read by later stages
+        Path(object_path(key)).unlink(missing_ok=True)
+        with connection:
+            connection.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+            connection.execute("DELETE FROM aliases WHERE key = ?", (key,))
+        total_size -= size
+        print(f"Evicted cached artifact {key}.")
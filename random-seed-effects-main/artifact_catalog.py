@@ -0,0 +1,277 @@
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from static import *
+
+# the file name patterns of the artifacts below the data set folders, the catalog columns they are parsed into follow
+# the fold, shuffle seed, pruning and splitting that every name starts with
+CATALOG_KINDS = {
+    "split": (SPLIT_FOLDER, SPLIT_FILE, []),
+    "ml": (ML_FOLDER, ML_FILE, ["ML_seed"]),
+    "predictions": (PREDICTION_FOLDER, PREDICTION_FILE, ["ML_seed", "num_batches", "detail"]),
+    "evaluations": (EVALUATION_FOLDER, EVALUATION_FILE, ["ML_seed", "num_batches", "detail"])
+}
+
+
+def catalog_path():
+    # the catalog is a cache on local disk, as SQLite locking is unreliable on the shared network file system of the
+    # data folder, one catalog per data folder in the folder set by RSE_CATALOG_FOLDER or the temporary folder
+    data_folder = str(Path(f"./{DATA_FOLDER}").resolve())
+    catalog_folder = Path(os.environ.get("RSE_CATALOG_FOLDER", tempfile.gettempdir()))
+    catalog_folder.mkdir(parents=True, exist_ok=True)
+    return catalog_folder / f"rse_{hashlib.sha1(data_folder.encode()).hexdigest()[:16]}_{CATALOG_FILE}"
+
+
+def journal_path():
+    # every process appends to its own journal in the data folder, so jobs on different nodes never write one file
+    return Path(f"./{DATA_FOLDER}/{CATALOG_JOURNAL_FOLDER}/{socket.gethostname()}_{os.getpid()}.jsonl")
+
+
+def connect_catalog():
+    Path(f"./{DATA_FOLDER}").mkdir(exist_ok=True)
+    catalog_file = catalog_path()
+    new_catalog = not catalog_file.exists()
+    connection = sqlite3.connect(catalog_file, timeout=60)
+    connection.execute("CREATE TABLE IF NOT EXISTS artifacts "
+                       "(path TEXT PRIMARY KEY, kind TEXT, data_set_name TEXT, prune_technique TEXT, "
+                       "split_technique TEXT, test_fold INTEGER, shuffle_seed TEXT, MLModel TEXT, ML_seed TEXT, "
+                       "num_batches INTEGER, detail TEXT)")
+    connection.execute("CREATE INDEX IF NOT EXISTS artifacts_lookup "
+                       "ON artifacts (kind, data_set_name, prune_technique, split_technique)")
+    connection.execute("CREATE TABLE IF NOT EXISTS journals (name TEXT PRIMARY KEY, merged INTEGER)")
+    # the time of the last record applied to a path, so an older record merged later does not undo it
+    connection.execute("CREATE TABLE IF NOT EXISTS artifact_times (path TEXT PRIMARY KEY, time INTEGER)")
+    connection.commit()
+    # a data folder without a catalog on this machine is registered once, the journals add what the stages wrote
+    if new_catalog:
+        rebuild_catalog(connection)
+    merge_journals(connection)
+    compact_journals()
+    return connection
+
+
+def write_journal(record):
+    # a record is one line written at once, the merge skips a line that is not complete yet, the time orders the
+    # records of all journals
+    path = journal_path()
+    path.parent.mkdir(exist_ok=True)
+    record["time"] = time.time_ns()
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def complete_lines(path, start, size):
+    with open(path, "rb") as f:
+        f.seek(start)
+        content = f.read(size - start)
+    return content[:content.rfind(b"\n") + 1]
+
+
+def snapshot_sections(content):
+    # a snapshot holds the records of compacted journals, each after a line with the name and size of its journal
+    sections = []
+    for line in content.decode().splitlines():
+        record = json.loads(line)
+        if "journal" in record:
+            sections.append((record["journal"], record["size"], []))
+        else:
+            sections[-1][2].append(line)
+    return sections
+
+
+def merge_journals(connection):
+    # the records appended to the journals since the last merge are applied to the catalog in one transaction, in the
+    # order of their times, as the journals of different processes interleave
+    journal_folder = Path(f"./{DATA_FOLDER}/{CATALOG_JOURNAL_FOLDER}")
+    if not journal_folder.exists():
+        return
+    merged = dict(connection.execute("SELECT name, merged FROM journals").fetchall())
+    records = []
+    merged_journals = []
+    for journal in journal_folder.glob("*.jsonl"):
+        try:
+            journal_size = journal.stat().st_size
+            # a journal smaller than what was merged from it was replaced and is merged from its start
+            start = merged.get(journal.name, 0) if merged.get(journal.name, 0) <= journal_size else 0
+            if start == journal_size:
+                continue
+            content = complete_lines(journal, start, journal_size)
+        except FileNotFoundError:
+            # compacted since the folder was listed, its records are in a snapshot
+            continue
+        if journal.name.startswith(CATALOG_SNAPSHOT_PREFIX):
+            # sections of journals that were already merged on their own or from an earlier snapshot are skipped
+            for name, size, lines in snapshot_sections(content):
+                if merged.get(name, 0) < size:
+                    records += [json.loads(line) for line in lines]
+                    merged_journals.append((name, size))
+        else:
+            records += [json.loads(line) for line in content.decode().splitlines()]
+        merged_journals.append((journal.name, start + len(content)))
+    # the sort is stable, so records of one journal with equal times keep their order
+    records.sort(key=lambda record: record.get("time", 0))
+    with connection:
+        for record in records:
+            path = record["forget"] if "forget" in record else record["register"][0]
+            applied = connection.execute("SELECT time FROM artifact_times WHERE path = ?", (path,)).fetchone()
+            if applied is not None and applied[0] > record.get("time", 0):
+                continue
+            if "forget" in record:
+                connection.execute("DELETE FROM artifacts WHERE path = ?", (path,))
+            else:
+                connection.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   record["register"])
+            connection.execute("INSERT OR REPLACE INTO artifact_times VALUES (?, ?)", (path, record.get("time", 0)))
+        connection.executemany("INSERT OR REPLACE INTO journals VALUES (?, ?)", merged_journals)
+
+
+def compact_journals():
+    # journals that were not written for a while are moved into a new snapshot together with the earlier snapshots,
+    # so the merges of all catalogs list a few files instead of one journal per finished job, a journal is renamed
+    # before it is read, so a process that writes again starts a new journal, the renamed journals and the snapshot
+    # stay readable by the merges until the new snapshot has all their records
+    journal_folder = Path(f"./{DATA_FOLDER}/{CATALOG_JOURNAL_FOLDER}")
+    if not journal_folder.exists():
+        return
+    idle_journals = []
+    for journal in journal_folder.glob("*.jsonl"):
+        try:
+            if not journal.name.startswith(CATALOG_SNAPSHOT_PREFIX) and \
+                    time.time() - journal.stat().st_mtime > CATALOG_JOURNAL_IDLE:
+                idle_journals.append(journal)
+        except FileNotFoundError:
+            continue
+    if len(idle_journals) < CATALOG_COMPACT_JOURNALS:
+        return
+
+    suffix = f"{socket.gethostname()}_{os.getpid()}_{time.time_ns()}"
+    sections = {}
+    compacted = []
+    for snapshot in journal_folder.glob(f"{CATALOG_SNAPSHOT_PREFIX}*.jsonl"):
+        try:
+            content = complete_lines(snapshot, 0, snapshot.stat().st_size)
+        except FileNotFoundError:
+            continue
+        for name, size, lines in snapshot_sections(content):
+            sections[name] = (size, lines)
+        compacted.append(snapshot)
+    for journal in idle_journals:
+        # the section is named after the renamed journal, which no process writes to again
+        claimed = journal if "~" in journal.stem else journal.with_name(f"{journal.stem}~{suffix}.jsonl")
+        try:
+            journal.rename(claimed)
+            content = complete_lines(claimed, 0, claimed.stat().st_size)
+        except FileNotFoundError:
+            # compacted by another process
+            continue
+        sections[claimed.name] = (len(content), content.decode().splitlines())
+        compacted.append(claimed)
+
+    snapshot_path = journal_folder / f"{CATALOG_SNAPSHOT_PREFIX}{suffix}.jsonl"
+    temporary_path = snapshot_path.with_suffix(".tmp")
+    with open(temporary_path, "w") as f:
+        for name, (size, lines) in sections.items():
+            f.write("".join(f"{line}\n" for line in [json.dumps({"journal": name, "size": size})] + lines))
+    temporary_path.rename(snapshot_path)
+    for path in compacted:
+        path.unlink(missing_ok=True)
+    print(f"Compacted {len(compacted)} catalog journals and snapshots into {snapshot_path}.")
+
+
+def register_artifact(kind, path, data_set_name, prune_technique, split_technique, test_fold, shuffle_seed,
+                      MLModel=None, ML_seed=None, num_batches=None, detail=None):
+    # stages call this after an artifact is completely written, so the catalog never lists partial files, the stages
+    # only append to their journal and the executors merge it into the catalog
+    write_journal({"register": [str(Path(path).resolve()), kind, data_set_name, prune_technique, split_technique,
+                                int(test_fold), str(shuffle_seed), MLModel, ML_seed,
+                                None if num_batches is None else int(num_batches),
+                                None if detail is None else str(detail)]})
+
+
+def forget_artifact(path):
+    write_journal({"forget": str(Path(path).resolve())})
+
+
+def existing_paths(paths):
+    # the paths whose files exist, found by listing every folder once instead of checking every file
+    folder_files = {}
+    for path in paths:
+        folder = os.path.dirname(path)
+        if folder not in folder_files:
+            folder_files[folder] = set(os.listdir(folder)) if os.path.isdir(folder) else set()
+    return set(path for path in paths if os.path.basename(path) in folder_files[os.path.dirname(path)])
+
+
+def catalog_shuffle_seeds(connection, data_set_name, prune_technique, split_technique):
+    # shuffle seeds in the order their splits were written, of the splits whose files still exist
+    catalog_artifacts(connection, "split", data_set_name, prune_technique, split_technique)
+    return [row[0] for row in connection.execute(
+        "SELECT shuffle_seed FROM artifacts WHERE kind = 'split' AND data_set_name = ? AND prune_technique = ? "
+        "AND split_technique = ? GROUP BY shuffle_seed ORDER BY MIN(rowid)",
+        (data_set_name, prune_technique, split_technique)).fetchall()]
+
+
+def catalog_artifacts(connection, kind, data_set_name, prune_technique, split_technique):
+    # all artifacts of a kind as (test_fold, shuffle_seed, MLModel, ML_seed, num_batches, detail) for set lookups,
+    # artifacts whose files were deleted or never completed since they were registered are removed from the catalog,
+    # so they are regenerated
+    rows = connection.execute(
+        "SELECT path, test_fold, shuffle_seed, MLModel, ML_seed, num_batches, detail FROM artifacts WHERE kind = ? "
+        "AND data_set_name = ? AND prune_technique = ? AND split_technique = ?",
+        (kind, data_set_name, prune_technique, split_technique)).fetchall()
+    existing = existing_paths([row[0] for row in rows])
+    missing = [(row[0],) for row in rows if row[0] not in existing]
+    if len(missing) > 0:
+        with connection:
+            connection.executemany("DELETE FROM artifacts WHERE path = ?", missing)
+        print(f"Removed {len(missing)} {kind} artifacts whose files are missing from the catalog.")
+    return set(row[1:] for row in rows if row[0] in existing)
+
+
+def rebuild_catalog(connection):
+    # register all artifacts found in the data folder, e.g. after files were deleted or copied by hand
+    # the catalog is replaced in a single transaction, so concurrent stages never see it half rebuilt
+    connection.execute("DELETE FROM artifacts")
+    for data_set_folder in Path(f"./{DATA_FOLDER}").iterdir():
+        if not data_set_folder.is_dir():
+            continue
+        for artifact_folder in data_set_folder.iterdir():
+            for kind, (folder_name, file_name, name_fields) in CATALOG_KINDS.items():
+                if kind == "split":
+                    if artifact_folder.name != folder_name:
+                        continue
+                    MLModel = None
+                elif artifact_folder.name.startswith(f"{folder_name}_"):
+                    MLModel = artifact_folder.name[len(folder_name) + 1:]
+                else:
+                    continue
+                for file in artifact_folder.iterdir():
+                    if not file.name.endswith(f"_{file_name}"):
+                        continue
+                    name_parts = file.name[:-len(file_name) - 1].split("_")
+                    if len(name_parts) != 4 + len(name_fields):
+                        continue
+                    test_fold, shuffle_seed, prune_technique, split_technique = name_parts[:4]
+                    fields = dict(zip(name_fields, name_parts[4:]))
+                    connection.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                       (str(file.resolve()), kind, data_set_folder.name, prune_technique,
+                                        split_technique, int(test_fold), shuffle_seed, MLModel,
+                                        fields.get("ML_seed"),
+                                        int(fields["num_batches"]) if "num_batches" in fields else None,
+                                        fields.get("detail")))
+    connection.commit()
+    print("Rebuilt artifact catalog.")
+
+
+if __name__ == "__main__":
+    # a new catalog is built from the data folder, the journals are removed as the new catalog has all their
+    # artifacts, so this must not run while stages are running
+    catalog_path().unlink(missing_ok=True)
+    for journal in Path(f"./{DATA_FOLDER}/{CATALOG_JOURNAL_FOLDER}").glob("*.jsonl"):
+        journal.unlink()
+    connect_catalog().close()
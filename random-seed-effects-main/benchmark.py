@@ -0,0 +1,168 @@
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from static import *
+from fit_ML import FOLD_STATISTICS_MODELS
+from stage_runner import run_job
+from task_pack import STAGE_FUNCTIONS
+from telemetry import telemetry_summary
+
+# the stage functions in the order the benchmark runs them
+BENCHMARK_STAGES = ["clean_data", "prune_data", "generate_splits_seeds", "fit_ML", "fit_ML_folds", "make_predictions",
+                    "evaluate_predictions"]
+
+
+def generate_synthetic_data(num_rows, num_users, seed, chunk_size=CLEAN_CHUNK_SIZE):
+    # ratings of users with a user effect and heavy tailed noise, so that pruning removes outliers, written in chunks
+    # so that large data sets do not have to fit in memory
+    base_path_original = f"./{DATA_FOLDER}/{BENCHMARK_DATA_SET_NAME}/{ORIGINAL_FOLDER}"
+    Path(base_path_original).mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    user_effects = rng.normal(size=num_users)
+    for chunk_start in range(0, num_rows, chunk_size):
+        chunk_rows = min(chunk_size, num_rows - chunk_start)
+        users = rng.integers(0, num_users, chunk_rows)
+        chunk = pd.DataFrame({"user": users, "rating": (user_effects[users] + rng.standard_t(3, chunk_rows)).round(3),
+                              "noise": rng.normal(size=chunk_rows).round(3)})
+        chunk.to_csv(f"{base_path_original}/synthetic.csv", mode="w" if chunk_start == 0 else "a",
+                     header=chunk_start == 0, index=False)
+    print(f"Generated synthetic data set with {num_rows} rows and {num_users} users.")
+
+
+def benchmark_jobs(MLModels, prune_technique, split_technique, num_folds, shuffle_seed, num_batches, topn_scores,
+                   data_format, prune_chunk_size):
+    # the jobs of all stages on the synthetic data set as (stage function name, arguments), with a static ML seed so
+    # that every version fits the same models
+    data_set_name = BENCHMARK_DATA_SET_NAME
+    jobs = [("clean_data", [data_set_name, data_format]),
+            ("prune_data", [data_set_name, [prune_technique], data_format, prune_chunk_size]),
+            ("generate_splits_seeds", [data_set_name, prune_technique, split_technique, num_folds, [shuffle_seed], 1,
+                                       data_format])]
+    for MLModel in MLModels:
+        if MLModel in FOLD_STATISTICS_MODELS:
+            jobs.append(("fit_ML_folds", [data_set_name, prune_technique, split_technique, num_folds,
+                                          list(range(num_folds)), shuffle_seed, MLModel, ["static"] * num_folds,
+                                          [-1] * num_folds]))
+        else:
+            jobs += [("fit_ML", [data_set_name, prune_technique, split_technique, num_folds, test_fold, shuffle_seed,
+                                 MLModel, "static", -1]) for test_fold in range(num_folds)]
+    for stage_function_name, job_arguments in [
+        ("make_predictions", lambda test_fold, MLModel: [data_set_name, prune_technique, split_technique, test_fold,
+                                                         shuffle_seed, MLModel, "static", num_batches, -1]),
+        ("evaluate_predictions", lambda test_fold, MLModel: [data_set_name, prune_technique, split_technique,
+                                                             test_fold, shuffle_seed, MLModel, "static", num_batches,
+                                                             topn_scores])]:
+        jobs += [(stage_function_name, job_arguments(test_fold, MLModel)) for MLModel in MLModels
+                 for test_fold in range(num_folds)]
+    return jobs
+
+
+def code_version():
+    # the commit of the code, so that results of different versions can be told apart
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def run_benchmark(data_sizes, num_users, MLModels, label, prune_technique, split_technique, num_folds, num_batches,
+                  topn_scores, data_format, prune_chunk_size, seed, work_folder, results_path):
+    # every size runs in a fresh data folder inside the work folder, so the catalog and telemetry of the project are
+    # not touched, and every job runs in a fresh process, so its peak memory is not inflated by earlier jobs
+    os.chdir(work_folder)
+    commit = code_version()
+    results = []
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn"), max_tasks_per_child=1) as executor:
+        for num_rows in data_sizes:
+            shutil.rmtree(f"./{DATA_FOLDER}", ignore_errors=True)
+            generate_synthetic_data(num_rows, num_users, seed)
+            for stage_function_name, job in benchmark_jobs(MLModels, prune_technique, split_technique, num_folds,
+                                                           seed, num_batches, topn_scores, data_format,
+                                                           prune_chunk_size):
+                try:
+                    error = executor.submit(run_job, STAGE_FUNCTIONS[stage_function_name], job).result()
+                except Exception as exception:
+                    # the worker process itself died, e.g. because it ran out of memory
+                    error = repr(exception)
+                if error is not None:
+                    # the later stages depend on this job, so the remaining jobs of this size are not run
+                    print(f"Job {stage_function_name}{job} failed:\n{error}")
+                    break
+
+            # the rows a job processed are the rows it loaded, or saved for stages that stream their input
+            summary = telemetry_summary(["stage", "MLModel"], f"./{DATA_FOLDER}/{TELEMETRY_FILE}")
+            stage_rows = summary.get("load_rows", pd.Series(0, index=summary.index)).fillna(0)
+            stage_rows = stage_rows.where(stage_rows > 0, summary.get("save_rows", pd.Series(0, index=summary.index)))
+            size_results = pd.DataFrame({
+                "label": label, "commit": commit, "host": socket.gethostname(),
+                "started": time.strftime("%Y-%m-%d %H:%M:%S"), "num_rows": num_rows, "num_users": num_users,
+                "stage": summary["stage"], "MLModel": summary["MLModel"], "jobs": summary["jobs"],
+                "failed": summary["failed"], "stage_rows": stage_rows, "wall_time": summary["wall_time"],
+                "cpu_time": summary["cpu_time"], "rows_per_second": stage_rows / summary["wall_time"],
+                "peak_rss": summary["peak_rss"]})
+            size_results["stage_order"] = size_results["stage"].map(BENCHMARK_STAGES.index)
+            size_results = size_results.sort_values(["stage_order", "MLModel"]).drop(columns="stage_order")
+            print(size_results[["num_rows", "stage", "MLModel", "rows_per_second", "peak_rss"]].to_string(
+                index=False))
+            results.append(size_results)
+
+    # results are appended, so that runs of different versions can be compared from one file
+    results = pd.concat(results)
+    results.to_csv(results_path, mode="a", header=not Path(results_path).exists(), index=False)
+    print(f"Written benchmark results to {results_path}.")
+    return results
+
+
+def compare_benchmarks(results_path, labels):
+    # rows per second and peak memory of the last run of each label side by side, with the change against the first
+    results = pd.read_csv(results_path)
+    results = results[results["label"].isin(labels)].drop_duplicates(["label", "num_rows", "stage", "MLModel"],
+                                                                     keep="last")
+    comparison = results.pivot_table(index=["num_rows", "stage", "MLModel"], columns="label",
+                                     values=["rows_per_second", "peak_rss"], aggfunc="last")
+    comparison = comparison.reindex(columns=labels, level="label")
+    for label in labels[1:]:
+        comparison[("speedup", label)] = comparison[("rows_per_second", label)] / comparison[
+            ("rows_per_second", labels[0])]
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Random Seed Effects synthetic benchmark!")
+    parser.add_argument('--num_rows', dest='num_rows', nargs="+", type=int, default=[10000, 100000, 1000000])
+    parser.add_argument('--num_users', dest='num_users', type=int, default=1000)
+    parser.add_argument('--MLModels', dest='MLModels', nargs="+", type=str,
+                        default=["decision_tree", "knn", "linear_regression"])
+    parser.add_argument('--label', dest='label', type=str, default="")
+    parser.add_argument('--prune_technique', dest='prune_technique', type=str, default="remove-outliers")
+    parser.add_argument('--split_technique', dest='split_technique', type=str, default="weak-generalization")
+    parser.add_argument('--num_folds', dest='num_folds', type=int, default=5)
+    parser.add_argument('--num_batches', dest='num_batches', type=int, default=10)
+    parser.add_argument('--topn_scores', dest='topn_scores', nargs="+", type=str, default=["1", "5", "10"])
+    parser.add_argument('--data_format', dest='data_format', type=str, default=DATA_FORMAT)
+    parser.add_argument('--prune_chunk_size', dest='prune_chunk_size', type=int, default=0)
+    parser.add_argument('--seed', dest='seed', type=int, default=42)
+    parser.add_argument('--work_folder', dest='work_folder', type=str, default=f"./{BENCHMARK_FOLDER}")
+    parser.add_argument('--results_file', dest='results_file', type=str, default=f"./{BENCHMARK_RESULTS_FILE}")
+    parser.add_argument('--compare', dest='compare', nargs="+", type=str, default=[])
+    args = parser.parse_args()
+
+    results_path = str(Path(args.results_file).resolve())
+    if len(args.compare) > 0:
+        with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 200):
+            print(compare_benchmarks(results_path, args.compare))
+    else:
+        print("Running benchmark with arguments: ", args.__dict__)
+        Path(args.work_folder).mkdir(parents=True, exist_ok=True)
+        run_benchmark(args.num_rows, args.num_users, args.MLModels, args.label or code_version(),
+                      args.prune_technique, args.split_technique, args.num_folds, args.num_batches, args.topn_scores,
+                      args.data_format, args.prune_chunk_size, args.seed, args.work_folder, results_path)
@@ -4,157 +4,202 @@ from pathlib import Path
 import numpy as np
 import pandas as pd
 from static import *
+from data_io import data_file, common_type, write_data_chunks
+from telemetry import telemetry_job, telemetry_phase, telemetry_rows
 from ucimlrepo import fetch_ucirepo
 from sklearn.preprocessing import LabelEncoder
 from sklearn.preprocessing import StandardScaler
 
-
-def clean_data(data_set_name):
+# how each original data set is cleaned: the original file, whether an id column starting from 1 is added, columns
+# combined from other columns, label encoded columns, standard scaled columns, dropped columns and renamed columns
+CLEANING = {
+    "WeatherData": {
+        "file": "weather.csv",
+        "id": False,
+        "combine": {},
+        "encode": ['Daily_Summary', 'Summary', 'Formatted_Date'],
+        "scale": ['Temperature', 'Apparent_Temperature', 'Humidity', 'Wind_Speed', 'Wind_Bearing', 'Visibility',
+                  'Pressure'],
+        "drop": [],
+        "rename": {'Temperature': 'X', 'Apparent_Temperature': 'y'}
+    },
+    "WhoData": {
+        "file": "LifeExpData.csv",
+        "id": False,
+        "combine": {'CountryYear': ['Country', 'Year']},
+        "encode": ['CountryYear', 'Status'],
+        "scale": [],
+        "drop": ['Country', 'Year'],
+        "rename": {'CountryYear': 'X', 'Status': 'y'}
+    },
+    "CancerData2": {
+        "file": "wdbc.data",
+        "id": False,
+        "combine": {},
+        "encode": ['Diagnosis', 'user'],
+        "scale": [],
+        "drop": [],
+        "rename": {'Diagnosis': 'X', 'user': 'y'}
+    },
+    "AdultData": {
+        "file": "adult.data",
+        "id": True,
+        "combine": {},
+        "encode": ['workclass', 'marital', 'occupation', 'relationship', 'race', 'sex', 'country', 'salary'],
+        "scale": [],
+        "drop": ["education"],
+        "rename": {'occupation': 'X', 'salary': 'y'}
+    },
+    "SpamData": {
+        "file": "spambase.csv",
+        "id": True,
+        "combine": {},
+        "encode": [],
+        "scale": ["word_freq_make", "word_freq_address", "word_freq_all", "word_freq_3d", "word_freq_our",
+                  "word_freq_over", "word_freq_remove", "word_freq_internet", "word_freq_order", "word_freq_mail",
+                  "word_freq_receive", "word_freq_will", "word_freq_people", "word_freq_report",
+                  "word_freq_addresses", "word_freq_free", "word_freq_business", "word_freq_email",
+                  "word_freq_you", "word_freq_credit", "word_freq_your", "word_freq_font", "word_freq_000",
+                  "word_freq_money", "word_freq_hp", "word_freq_hpl", "word_freq_george", "word_freq_650",
+                  "word_freq_lab", "word_freq_labs", "word_freq_telnet", "word_freq_857", "word_freq_data",
+                  "word_freq_415", "word_freq_85", "word_freq_technology", "word_freq_1999", "word_freq_parts",
+                  "word_freq_pm", "word_freq_direct", "word_freq_cs", "word_freq_meeting", "word_freq_original",
+                  "word_freq_project", "word_freq_re", "word_freq_edu", "word_freq_table", "word_freq_conference",
+                  "char_freq_%3B", "char_freq_%28", "char_freq_%5B", "char_freq_%21", "char_freq_%24",
+                  "char_freq_%23", "capital_run_length_average", "capital_run_length_longest",
+                  "capital_run_length_total", "class"],
+        "drop": [],
+        "rename": {'word_freq_all': 'X', 'capital_run_length_total': 'y'}
+    },
+    # generated by benchmark.py
+    "SyntheticData": {
+        "file": "synthetic.csv",
+        "id": False,
+        "combine": {},
+        "encode": ['user'],
+        "scale": ['rating', 'noise'],
+        "drop": [],
+        "rename": {'user': 'X', 'rating': 'y'}
+    }
+}
+
+
+def add_columns(chunk, cleaning, first_row):
+    # the id continues over chunks, so it is the same as for the whole file
+    if cleaning["id"]:
+        chunk['id'] = range(first_row + 1, first_row + len(chunk) + 1)
+    for column, parts in cleaning["combine"].items():
+        chunk[column] = chunk[parts[0]].astype(str)
+        for part in parts[1:]:
+            chunk[column] = chunk[column] + '_' + chunk[part].astype(str)
+    return chunk
+
+
+def code_type(max_code):
+    # the smallest integer type that holds all codes
+    for int_type in ["int8", "int16", "int32"]:
+        if max_code <= np.iinfo(int_type).max:
+            return int_type
+    return "int64"
+
+
+@telemetry_job
+def clean_data(data_set_name, data_format=DATA_FORMAT, chunk_size=CLEAN_CHUNK_SIZE, compact_floats=0):
     # the path of the original data
     base_path_original = f"./{DATA_FOLDER}/{data_set_name}/{ORIGINAL_FOLDER}"
-
-    # load the data into a dataframe
-    if data_set_name == "WeatherData":
-        data = pd.read_csv(f"{base_path_original}/weather.csv")
-
-        # Initialize the LabelEncoder
-        le_summary = LabelEncoder()
-        le_daily_summary = LabelEncoder()
-        le_date = LabelEncoder()
-
-        # Fit and transform the categorical variables
-        data['Daily_Summary'] = le_daily_summary.fit_transform(data['Daily_Summary'])
-        data['Summary'] = le_summary.fit_transform(data['Summary'])
-        data['Formatted_Date'] = le_date.fit_transform(data['Formatted_Date'])
-
-        # Initialize the StandardScaler
-        scaler = StandardScaler()
-
-        # Select numerical columns to scale
-        numerical_cols = ['Temperature', 'Apparent_Temperature', 'Humidity', 'Wind_Speed', 'Wind_Bearing', 'Visibility', 'Pressure']
-
-        # Fit and transform the numerical features
-        data[numerical_cols] = scaler.fit_transform(data[numerical_cols])
-        data.rename(columns={
-            'Temperature': 'X',
-            'Apparent_Temperature': 'y'
-
-        }, inplace=True)
-    elif data_set_name == "WhoData":
-        data = pd.read_csv(f"{base_path_original}/LifeExpData.csv")
-
-        data['CountryYear'] = data['Country'].astype(str) + '_' + data['Year'].astype(str)
-        data = data.drop(columns=['Country', 'Year'])
-
-        # Initialize the LabelEncoder
-        le_country_year = LabelEncoder()
-        le_status = LabelEncoder()
-
-        # Fit and transform the categorical variables
-        data['CountryYear'] = le_country_year.fit_transform(data['CountryYear'])
-        data['Status'] = le_status.fit_transform(data['Status'])
-        data.rename(columns={
-            'CountryYear': 'X',
-            'Status': 'y'
-        }, inplace=True)
-        # Initialize the StandardScaler
-        scaler = StandardScaler()
-
-    elif data_set_name == "CancerData2":
-        data = pd.read_csv(f"{base_path_original}/wdbc.data")
-
-        # Initialize the LabelEncoder
-        le_diagnosis = LabelEncoder()
-        le_user = LabelEncoder()
-
-        # Fit and transform the categorical variables
-        data['Diagnosis'] = le_diagnosis.fit_transform(data['Diagnosis'])
-        data['user'] = le_user.fit_transform(data['user'])
-        data.rename(columns={
-            'Diagnosis': 'X',
-            'user': 'y'
-        }, inplace=True)
-    elif data_set_name == "AdultData":
-        data = pd.read_csv(f"{base_path_original}/adult.data")
-
-        # Add an ID column starting from 1
-        data['id'] = range(1, len(data) + 1)
-
-        # Initialize the LabelEncoder
-        le_workclass = LabelEncoder()
-        le_marital = LabelEncoder()
-        le_occupation = LabelEncoder()
-        le_relationship = LabelEncoder()
-        le_race = LabelEncoder()
-        le_sex = LabelEncoder()
-        le_country = LabelEncoder()
-        le_salary = LabelEncoder()
-
-        # Fit and transform the categorical variables
-        data['workclass'] = le_workclass.fit_transform(data['workclass'])
-        data['marital'] = le_marital.fit_transform(data['marital'])
-        data['occupation'] = le_occupation.fit_transform(data['occupation'])
-        data['relationship'] = le_relationship.fit_transform(data['relationship'])
-        data['race'] = le_race.fit_transform(data['race'])
-        data['sex'] = le_sex.fit_transform(data['sex'])
-        data['country'] = le_country.fit_transform(data['country'])
-        data['salary'] = le_salary.fit_transform(data['salary'])
-
-        data = data.drop(columns=["education"])
-        data.rename(columns={
-            'occupation': 'X',
-            'salary': 'y'
-        }, inplace=True)
-    elif data_set_name == "SpamData":
-        data = pd.read_csv(f"{base_path_original}/spambase.csv")
-
-        # Add an ID column starting from 1
-        data['id'] = range(1, len(data) + 1)
-
-        # Initialize the StandardScaler
-        scaler = StandardScaler()
-
-        numerical_cols = ["word_freq_make", "word_freq_address", "word_freq_all", "word_freq_3d", "word_freq_our",
-                          "word_freq_over", "word_freq_remove", "word_freq_internet", "word_freq_order", "word_freq_mail",
-                          "word_freq_receive", "word_freq_will", "word_freq_people", "word_freq_report",
-                          "word_freq_addresses", "word_freq_free", "word_freq_business", "word_freq_email",
-                          "word_freq_you", "word_freq_credit", "word_freq_your", "word_freq_font", "word_freq_000",
-                          "word_freq_money", "word_freq_hp", "word_freq_hpl", "word_freq_george", "word_freq_650",
-                          "word_freq_lab", "word_freq_labs", "word_freq_telnet", "word_freq_857", "word_freq_data",
-                          "word_freq_415", "word_freq_85", "word_freq_technology", "word_freq_1999", "word_freq_parts",
-                          "word_freq_pm", "word_freq_direct", "word_freq_cs", "word_freq_meeting", "word_freq_original",
-                          "word_freq_project", "word_freq_re", "word_freq_edu", "word_freq_table", "word_freq_conference",
-                          "char_freq_%3B", "char_freq_%28", "char_freq_%5B", "char_freq_%21", "char_freq_%24",
-                          "char_freq_%23", "capital_run_length_average", "capital_run_length_longest",
-                          "capital_run_length_total", "class"]
-
-        # Fit and transform the numerical features
-        data[numerical_cols] = scaler.fit_transform(data[numerical_cols])
-        data.rename(columns={
-            'word_freq_all': 'X',
-            'capital_run_length_total': 'y',
-        }, inplace=True)
-    else:
+    if data_set_name not in CLEANING:
         raise ValueError(f"Unknown data set name {data_set_name}.")
-
-    # remove duplicates
-    # data.drop_duplicates(inplace=True)
-
-    # map user and item to integers if they exist
-    if "X" in data.columns and "Y" in data.columns:
-        for col in ["X", "Y"]:
-            unique_ids = {key: value for value, key in enumerate(data[col].unique())}
-            data[col].update(data[col].map(unique_ids))
+    cleaning = CLEANING[data_set_name]
+    original_path = f"{base_path_original}/{cleaning['file']}"
+    rename_back = {value: key for key, value in cleaning["rename"].items()}
+
+    # the original file is read in chunks twice, so memory is bounded by the chunk size and the category vocabularies
+    # first pass: collect the column types, the categories of the label encoded columns, the running mean and variance
+    # of the scaled columns, and the order of appearance of user and item if they exist
+    types = {}
+    categories = {}
+    scaler = StandardScaler()
+    unique_ids = {}
+    num_rows = 0
+    with telemetry_phase("load"), pd.read_csv(original_path, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            num_rows += len(chunk)
+            if len(types) == 0:
+                columns = list(chunk.columns) + ['id'] * cleaning["id"] + list(cleaning["combine"].keys())
+                columns = [cleaning["rename"].get(column, column) for column in columns if
+                           column not in cleaning["drop"]]
+                if "X" in columns and "Y" in columns:
+                    unique_ids = {rename_back.get(col, col): {} for col in ["X", "Y"]}
+            for column, column_type in chunk.dtypes.items():
+                types.setdefault(column, []).append(column_type)
+            # combined columns are built after the pass, once the types of their parts are known
+            for column in cleaning["encode"]:
+                parts = cleaning["combine"].get(column, [column])
+                categories.setdefault(column, set()).update(chunk[parts].drop_duplicates().itertuples(
+                    index=False, name=None))
+            if len(cleaning["scale"]) > 0:
+                scaler.partial_fit(chunk[cleaning["scale"]])
+            # encoding and scaling are one-to-one, so the order of appearance of the original values gives the ids
+            for col, ids in unique_ids.items():
+                for key in chunk[col].unique():
+                    ids.setdefault(key, len(ids))
+    telemetry_rows("load", num_rows)
+    types = {column: common_type(column_types) for column, column_types in types.items()}
+
+    # Initialize the LabelEncoders on all categories, which gives the same encoding as fitting on the whole column
+    encoders = {}
+    with telemetry_phase("compute"):
+        for column, values in categories.items():
+            parts = cleaning["combine"].get(column, [column])
+            values = pd.DataFrame(list(values), columns=parts).astype({part: types[part] for part in parts})
+            values = add_columns(values, {"id": False, "combine": {column: parts} if column in cleaning["combine"]
+                                          else {}}, 0)
+            encoders[column] = LabelEncoder().fit(values[column])
+
+    # the compact column types of the cleaned data, which the later stages read it with: integer codes as small as
+    # their number of categories allows, which is lossless, and scaled features as float64, as pruning compares every
+    # column and rounding them changes which rows are outliers, with compact floats the scaled features other than
+    # the model columns X and y are stored as float32
+    schema = {column: code_type(len(encoder.classes_) - 1) for column, encoder in encoders.items()}
+    schema.update({column: "float32" if bool(compact_floats) and cleaning["rename"].get(column, column) not in
+                   MODEL_COLUMNS else "float64" for column in cleaning["scale"]})
+    schema.update({col: code_type(len(ids) - 1) for col, ids in unique_ids.items()})
+    if cleaning["id"]:
+        schema['id'] = code_type(num_rows)
+    schema = {cleaning["rename"].get(column, column): column_type for column, column_type in schema.items()
+              if column not in cleaning["drop"]}
+
+    # second pass: map, encode and scale every chunk and write it to file before the next chunk is read
+    def cleaned_chunks():
+        first_row = 0
+        with pd.read_csv(original_path, chunksize=chunk_size, dtype=types) as chunk_reader:
+            for data in chunk_reader:
+                data = add_columns(data, cleaning, first_row)
+                first_row += len(data)
+                mapped = {col: data[col].map(ids) for col, ids in unique_ids.items()}
+                for column, encoder in encoders.items():
+                    data[column] = encoder.transform(data[column])
+                if len(cleaning["scale"]) > 0:
+                    data[cleaning["scale"]] = scaler.transform(data[cleaning["scale"]])
+                for col, ids in mapped.items():
+                    data[col] = ids
+                data = data.drop(columns=cleaning["drop"])
+                data.rename(columns=cleaning["rename"], inplace=True)
+                yield data.astype(schema)
+
+    # write data to file, the second pass reads, encodes and writes chunk by chunk, so all of it is the save phase
+    base_path_cleaned = f"./{DATA_FOLDER}/{data_set_name}/{CLEAN_FOLDER}"
+    Path(base_path_cleaned).mkdir(exist_ok=True)
+    with telemetry_phase("save"):
+        write_data_chunks(cleaned_chunks(), f"{base_path_cleaned}/{data_file(CLEAN_FILE, data_format)}",
+                          data_format)
+        with open(f"{base_path_cleaned}/{SCHEMA_FILE}", 'w') as f:
+            json.dump(schema, f, indent=2)
+    telemetry_rows("save", num_rows)
+    if len(unique_ids) > 0:
         print("Dropped duplicates and mapped user and item to integers.")
     else:
         print("Dropped duplicates.")
-
-    print("Dropped duplicates and mapped user and item to integers.")
-
-    # write data to file
-    base_path_cleaned = f"./{DATA_FOLDER}/{data_set_name}/{CLEAN_FOLDER}"
-    Path(base_path_cleaned).mkdir(exist_ok=True)
-    data.to_csv(f"{base_path_cleaned}/{CLEAN_FILE}", index=False)
     print(f"Written cleaned data set to file.")
 
     return
@@ -163,7 +208,10 @@ def clean_data(data_set_name):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("Random Seed Effects clean data!")
     parser.add_argument('--data_set_name', dest='data_set_name', type=str, required=True)
+    parser.add_argument('--data_format', dest='data_format', type=str, default=DATA_FORMAT)
+    parser.add_argument('--chunk_size', dest='chunk_size', type=int, default=CLEAN_CHUNK_SIZE)
+    parser.add_argument('--compact_floats', dest='compact_floats', type=int, default=0)
     args = parser.parse_args()
 
     print("Pruning original with arguments: ", args.__dict__)
-    clean_data(args.data_set_name)
+    clean_data(args.data_set_name, args.data_format, args.chunk_size, args.compact_floats)
@@ -0,0 +1,147 @@
+import json
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from static import *
+
+
+def data_file(file_name, data_format):
+    # replace the extension of a data file name from static.py with the one of the data format
+    if data_format not in DATA_FORMATS:
+        raise ValueError(f"Data format {data_format} not recognized.")
+    return f"{Path(file_name).stem}.{data_format}"
+
+
+def split_path(data_set_name, prune_technique, split_technique, fold, shuffle_seed):
+    # a split file holds the row positions of a fold in the split base of its pruned data
+    return f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}/" \
+           f"{fold}_{shuffle_seed}_{prune_technique}_{split_technique}_{SPLIT_FILE}"
+
+
+def split_base_path(data_set_name, prune_technique):
+    return f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}/{prune_technique}_{SPLIT_BASE_FILE}"
+
+
+def write_split_base(data, path):
+    # the pruned data as an uncompressed arrow file, which is memory-mapped instead of read, written under a temporary
+    # name first, so concurrent split jobs never read a partial file
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(temporary_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temporary_path, path)
+
+
+def read_split(data_set_name, prune_technique, split_technique, folds, shuffle_seed):
+    # the rows of the folds in fold order, taken from the memory-mapped split base, so only these rows are copied
+    base = pa.ipc.open_file(pa.memory_map(split_base_path(data_set_name, prune_technique))).read_all()
+    positions = np.concatenate([np.load(split_path(data_set_name, prune_technique, split_technique, fold,
+                                                   shuffle_seed)) for fold in folds])
+    return base.take(positions).to_pandas()
+
+
+def data_schema(data_set_name):
+    # the compact column types written by clean_data, data cleaned without a schema keeps the inferred types
+    schema_path = Path(f"./{DATA_FOLDER}/{data_set_name}/{CLEAN_FOLDER}/{SCHEMA_FILE}")
+    if not schema_path.exists():
+        return {}
+    return json.loads(schema_path.read_text())
+
+
+def read_data(path, data_format, schema=None):
+    # parquet and feather keep the column types, so no re-parsing of text is required
+    if data_format == "csv":
+        data = pd.read_csv(path, header=0, sep=",", dtype=schema)
+    elif data_format == "parquet":
+        data = pd.read_parquet(path)
+    elif data_format == "feather":
+        data = pd.read_feather(path)
+    else:
+        raise ValueError(f"Data format {data_format} not recognized.")
+    # binary files written before the schema existed are converted after reading
+    if schema is not None and data_format != "csv":
+        data = data.astype({column: column_type for column, column_type in schema.items()
+                            if column in data.columns and data[column].dtype != column_type})
+    return data
+
+
+def write_data(data, path, data_format):
+    if data_format == "csv":
+        data.to_csv(path, index=False)
+    elif data_format == "parquet":
+        data.to_parquet(path, index=False)
+    elif data_format == "feather":
+        data.reset_index(drop=True).to_feather(path)
+    else:
+        raise ValueError(f"Data format {data_format} not recognized.")
+
+
+def common_type(types):
+    # the type a column gets when the whole file is read at once, e.g. a float column without decimals in one chunk
+    if all(pd.api.types.is_numeric_dtype(column_type) for column_type in types):
+        return np.result_type(*types)
+    return object
+
+
+def read_data_chunks(path, data_format, chunk_size, schema=None):
+    # read a data file as data frames of at most chunk size rows, so only one chunk has to be in memory
+    if data_format == "csv":
+        with pd.read_csv(path, header=0, sep=",", dtype=schema, chunksize=chunk_size) as reader:
+            for chunk in reader:
+                yield chunk
+        return
+    if data_format == "parquet":
+        batches = pq.ParquetFile(path).iter_batches(batch_size=chunk_size)
+    elif data_format == "feather":
+        reader = pa.ipc.open_file(pa.memory_map(path))
+        batches = (reader.get_batch(batch_index) for batch_index in range(reader.num_record_batches))
+    else:
+        raise ValueError(f"Data format {data_format} not recognized.")
+    for batch in batches:
+        for offset in range(0, batch.num_rows, chunk_size):
+            chunk = batch.slice(offset, chunk_size).to_pandas()
+            if schema is not None:
+                chunk = chunk.astype({column: column_type for column, column_type in schema.items()
+                                      if column in chunk.columns and chunk[column].dtype != column_type})
+            yield chunk
+
+
+def open_data_writer(path, data_format):
+    # a writer appends data frames one after another to a single file
+    if data_format not in DATA_FORMATS:
+        raise ValueError(f"Data format {data_format} not recognized.")
+    return {"path": path, "data_format": data_format, "num_chunks": 0, "writer": None, "schema": None}
+
+
+def write_data_chunk(writer, chunk):
+    if writer["data_format"] == "csv":
+        chunk.to_csv(writer["path"], index=False, header=writer["num_chunks"] == 0,
+                     mode='w' if writer["num_chunks"] == 0 else 'a')
+    else:
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer["writer"] is None:
+            writer["schema"] = table.schema
+            if writer["data_format"] == "parquet":
+                writer["writer"] = pq.ParquetWriter(writer["path"], table.schema)
+            else:
+                writer["writer"] = pa.ipc.new_file(writer["path"], table.schema,
+                                                   options=pa.ipc.IpcWriteOptions(compression="lz4"))
+        writer["writer"].write_table(table.cast(writer["schema"]))
+    writer["num_chunks"] += 1
+
+
+def close_data_writer(writer):
+    if writer["writer"] is not None:
+        writer["writer"].close()
+
+
+def write_data_chunks(chunks, path, data_format):
+    # write data frames one after another into a single file, so only one chunk has to be in memory
+    writer = open_data_writer(path, data_format)
+    for chunk in chunks:
+        write_data_chunk(writer, chunk)
+    close_data_writer(writer)
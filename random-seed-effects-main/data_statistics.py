@@ -2,15 +2,18 @@ import json
 import pandas as pd
 from select_experiment import file
 from static import *
+from data_io import data_file, data_schema, read_data
 
 experiment_settings = json.load(open(f"./experiment_{file}.json"))
+data_format = experiment_settings.get("DATA_FORMAT", DATA_FORMAT)
 
 info_df = pd.DataFrame(
     columns=["#Interactions", "#Users", "#Items", "Avg.#Int. per user",
              "Avg.#Int. per item", "Sparsity"])
 
 for data_set in experiment_settings["DATA_SET_NAMES"]:
-    data = pd.read_csv(f"./{DATA_FOLDER}/{data_set}/{PRUNE_FOLDER}/{PRUNE_FILE}", sep=",", header=0)
+    data = read_data(f"./{DATA_FOLDER}/{data_set}/{PRUNE_FOLDER}/{data_file(PRUNE_FILE, data_format)}", data_format,
+                     data_schema(data_set))
     users = data["user"].unique()
     items = data["item"].unique()
     interactions = data[["user", "item"]].values
@@ -6,65 +6,108 @@ import pandas as pd
 import pickle as pkl
 
 from static import *
+from data_io import read_split
+from artifact_catalog import register_artifact
+from telemetry import telemetry_job, telemetry_phase, telemetry_rows
 
 
-def evaluate_predictions(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel,
-                         ML_seed, num_batches, topn_scores):
-    # get test data
-    test_data = pd.read_csv(
-        f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}/"
-        f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_{SPLIT_FILE}", header=0, sep=",")
+def group_user_positions(test_data):
+    # map every user to the ascending row positions of its test interactions
+    return test_data.groupby("X", sort=False).indices
 
-    evaluation_data = {}
-    for run_batch in range(num_batches):
-        # get predictions
-        predictions = pkl.load(open(
-            f"./{DATA_FOLDER}/{data_set_name}/"
-            f"{PREDICTION_FOLDER}_{MLModel}/{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_"
-            f"{ML_seed}_{num_batches}_{run_batch}_{PREDICTION_FILE}", "rb"))
-        if run_batch not in evaluation_data:
-            evaluation_data[run_batch] = {}
+
+def evaluate_batch(predictions, user_positions, num_test_rows, topn_scores):
+    # compute MAE and RMSE for all cutoffs at once from prefix sums over the top predictions
+    topn_scores = [int(topn_score) for topn_score in topn_scores]
+    max_topn_score = max(topn_scores)
+    no_positions = np.empty(0, dtype=np.int64)
+    mae_per_user = {topn_score: [] for topn_score in topn_scores}
+    mse_per_user = {topn_score: [] for topn_score in topn_scores}
+    prefix_sums = {}
+    for user, user_predictions in predictions.items():
+        # users of a batch usually share one prediction array, its prefix sums are computed only once
+        if id(user_predictions) not in prefix_sums:
+            top_predictions = np.array(user_predictions[:max_topn_score], dtype=float)
+            prefix_sums[id(user_predictions)] = (top_predictions, np.cumsum(np.abs(top_predictions)),
+                                                 np.cumsum(top_predictions ** 2))
+        top_predictions, abs_prefix, squared_prefix = prefix_sums[id(user_predictions)]
+
+        # the true value is 1 at the rows of the user and 0 everywhere else, so the errors against a zero vector
+        # only have to be corrected at the positions of the user
+        positions = user_positions.get(user, no_positions)
+        positions = positions[:np.searchsorted(positions, len(top_predictions))]
+        hits = top_predictions[positions]
+        abs_correction = np.concatenate(([0.0], np.cumsum(np.abs(hits - 1) - np.abs(hits))))
+        squared_correction = np.concatenate(([0.0], np.cumsum(1 - 2 * hits)))
 
         for topn_score in topn_scores:
-            topn_score = int(topn_score)
-            # calculate MAE and MSE
-            mae_per_user = []
-            mse_per_user = []
-            for user, user_predictions in predictions.items():
-                if user_predictions.shape[0] < topn_score:
-                    mae_per_user.append(0)
-                    mse_per_user.append(0)
-                    continue
-                top_k_predictions = np.array(user_predictions[:topn_score], dtype=float)
-                positive_test_interactions = test_data["X"] == user
-                positive_test_interactions = np.where(positive_test_interactions == 'No Data', np.nan, positive_test_interactions).astype(float)
-                positive_test_interactions = np.nan_to_num(positive_test_interactions, nan=0.0)
-                if len(positive_test_interactions) == 0:
-                    continue
-                true_values = np.array(positive_test_interactions[:topn_score], dtype=float)
-                predicted_values = top_k_predictions[:topn_score]
-                user_mae = np.mean(np.abs(predicted_values - true_values))
-                user_mse = np.mean((predicted_values - true_values) ** 2)
-                print(user_mse)
-                mae_per_user.append(user_mae)
-                mse_per_user.append(user_mse)
-            total_mae = np.mean(mae_per_user)
-            total_rmse = math.sqrt(np.mean(mse_per_user))
-            evaluation_data[run_batch][topn_score] = {"mae": total_mae, "rmse": total_rmse}
+            if user_predictions.shape[0] < topn_score:
+                mae_per_user[topn_score].append(0)
+                mse_per_user[topn_score].append(0)
+                continue
+            if num_test_rows == 0:
+                continue
+            num_hits = np.searchsorted(positions, topn_score)
+            user_mae = (abs_prefix[topn_score - 1] + abs_correction[num_hits]) / topn_score
+            user_mse = max((squared_prefix[topn_score - 1] + squared_correction[num_hits]) / topn_score, 0.0)
+            mae_per_user[topn_score].append(user_mae)
+            mse_per_user[topn_score].append(user_mse)
+
+    batch_evaluation = {}
+    for topn_score in topn_scores:
+        total_mae = np.mean(mae_per_user[topn_score])
+        total_rmse = math.sqrt(np.mean(mse_per_user[topn_score]))
+        batch_evaluation[topn_score] = {"mae": total_mae, "rmse": total_rmse}
+    return batch_evaluation
 
+
+def save_evaluation(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                    num_batches, topn_scores, evaluation_data):
     # save results
     base_path_evaluations = f"./{DATA_FOLDER}/{data_set_name}/{EVALUATION_FOLDER}_{MLModel}"
     Path(base_path_evaluations).mkdir(parents=True, exist_ok=True)
     topn_scores_string = '-'.join([str(x) for x in topn_scores])
-    with open(f"{base_path_evaluations}/"
-              f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_"
-              f"{ML_seed}_{num_batches}_{topn_scores_string}_{EVALUATION_FILE}", "wb") as f:
+    evaluation_file_path = f"{base_path_evaluations}/" \
+                           f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_" \
+                           f"{ML_seed}_{num_batches}_{topn_scores_string}_{EVALUATION_FILE}"
+    with open(evaluation_file_path, "wb") as f:
         pkl.dump(evaluation_data, f)
+    register_artifact("evaluations", evaluation_file_path, data_set_name, prune_technique, split_technique, test_fold,
+                      shuffle_seed, MLModel, ML_seed, num_batches, topn_scores_string)
     print(f"Evaluated predictions and saved results.")
 
     return
 
 
+@telemetry_job
+def evaluate_predictions(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel,
+                         ML_seed, num_batches, topn_scores):
+    # get test data
+    with telemetry_phase("load"):
+        test_data = read_split(data_set_name, prune_technique, split_technique, [test_fold], shuffle_seed)
+    telemetry_rows("load", len(test_data))
+    with telemetry_phase("compute"):
+        user_positions = group_user_positions(test_data)
+
+    evaluation_data = {}
+    for run_batch in range(num_batches):
+        # get predictions
+        with telemetry_phase("load"):
+            predictions = pkl.load(open(
+                f"./{DATA_FOLDER}/{data_set_name}/"
+                f"{PREDICTION_FOLDER}_{MLModel}/{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_"
+                f"{ML_seed}_{num_batches}_{run_batch}_{PREDICTION_FILE}", "rb"))
+        with telemetry_phase("compute"):
+            evaluation_data[run_batch] = evaluate_batch(predictions, user_positions, len(test_data), topn_scores)
+    telemetry_rows("compute", len(test_data))
+
+    with telemetry_phase("save"):
+        save_evaluation(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                        num_batches, topn_scores, evaluation_data)
+
+    return
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("Random Seed Effects evaluate predictions!")
     parser.add_argument('--data_set_name', dest='data_set_name', type=str, required=True)
@@ -1,62 +1,148 @@
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import pandas as pd
 from static import *
+from stage_runner import resolve_num_workers
+from artifact_catalog import connect_catalog, catalog_shuffle_seeds, catalog_artifacts
 import pickle as pkl
 
+# one row per evaluated cutoff, the identifying columns are categorical and the counters small integers
+REPORT_COLUMNS = {"data_set_name": "category", "prune_technique": "category", "split_technique": "category",
+                  "recommender": "category", "recommender_seed": "category", "shuffle_seed": "category",
+                  "test_fold": "int16", "run_batch": "int16", "topn_score": "int16", "mae": "float64",
+                  "rmse": "float64"}
+
+
+def report_rows(data_set_name, prune_technique, split_technique, MLModel, ML_seed, shuffle_seed, test_fold,
+                evaluation_data):
+    return [(data_set_name, prune_technique, split_technique, MLModel, ML_seed, shuffle_seed, test_fold, run_batch,
+             int(topn_score), scores["mae"], scores["rmse"])
+            for run_batch, batch_evaluation in evaluation_data.items()
+            for topn_score, scores in batch_evaluation.items()]
+
+
+def report_table(rows):
+    return pd.DataFrame(rows, columns=list(REPORT_COLUMNS.keys())).astype(REPORT_COLUMNS)
+
+
+def load_evaluation_report(columns=None, filters=None, report_file=EVALUATION_REPORT_FILE):
+    # read only the requested columns and the row groups of all parts matching the filters, e.g.
+    # filters=[("recommender", "==", "knn"), ("topn_score", "in", [1, 5, 10])]
+    if Path(report_file).is_dir() and not any(part.startswith("part-") for part in os.listdir(report_file)):
+        # a report without evaluations is an empty folder, which is read as an empty table of the report columns
+        report = report_table([])
+        return report[columns] if columns is not None else report
+    return pd.read_parquet(report_file, columns=columns, filters=filters)
+
+
+def remove_report():
+    if Path(EVALUATION_REPORT_FILE).is_dir():
+        shutil.rmtree(EVALUATION_REPORT_FILE)
+    else:
+        Path(EVALUATION_REPORT_FILE).unlink(missing_ok=True)
+    Path(EVALUATION_MANIFEST_FILE).unlink(missing_ok=True)
+
+
+def drop_report_rows(part, stale_keys):
+    # a part is rewritten without the rows of the given evaluation keys, an emptied part is removed
+    part_path = f"{EVALUATION_REPORT_FILE}/{part}"
+    report = pd.read_parquet(part_path)
+    part_keys = pd.MultiIndex.from_frame(report[list(REPORT_COLUMNS.keys())[:7]].astype(str))
+    report = report[~part_keys.isin(list(stale_keys))]
+    if len(report) == 0:
+        Path(part_path).unlink()
+    else:
+        # parts starting with a dot are not read as part of the report
+        report.to_parquet(f"{EVALUATION_REPORT_FILE}/.{part}", index=False)
+        os.replace(f"{EVALUATION_REPORT_FILE}/.{part}", part_path)
+
+
+def read_evaluation(key, path):
+    return key, report_rows(*key, pkl.load(open(path, "rb")))
+
 
 def evaluation_report(data_set_names, prune_techniques, split_techniques, num_folds, MLModels, ML_seeding,
-                      num_batches, topn_scores):
+                      num_batches, topn_scores, num_workers=0):
     topn_scores_string = '-'.join([str(x) for x in topn_scores])
     topn_scores_string_full = '-'.join([str(x) for x in [1, 2, 3, 4, 5, 8, 10, 15, 20]])
-    report_dict = {}
 
+    # find the evaluation file of every fold in report order with one catalog lookup per data set, pruning and split
+    connection = connect_catalog()
+    evaluation_files = []
     for data_set_name in data_set_names:
         for prune_technique in prune_techniques:
             for split_technique in split_techniques:
-                shuffle_seeds = []
-                for file in Path(f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}").iterdir():
-                    _, file_seed, file_prune_technique, file_split_technique, _ = file.name.split(".")[0].split("_")
-                    if file_prune_technique == prune_technique and file_split_technique == split_technique:
-                        shuffle_seeds.append(file_seed)
+                shuffle_seeds = catalog_shuffle_seeds(connection, data_set_name, prune_technique, split_technique)
+                existing_evaluations = catalog_artifacts(connection, "evaluations", data_set_name, prune_technique,
+                                                         split_technique)
 
                 for MLModel in MLModels:
+                    base_path_evaluations = f"./{DATA_FOLDER}/{data_set_name}/{EVALUATION_FOLDER}_{MLModel}"
                     for shuffle_seed in shuffle_seeds:
                         for ML_seed in ML_seeding:
                             for test_fold in range(num_folds):
-                                short_path = f"./{DATA_FOLDER}/{data_set_name}/{EVALUATION_FOLDER}_{MLModel}/" \
-                                             f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_" \
-                                             f"{ML_seed}_{num_batches}_{topn_scores_string}_" \
-                                             f"{EVALUATION_FILE}"
-                                long_path = f"./{DATA_FOLDER}/{data_set_name}/{EVALUATION_FOLDER}_{MLModel}/" \
-                                            f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_" \
-                                            f"{ML_seed}_{num_batches}_{topn_scores_string_full}_" \
-                                            f"{EVALUATION_FILE}"
-
-                                if Path(short_path).exists():
-                                    evaluation_data = pkl.load(open(short_path, "rb"))
-                                elif Path(long_path).exists():
-                                    evaluation_data = pkl.load(open(long_path, "rb"))
+                                file_prefix = f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_" \
+                                              f"{ML_seed}_{num_batches}"
+                                short_file = f"{file_prefix}_{topn_scores_string}_{EVALUATION_FILE}"
+                                long_file = f"{file_prefix}_{topn_scores_string_full}_{EVALUATION_FILE}"
+
+                                evaluation_key = (test_fold, shuffle_seed, MLModel, ML_seed, num_batches)
+                                if evaluation_key + (topn_scores_string,) in existing_evaluations:
+                                    file_name = short_file
+                                elif evaluation_key + (topn_scores_string_full,) in existing_evaluations:
+                                    file_name = long_file
                                 else:
-                                    print(f"File {short_path} or {long_path} does not exist.")
+                                    print(f"File {base_path_evaluations}/{short_file} or "
+                                          f"{base_path_evaluations}/{long_file} does not exist.")
                                     continue
-                                if data_set_name not in report_dict:
-                                    report_dict[data_set_name] = {}
-                                if prune_technique not in report_dict[data_set_name]:
-                                    report_dict[data_set_name][prune_technique] = {}
-                                if split_technique not in report_dict[data_set_name][prune_technique]:
-                                    report_dict[data_set_name][prune_technique][split_technique] = {}
-                                if MLModel not in report_dict[data_set_name][prune_technique][split_technique]:
-                                    report_dict[data_set_name][prune_technique][split_technique][MLModel] = {}
-                                if ML_seed not in report_dict[data_set_name][prune_technique][split_technique][MLModel]:
-                                    report_dict[data_set_name][prune_technique][split_technique][MLModel][ML_seed] = {}
-                                if shuffle_seed not in report_dict[data_set_name][prune_technique][split_technique][MLModel][ML_seed]:
-                                    report_dict[data_set_name][prune_technique][split_technique][MLModel][ML_seed][shuffle_seed] = {}
-                                if test_fold not in report_dict[data_set_name][prune_technique][split_technique][MLModel][ML_seed][shuffle_seed]:
-                                    report_dict[data_set_name][prune_technique][split_technique][MLModel][ML_seed][shuffle_seed][test_fold] = {}
-
-                                report_dict[data_set_name][prune_technique][split_technique][MLModel][ML_seed][shuffle_seed][test_fold] = evaluation_data
-
-    with open(f"evaluation_report.pkl", "wb") as file:
-        pkl.dump(report_dict, file)
+                                key = (data_set_name, prune_technique, split_technique, MLModel, ML_seed,
+                                       shuffle_seed, test_fold)
+                                evaluation_files.append((key, f"{base_path_evaluations}/{file_name}"))
+    connection.close()
+
+    # the report is a folder of parquet parts and the manifest remembers size, modification time and part of every
+    # evaluation file in it, a report of a single file without a manifest is rebuilt
+    manifest = {}
+    if Path(EVALUATION_REPORT_FILE).is_file() or not Path(EVALUATION_MANIFEST_FILE).exists():
+        remove_report()
+    else:
+        manifest = json.load(open(EVALUATION_MANIFEST_FILE))
+    current_paths = {path for _, path in evaluation_files}
+    changed_files = []
+    for key, path in evaluation_files:
+        stat = os.stat(path)
+        if manifest.get(path, [None, None])[:2] != [stat.st_size, stat.st_mtime_ns]:
+            changed_files.append((key, path))
+    stale_paths = [path for path in manifest if path not in current_paths] + \
+                  [path for _, path in changed_files if path in manifest]
+
+    # only new and changed evaluation files are read, their rows are appended as a new part
+    print(f"Reading {len(changed_files)} new or changed of {len(evaluation_files)} evaluation files.")
+    Path(EVALUATION_REPORT_FILE).mkdir(exist_ok=True)
+    part_numbers = [int(part[5:-8]) for part in os.listdir(EVALUATION_REPORT_FILE) if part.startswith("part-")]
+    new_part = f"part-{max(part_numbers + [-1]) + 1:05d}.parquet"
+    with ThreadPoolExecutor(max_workers=resolve_num_workers(num_workers)) as executor:
+        rows = [row for _, file_rows in executor.map(lambda evaluation_file: read_evaluation(*evaluation_file),
+                                                     changed_files) for row in file_rows]
+    if len(rows) > 0:
+        report_table(rows).to_parquet(f"{EVALUATION_REPORT_FILE}/{new_part}", index=False)
+
+    # the rows of changed and removed evaluation files are dropped from the parts that hold them
+    stale_keys_by_part = {}
+    for path in stale_paths:
+        size, mtime, part, key = manifest.pop(path)
+        stale_keys_by_part.setdefault(part, set()).add(tuple(str(value) for value in key))
+    for part, stale_keys in stale_keys_by_part.items():
+        drop_report_rows(part, stale_keys)
+    for key, path in changed_files:
+        stat = os.stat(path)
+        manifest[path] = [stat.st_size, stat.st_mtime_ns, new_part, key]
+    with open(EVALUATION_MANIFEST_FILE, "w") as file:
+        json.dump(manifest, file)
+    print(f"Appended {len(rows)} rows and dropped the stale rows of {len(stale_paths)} evaluation files.")
     print("Evaluation report saved.")
 
     return
@@ -1,38 +1,65 @@
 import argparse
+import functools
 from pathlib import Path
 import binpickle
 import numpy as np
 import pandas as pd
 from static import *
+from data_io import read_split, split_path, split_base_path
+from artifact_cache import parse_size, connect_cache, artifact_key, fetch_artifact, store_artifact, stage_code_files
+from artifact_catalog import register_artifact
+from telemetry import telemetry_job, telemetry_phase, telemetry_rows
 import os
 from sklearn.model_selection import train_test_split
 from sklearn.tree import DecisionTreeRegressor
 from sklearn.neighbors import KNeighborsRegressor
 from sklearn.linear_model import LinearRegression
+import ml_engines
 import joblib
 
 
-def fit_ML(data_set_name, prune_technique, split_technique, num_folds, test_fold, shuffle_seed, MLModel,
-           ML_seed, reproducibility_seed):
+# models that are fitted for all test folds at once from statistics of every fold
+FOLD_STATISTICS_MODELS = ["linear_regression"]
+
+
+def load_train_data(data_set_name, prune_technique, split_technique, num_folds, test_fold, shuffle_seed):
     # get train data
     train_folds = [x for x in range(num_folds) if x != test_fold]
-    train_data_dfs = []
-    for train_fold in train_folds:
-        train_data_dfs.append(
-            pd.read_csv(f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}/"
-                        f"{train_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_{SPLIT_FILE}",
-                        header=0, sep=",", skiprows=0))
-    train_data = pd.concat(train_data_dfs, ignore_index=True)
-    for column in train_data.columns:
-        if train_data[column].dtype == 'object':
-            print(f"Column '{column}' contains non-numeric data. Attempting to clean it.")
-            train_data[column] = pd.to_numeric(train_data[column], errors='coerce')
-
-    # Drop rows with NaN values that were created by coercing non-numeric data
-    train_data.dropna(inplace=True)
+    train_data = load_fold_data(data_set_name, prune_technique, split_technique, train_folds, shuffle_seed)
     print(train_data.head())
+    return train_data
+
+
+def load_fold_data(data_set_name, prune_technique, split_technique, folds, shuffle_seed):
+    # splits are read from the typed split base, whatever the data format of the cleaned and pruned files
+    train_data = read_split(data_set_name, prune_technique, split_technique, folds, shuffle_seed)
+    train_data.dropna(inplace=True)
+    return train_data
+
+
+def expand_ML_seeding(ML_seeding, ML_seed_count):
+    # with a seed count, the "random" seeding becomes the seed sweep "random-0", "random-1", ...
+    if int(ML_seed_count) <= 0:
+        return list(ML_seeding)
+    expanded_seeding = []
+    for ML_seed in ML_seeding:
+        if ML_seed == "random":
+            expanded_seeding += [f"random-{seed_index}" for seed_index in range(int(ML_seed_count))]
+        else:
+            expanded_seeding.append(ML_seed)
+    return expanded_seeding
+
+
+def reproducibility_key(test_fold, ML_seed):
+    # seeds of a seed sweep are stored per fold and seed index in the project seed file
+    if ML_seed.startswith("random-"):
+        return f"{test_fold}-{ML_seed.split('-')[1]}"
+    return str(test_fold)
+
+
+def resolve_ML_seed(ML_seed, reproducibility_seed):
     # obtain seed for MLModel
-    if ML_seed == "random":
+    if ML_seed == "random" or ML_seed.startswith("random-"):
         if reproducibility_seed == -1:
             ML_seed_actual = np.random.randint(0, np.iinfo(np.int32).max)
         else:
@@ -41,16 +68,10 @@ def fit_ML(data_set_name, prune_technique, split_technique, num_folds, test_fold
         ML_seed_actual = 42
     else:
         raise ValueError("ML seeding method not recognized.")
+    return ML_seed_actual
 
-    # select the recommender
-    if MLModel == "decision_tree":
-        ML_alg = DecisionTreeRegressor(random_state=ML_seed_actual)
-    elif MLModel == "knn":
-        ML_alg = KNeighborsRegressor()
-    elif MLModel == "linear_regression":
-        ML_alg = LinearRegression()
-    else:
-        raise ValueError("ML Model not supported!")
+
+def train_ML(train_data, MLModel, ML_seed_actual):
     # todo
     if 'X' in train_data.columns and 'y' in train_data.columns:
         X = train_data['X'].values.reshape(-1, 1)
@@ -58,37 +79,269 @@ def fit_ML(data_set_name, prune_technique, split_technique, num_folds, test_fold
     else:
         raise ValueError("Required columns 'x' and 'y' are not in the dataset.")
 
+    # select the recommender, a single feature is fitted by the one dimensional engines, which give the same models
+    # as sklearn, a tree on a single feature does not depend on its seed
+    single_feature = X.shape[1] == 1
+    if MLModel == "decision_tree":
+        ML_alg = ml_engines.SortedTreeRegressor() if single_feature else DecisionTreeRegressor(
+            random_state=ML_seed_actual)
+    elif MLModel == "knn":
+        ML_alg = ml_engines.SortedKNNRegressor() if single_feature else KNeighborsRegressor()
+    elif MLModel == "linear_regression":
+        ML_alg = ml_engines.ClosedFormLinearRegression() if single_feature else LinearRegression()
+    else:
+        raise ValueError("ML Model not supported!")
+
     # fit machine learning model
     ML_alg.fit(X, y)
+    return ML_alg
+
 
-    # save machine learning model to file
+def ML_path(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed):
+    return f"./{DATA_FOLDER}/{data_set_name}/{ML_FOLDER}_{MLModel}/" \
+           f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_{ML_seed}_{ML_FILE}"
+
+
+def save_ML_seed(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                 ML_seed_actual):
     base_path_ML = f"./{DATA_FOLDER}/{data_set_name}/{ML_FOLDER}_{MLModel}"
     Path(base_path_ML).mkdir(exist_ok=True)
-    binpickle.dump(ML_alg, f"{base_path_ML}/"
-                   f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_"
-                   f"{ML_seed}_{ML_FILE}")
     with open(f"{base_path_ML}/"
               f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_"
               f"{ML_seed}_{ML_SEED_FILE}", "w") as f:
         f.write(f"{ML_seed_actual}")
+
+
+def save_ML(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed, ML_alg):
+    # save machine learning model to file, uncompressed and page aligned so that its arrays can be memory-mapped
+    base_path_ML = f"./{DATA_FOLDER}/{data_set_name}/{ML_FOLDER}_{MLModel}"
+    Path(base_path_ML).mkdir(exist_ok=True)
+    binpickle.dump(ML_alg, ML_path(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed,
+                                   MLModel, ML_seed), mappable=True)
+    register_artifact("ml", ML_path(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel,
+                                    ML_seed), data_set_name, prune_technique, split_technique, test_fold, shuffle_seed,
+                      MLModel, ML_seed)
+
+
+def ML_cache_key(connection, stage, data_set_name, prune_technique, split_technique, num_folds, test_fold,
+                 shuffle_seed, MLModel, ML_seed_actual):
+    # a model is identified by its training folds, its model type and, for the decision tree only, its seed
+    train_paths = [split_base_path(data_set_name, prune_technique)] + [
+        split_path(data_set_name, prune_technique, split_technique, train_fold, shuffle_seed)
+        for train_fold in range(num_folds) if train_fold != test_fold]
+    parameters = {"MLModel": MLModel, "ML_seed": ML_seed_actual if MLModel == "decision_tree" else None}
+    return artifact_key(connection, stage, parameters, train_paths, stage_code_files(__file__))
+
+
+def fetch_cached_ML(connection, cache_key, data_set_name, prune_technique, split_technique, test_fold, shuffle_seed,
+                    MLModel, ML_seed, ML_seed_actual):
+    # place a cached model with its seed file, returns whether the model was in the cache
+    if not fetch_artifact(connection, cache_key, ML_path(data_set_name, prune_technique, split_technique, test_fold,
+                                                         shuffle_seed, MLModel, ML_seed)):
+        return False
+    register_artifact("ml", ML_path(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel,
+                                    ML_seed), data_set_name, prune_technique, split_technique, test_fold, shuffle_seed,
+                      MLModel, ML_seed)
+    save_ML_seed(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                 ML_seed_actual)
+    return True
+
+
+@telemetry_job
+def fit_ML(data_set_name, prune_technique, split_technique, num_folds, test_fold, shuffle_seed, MLModel,
+           ML_seed, reproducibility_seed, cache_size=""):
+    ML_seed_actual = resolve_ML_seed(ML_seed, reproducibility_seed)
+
+    # look up a model fitted on identical training data, an empty cache size disables the cache
+    cache_limit = parse_size(cache_size)
+    if cache_limit is not None:
+        connection = connect_cache()
+        cache_key = ML_cache_key(connection, "fit_ML", data_set_name, prune_technique, split_technique, num_folds,
+                                 test_fold, shuffle_seed, MLModel, ML_seed_actual)
+        with telemetry_phase("load"):
+            cached = fetch_cached_ML(connection, cache_key, data_set_name, prune_technique, split_technique,
+                                     test_fold, shuffle_seed, MLModel, ML_seed, ML_seed_actual)
+        if cached:
+            return
+
+    with telemetry_phase("load"):
+        train_data = load_train_data(data_set_name, prune_technique, split_technique, num_folds, test_fold,
+                                     shuffle_seed)
+    telemetry_rows("load", len(train_data))
+    with telemetry_phase("compute"):
+        ML_alg = train_ML(train_data, MLModel, ML_seed_actual)
+    telemetry_rows("compute", len(train_data))
+
+    with telemetry_phase("save"):
+        save_ML(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed, ML_alg)
+        save_ML_seed(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                     ML_seed_actual)
+        if cache_limit is not None:
+            store_artifact(connection, cache_key, ML_path(data_set_name, prune_technique, split_technique, test_fold,
+                                                          shuffle_seed, MLModel, ML_seed), cache_limit)
     print(f"Fitted ML Model and saved to file.")
 
     return
 
 
+@telemetry_job
+def fit_ML_seeds(data_set_name, prune_technique, split_technique, num_folds, test_fold, shuffle_seed, MLModel,
+                 ML_seeds, reproducibility_seeds, n_jobs, cache_size=""):
+    # a seed count instead of a list fits a seed sweep
+    if isinstance(ML_seeds, int):
+        ML_seeds = expand_ML_seeding(["random"], ML_seeds)
+    if isinstance(reproducibility_seeds, int):
+        reproducibility_seeds = [reproducibility_seeds] * len(ML_seeds)
+    if len(reproducibility_seeds) != len(ML_seeds):
+        raise ValueError("Number of reproducibility seeds does not match the number of ML seeds.")
+    ML_seeds_actual = [resolve_ML_seed(ML_seed, reproducibility_seed)
+                       for ML_seed, reproducibility_seed in zip(ML_seeds, reproducibility_seeds)]
+
+    # models in the cache are placed instead of fitted, an empty cache size disables the cache
+    cache_limit = parse_size(cache_size)
+    cache_keys = {}
+    if cache_limit is not None:
+        connection = connect_cache()
+        with telemetry_phase("load"):
+            for ML_seed, ML_seed_actual in zip(ML_seeds, ML_seeds_actual):
+                cache_key = ML_cache_key(connection, "fit_ML", data_set_name, prune_technique, split_technique,
+                                         num_folds, test_fold, shuffle_seed, MLModel, ML_seed_actual)
+                if not fetch_cached_ML(connection, cache_key, data_set_name, prune_technique, split_technique,
+                                       test_fold, shuffle_seed, MLModel, ML_seed, ML_seed_actual):
+                    cache_keys[ML_seed] = cache_key
+        ML_seeds_actual = [ML_seed_actual for ML_seed, ML_seed_actual in zip(ML_seeds, ML_seeds_actual)
+                           if ML_seed in cache_keys]
+        ML_seeds = [ML_seed for ML_seed in ML_seeds if ML_seed in cache_keys]
+        if len(ML_seeds) == 0:
+            return
+
+    # the training data is loaded once for all seeds
+    with telemetry_phase("load"):
+        train_data = load_train_data(data_set_name, prune_technique, split_technique, num_folds, test_fold,
+                                     shuffle_seed)
+    telemetry_rows("load", len(train_data))
+    # the cpu time of the fitting includes the joblib workers once they finished
+    with telemetry_phase("compute"):
+        ML_algs = joblib.Parallel(n_jobs=n_jobs)(
+            joblib.delayed(train_ML)(train_data, MLModel, ML_seed_actual) for ML_seed_actual in ML_seeds_actual)
+    telemetry_rows("compute", len(train_data) * len(ML_seeds))
+
+    with telemetry_phase("save"):
+        for ML_seed, ML_seed_actual, ML_alg in zip(ML_seeds, ML_seeds_actual, ML_algs):
+            save_ML(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                    ML_alg)
+            save_ML_seed(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                         ML_seed_actual)
+            if cache_limit is not None:
+                store_artifact(connection, cache_keys[ML_seed], ML_path(data_set_name, prune_technique,
+                                                                        split_technique, test_fold, shuffle_seed,
+                                                                        MLModel, ML_seed), cache_limit)
+    print(f"Fitted {len(ML_seeds)} ML Models and saved to file.")
+
+    return
+
+
+@telemetry_job
+def fit_ML_folds(data_set_name, prune_technique, split_technique, num_folds, test_folds, shuffle_seed, MLModel,
+                 ML_seeds, reproducibility_seeds, cache_size=""):
+    # every fold is read once and summarized, the model of a test fold is fitted from the merged statistics of its
+    # training folds, so all test folds together cost one pass over the data instead of num_folds - 1
+    if MLModel not in FOLD_STATISTICS_MODELS:
+        raise ValueError("ML Model not supported for fitting from fold statistics!")
+    if not len(test_folds) == len(ML_seeds) == len(reproducibility_seeds):
+        raise ValueError("Number of test folds, ML seeds and reproducibility seeds do not match.")
+    models = [(test_fold, ML_seed, resolve_ML_seed(ML_seed, reproducibility_seed))
+              for test_fold, ML_seed, reproducibility_seed in zip(test_folds, ML_seeds, reproducibility_seeds)]
+
+    # models in the cache are placed instead of fitted, an empty cache size disables the cache
+    cache_limit = parse_size(cache_size)
+    cache_keys = {}
+    if cache_limit is not None:
+        connection = connect_cache()
+        with telemetry_phase("load"):
+            for test_fold, ML_seed, ML_seed_actual in models:
+                cache_key = ML_cache_key(connection, "fit_ML_folds", data_set_name, prune_technique,
+                                         split_technique, num_folds, test_fold, shuffle_seed, MLModel, ML_seed_actual)
+                if not fetch_cached_ML(connection, cache_key, data_set_name, prune_technique, split_technique,
+                                       test_fold, shuffle_seed, MLModel, ML_seed, ML_seed_actual):
+                    cache_keys[(test_fold, ML_seed)] = cache_key
+        models = [model for model in models if model[:2] in cache_keys]
+        if len(models) == 0:
+            return
+
+    fold_statistics = []
+    fold_ranges = []
+    for fold in range(num_folds):
+        with telemetry_phase("load"):
+            fold_data = load_fold_data(data_set_name, prune_technique, split_technique, [fold], shuffle_seed)
+        telemetry_rows("load", len(fold_data))
+        if 'X' not in fold_data.columns or 'y' not in fold_data.columns:
+            raise ValueError("Required columns 'x' and 'y' are not in the dataset.")
+        with telemetry_phase("compute"):
+            X = fold_data['X'].values.reshape(-1, 1)
+            fold_statistics.append(ml_engines.linear_statistics(X, fold_data['y']))
+            fold_ranges.append((X.min(), X.max()) if len(X) > 0 else (np.inf, -np.inf))
+            feature_type = ml_engines.feature_type(X)
+        telemetry_rows("compute", len(fold_data))
+
+    for test_fold, ML_seed, ML_seed_actual in models:
+        # a constant feature is fitted by sklearn, which needs the training data itself
+        if min(fold_ranges[fold][0] for fold in range(num_folds) if fold != test_fold) == max(
+                fold_ranges[fold][1] for fold in range(num_folds) if fold != test_fold):
+            with telemetry_phase("load"):
+                train_data = load_train_data(data_set_name, prune_technique, split_technique, num_folds, test_fold,
+                                             shuffle_seed)
+            with telemetry_phase("compute"):
+                ML_alg = train_ML(train_data, MLModel, ML_seed_actual)
+        else:
+            with telemetry_phase("compute"):
+                train_statistics = functools.reduce(ml_engines.merge_linear_statistics, [
+                    statistics for fold, statistics in enumerate(fold_statistics) if fold != test_fold])
+                ML_alg = ml_engines.ClosedFormLinearRegression().fit_statistics(train_statistics, feature_type)
+        with telemetry_phase("save"):
+            save_ML(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                    ML_alg)
+            save_ML_seed(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                         ML_seed_actual)
+            if cache_limit is not None:
+                store_artifact(connection, cache_keys[(test_fold, ML_seed)], ML_path(
+                    data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed),
+                    cache_limit)
+    print(f"Fitted {len(models)} ML Models from fold statistics and saved to file.")
+
+    return
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("Random Seed Effects fit machine learning model!")
     parser.add_argument('--data_set_name', dest='data_set_name', type=str, required=True)
     parser.add_argument('--prune_technique', dest='prune_technique', type=str, required=True)
     parser.add_argument('--split_technique', dest='split_technique', type=str, required=True)
     parser.add_argument('--num_folds', dest='num_folds', type=int, required=True)
-    parser.add_argument('--test_fold', dest='test_fold', type=int, required=True)
+    parser.add_argument('--test_fold', dest='test_fold', nargs="+", type=int, required=True)
     parser.add_argument('--shuffle_seed', dest='shuffle_seed', type=int, required=True)
     parser.add_argument('--MLModel', dest='MLModel', type=str, required=True)
-    parser.add_argument('--ML_seeding', dest='ML_seeding', type=str, required=True)
-    parser.add_argument('--reproducibility_seed', dest='reproducibility_seed', type=int, required=True)
+    parser.add_argument('--ML_seeding', dest='ML_seeding', nargs="+", type=str, required=True)
+    parser.add_argument('--reproducibility_seed', dest='reproducibility_seed', nargs="+", type=int, required=True)
+    parser.add_argument('--ML_seed_count', dest='ML_seed_count', type=int, default=0)
+    parser.add_argument('--n_jobs', dest='n_jobs', type=int, default=1)
+    parser.add_argument('--cache_size', dest='cache_size', type=str, default="")
+    parser.add_argument('--fold_statistics', dest='fold_statistics', type=int, default=0)
     args = parser.parse_args()
 
     print("Fitting Machine learning Model with arguments: ", args.__dict__)
-    fit_ML(args.data_set_name, args.prune_technique, args.split_technique, args.num_folds, args.test_fold,
-           args.shuffle_seed, args.MLModel, args.ML_seeding, args.reproducibility_seed)
+    if bool(args.fold_statistics):
+        # test folds, ML seeds and reproducibility seeds are given per model
+        fit_ML_folds(args.data_set_name, args.prune_technique, args.split_technique, args.num_folds, args.test_fold,
+                     args.shuffle_seed, args.MLModel, args.ML_seeding, args.reproducibility_seed, args.cache_size)
+    elif len(args.ML_seeding) == 1 and args.ML_seed_count <= 0:
+        fit_ML(args.data_set_name, args.prune_technique, args.split_technique, args.num_folds, args.test_fold[0],
+               args.shuffle_seed, args.MLModel, args.ML_seeding[0], args.reproducibility_seed[0], args.cache_size)
+    else:
+        ML_seeds = expand_ML_seeding(args.ML_seeding, args.ML_seed_count)
+        reproducibility_seeds = args.reproducibility_seed
+        if len(reproducibility_seeds) == 1:
+            reproducibility_seeds = reproducibility_seeds * len(ML_seeds)
+        fit_ML_seeds(args.data_set_name, args.prune_technique, args.split_technique, args.num_folds,
+                     args.test_fold[0], args.shuffle_seed, args.MLModel, ML_seeds, reproducibility_seeds, args.n_jobs,
+                     args.cache_size)
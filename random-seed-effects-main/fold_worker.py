@@ -0,0 +1,79 @@
+import argparse
+from static import *
+from fit_ML import load_train_data, resolve_ML_seed, train_ML, save_ML, save_ML_seed
+from make_predictions import read_test_data, clean_test_data, predict_batches, save_predictions
+from evaluate_predictions import group_user_positions, evaluate_batch, save_evaluation
+from telemetry import telemetry_job, telemetry_phase, telemetry_rows
+
+
+@telemetry_job
+def fit_predict_evaluate(data_set_name, prune_technique, split_technique, num_folds, test_fold, shuffle_seed,
+                         MLModel, ML_seed, reproducibility_seed, num_batches, topn_scores, persist_model=0,
+                         persist_predictions=0):
+    # fit the model and keep it in memory
+    with telemetry_phase("load"):
+        train_data = load_train_data(data_set_name, prune_technique, split_technique, num_folds, test_fold,
+                                     shuffle_seed)
+    telemetry_rows("load", len(train_data))
+    ML_seed_actual = resolve_ML_seed(ML_seed, reproducibility_seed)
+    with telemetry_phase("compute"):
+        ML_alg = train_ML(train_data, MLModel, ML_seed_actual)
+    telemetry_rows("compute", len(train_data))
+    del train_data
+    # the seed file is always written so that the run can be reproduced
+    with telemetry_phase("save"):
+        save_ML_seed(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                     ML_seed_actual)
+        if bool(persist_model):
+            save_ML(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                    ML_alg)
+
+    # predictions use the cleaned test data while the evaluation uses the test data as stored, like the single stages
+    with telemetry_phase("load"):
+        test_data = read_test_data(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed)
+    telemetry_rows("load", len(test_data))
+    with telemetry_phase("compute"):
+        user_positions = group_user_positions(test_data)
+        batch_predictions = predict_batches(ML_alg, clean_test_data(test_data.copy()), num_batches,
+                                            range(num_batches))
+
+    # evaluate predictions without writing them to file first
+    evaluation_data = {}
+    for run_batch, MLPredictions in batch_predictions.items():
+        if bool(persist_predictions):
+            with telemetry_phase("save"):
+                save_predictions(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel,
+                                 ML_seed, num_batches, run_batch, MLPredictions)
+        with telemetry_phase("compute"):
+            evaluation_data[run_batch] = evaluate_batch(MLPredictions, user_positions, len(test_data), topn_scores)
+    telemetry_rows("compute", len(test_data))
+
+    with telemetry_phase("save"):
+        save_evaluation(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                        num_batches, topn_scores, evaluation_data)
+    print(f"Fitted, predicted and evaluated fold {test_fold}.")
+
+    return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Random Seed Effects fit, predict and evaluate a fold!")
+    parser.add_argument('--data_set_name', dest='data_set_name', type=str, required=True)
+    parser.add_argument('--prune_technique', dest='prune_technique', type=str, required=True)
+    parser.add_argument('--split_technique', dest='split_technique', type=str, required=True)
+    parser.add_argument('--num_folds', dest='num_folds', type=int, required=True)
+    parser.add_argument('--test_fold', dest='test_fold', type=int, required=True)
+    parser.add_argument('--shuffle_seed', dest='shuffle_seed', type=int, required=True)
+    parser.add_argument('--MLModel', dest='MLModel', type=str, required=True)
+    parser.add_argument('--ML_seeding', dest='ML_seeding', type=str, required=True)
+    parser.add_argument('--reproducibility_seed', dest='reproducibility_seed', type=int, required=True)
+    parser.add_argument('--num_batches', dest='num_batches', type=int, required=True)
+    parser.add_argument('--topn_scores', dest='topn_scores', nargs="+", type=str, required=True)
+    parser.add_argument('--persist_model', dest='persist_model', type=int, default=0)
+    parser.add_argument('--persist_predictions', dest='persist_predictions', type=int, default=0)
+    args = parser.parse_args()
+
+    print("Fitting, predicting and evaluating with arguments: ", args.__dict__)
+    fit_predict_evaluate(args.data_set_name, args.prune_technique, args.split_technique, args.num_folds,
+                         args.test_fold, args.shuffle_seed, args.MLModel, args.ML_seeding, args.reproducibility_seed,
+                         args.num_batches, args.topn_scores, args.persist_model, args.persist_predictions)
@@ -1,51 +1,188 @@
 import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 from static import *
+from data_io import data_file, data_schema, read_data, split_path, split_base_path, write_split_base
+from artifact_catalog import connect_catalog, catalog_shuffle_seeds, forget_artifact, register_artifact
+from telemetry import telemetry_job, telemetry_phase, telemetry_rows
 
 
-def generate_splits(data_set_name, prune_technique, split_technique, num_folds, reproducibility_seed):
-    # load the data
-    data = pd.read_csv(f"./{DATA_FOLDER}/{data_set_name}/{PRUNE_FOLDER}/{prune_technique}_{PRUNE_FILE}", header=0,
-                       sep=",")
+def prepare_split_base(data_set_name, prune_technique, data_format):
+    # the pruned data is stored once as the split base, which is rewritten when the pruned data changed
+    pruned_path = f"./{DATA_FOLDER}/{data_set_name}/{PRUNE_FOLDER}/{prune_technique}_{data_file(PRUNE_FILE, data_format)}"
+    base_path = split_base_path(data_set_name, prune_technique)
+    Path(f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}").mkdir(exist_ok=True)
+    if not Path(base_path).exists() or Path(base_path).stat().st_mtime < Path(pruned_path).stat().st_mtime:
+        write_split_base(read_data(pruned_path, data_format, data_schema(data_set_name)), base_path)
+        # fold positions written before the pruned data changed index rows of the old base, so they are removed and
+        # regenerated when their shuffle seed is split again
+        stale_splits = [split_file for split_file in Path(f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}").glob(
+            f"*_{prune_technique}_*_{SPLIT_FILE}") if split_file.stat().st_mtime < Path(pruned_path).stat().st_mtime]
+        for split_file in stale_splits:
+            split_file.unlink(missing_ok=True)
+            forget_artifact(split_file)
+        if len(stale_splits) > 0:
+            print(f"Removed {len(stale_splits)} splits of {data_set_name} made before the pruned data changed.")
+    return pa.ipc.open_file(pa.memory_map(base_path)).read_all().num_rows
+
+
+def existing_shuffle_seeds(data_set_name, prune_technique, split_technique):
+    # the shuffle seeds in the catalog and the reproducibility seeds of the data set, which new seeds must not repeat
+    connection = connect_catalog()
+    existing_seeds = catalog_shuffle_seeds(connection, data_set_name, prune_technique, split_technique)
+    connection.close()
+    if Path("project_seeds.txt").exists():
+        existing_seeds += list(json.load(open("project_seeds.txt")).get(data_set_name, {}).keys())
+    return existing_seeds
+
+
+def draw_shuffle_seeds(num_seeds, existing_seeds=()):
+    # new shuffle seeds are drawn without repetition from one generator stream, seeds that already exist are redrawn
+    excluded_seeds = {int(seed) for seed in existing_seeds}
+    generator = np.random.default_rng()
+    shuffle_seeds = []
+    while len(shuffle_seeds) < num_seeds:
+        for seed in generator.choice(np.iinfo(np.int32).max, size=num_seeds - len(shuffle_seeds), replace=False):
+            if int(seed) not in excluded_seeds:
+                excluded_seeds.add(int(seed))
+                shuffle_seeds.append(int(seed))
+    return shuffle_seeds
 
-    # generate shuffle seed and shuffle data
-    if reproducibility_seed == -1:
-        shuffle_seed = np.random.randint(0, np.iinfo(np.int32).max)
-    else:
-        shuffle_seed = reproducibility_seed
-    data = data.sample(frac=1, random_state=shuffle_seed).reset_index(drop=True)
 
+def shuffle_positions(num_rows, shuffle_seed):
+    # the same permutation as shuffling the data frame with the seed, so existing seeds keep their splits
+    return np.random.RandomState(shuffle_seed).permutation(num_rows).astype(
+        np.int32 if num_rows <= np.iinfo(np.int32).max else np.int64)
+
+
+def write_splits(data_set_name, prune_technique, split_technique, num_folds, shuffle_seed, positions):
     if split_technique == "weak-generalization":
         # regular five-fold cross validation splits
-        splits = np.array_split(data, num_folds)
+        splits = np.array_split(positions, num_folds)
     else:
         raise ValueError("Split technique not recognized.")
 
-    print(f"Split data with technique {split_technique}.")
-
-    # write data to file
-    base_path_split = f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}"
-    Path(base_path_split).mkdir(exist_ok=True)
+    # write the row positions of every fold to file
     for split_index, split in enumerate(splits):
-        split.to_csv(f"{base_path_split}/{split_index}_{shuffle_seed}_{prune_technique}_{split_technique}_{SPLIT_FILE}",
-                     index=False)
+        split_file_path = split_path(data_set_name, prune_technique, split_technique, split_index, shuffle_seed)
+        np.save(split_file_path, split)
+        register_artifact("split", split_file_path, data_set_name, prune_technique, split_technique, split_index,
+                          shuffle_seed)
+
+
+def convert_legacy_splits(data_set_name, prune_technique, split_technique, data_format=DATA_FORMAT):
+    # csv splits of earlier versions hold the rows of the same shuffle of the pruned data, so they are replaced by the
+    # row positions of that shuffle, splits that do not match the pruned data any more are left to be regenerated
+    legacy_files = {}
+    for path in Path(f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}").glob(
+            f"*_{prune_technique}_{split_technique}_{LEGACY_SPLIT_FILE}"):
+        fold, shuffle_seed = path.name.split("_")[:2]
+        legacy_files.setdefault(int(shuffle_seed), {})[int(fold)] = path
+    if len(legacy_files) == 0 or not Path(f"./{DATA_FOLDER}/{data_set_name}/{PRUNE_FOLDER}/"
+                                          f"{prune_technique}_{data_file(PRUNE_FILE, data_format)}").exists():
+        return
+    num_rows = prepare_split_base(data_set_name, prune_technique, data_format)
+    for shuffle_seed, fold_files in legacy_files.items():
+        positions = shuffle_positions(num_rows, shuffle_seed)
+        fold_rows = [sum(1 for _ in open(fold_files[fold])) - 1 if fold in fold_files else -1
+                     for fold in range(len(fold_files))]
+        if fold_rows != [len(split) for split in np.array_split(positions, len(fold_files))]:
+            print(f"Legacy splits of shuffle seed {shuffle_seed} do not match the pruned data and are regenerated.")
+            continue
+        write_splits(data_set_name, prune_technique, split_technique, len(fold_files), shuffle_seed, positions)
+        for path in fold_files.values():
+            path.unlink()
+    print(f"Converted legacy splits of {data_set_name} with techniques {prune_technique} and {split_technique}.")
+
+
+@telemetry_job
+def generate_splits(data_set_name, prune_technique, split_technique, num_folds, reproducibility_seed,
+                    data_format=DATA_FORMAT):
+    with telemetry_phase("load"):
+        num_rows = prepare_split_base(data_set_name, prune_technique, data_format)
+    telemetry_rows("load", num_rows)
+
+    # generate shuffle seed and shuffle the row positions
+    if reproducibility_seed == -1:
+        shuffle_seed = draw_shuffle_seeds(1, existing_shuffle_seeds(data_set_name, prune_technique,
+                                                                    split_technique))[0]
+    else:
+        shuffle_seed = reproducibility_seed
+    with telemetry_phase("compute"):
+        positions = shuffle_positions(num_rows, shuffle_seed)
+
+    with telemetry_phase("save"):
+        write_splits(data_set_name, prune_technique, split_technique, num_folds, shuffle_seed, positions)
+    telemetry_rows("save", num_rows)
+    print(f"Split data with technique {split_technique}.")
     print(f"Written split data set to file.")
 
     return
 
 
+@telemetry_job
+def generate_splits_seeds(data_set_name, prune_technique, split_technique, num_folds, reproducibility_seeds, n_jobs,
+                          data_format=DATA_FORMAT):
+    # a seed count instead of a list draws that many new shuffle seeds
+    if isinstance(reproducibility_seeds, int):
+        reproducibility_seeds = [-1] * reproducibility_seeds
+    num_new_seeds = sum(1 for seed in reproducibility_seeds if seed == -1)
+    existing_seeds = existing_shuffle_seeds(data_set_name, prune_technique, split_technique) if num_new_seeds > 0 \
+        else []
+    new_seeds = iter(draw_shuffle_seeds(num_new_seeds, existing_seeds + [seed for seed in reproducibility_seeds
+                                                                         if seed != -1]))
+    shuffle_seeds = [next(new_seeds) if seed == -1 else seed for seed in reproducibility_seeds]
+
+    # the split base is prepared once for all seeds and the permutations are spread over n_jobs processes
+    with telemetry_phase("load"):
+        num_rows = prepare_split_base(data_set_name, prune_technique, data_format)
+    telemetry_rows("load", num_rows)
+    parallel = n_jobs > 1 and len(shuffle_seeds) > 1
+    with ProcessPoolExecutor(max_workers=n_jobs) if parallel else nullcontext() as executor:
+        if parallel:
+            all_positions = executor.map(shuffle_positions, [num_rows] * len(shuffle_seeds), shuffle_seeds)
+        else:
+            all_positions = (shuffle_positions(num_rows, shuffle_seed) for shuffle_seed in shuffle_seeds)
+        for shuffle_seed in shuffle_seeds:
+            with telemetry_phase("compute"):
+                positions = next(all_positions)
+            with telemetry_phase("save"):
+                write_splits(data_set_name, prune_technique, split_technique, num_folds, shuffle_seed, positions)
+            telemetry_rows("save", num_rows)
+    print(f"Split data with technique {split_technique} for {len(shuffle_seeds)} shuffle seeds.")
+    print(f"Written split data sets to file.")
+
+    return
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("Random Seed Effects generate splits!")
     parser.add_argument('--data_set_name', dest='data_set_name', type=str, required=True)
     parser.add_argument('--prune_technique', dest='prune_technique', type=str, required=True)
     parser.add_argument('--split_technique', dest='split_technique', type=str, required=True)
     parser.add_argument('--num_folds', dest='num_folds', type=int, required=True)
-    parser.add_argument('--reproducibility_seed', dest='reproducibility_seed', type=int, required=True)
+    seed_group = parser.add_mutually_exclusive_group(required=True)
+    # the shuffle seeds to split with, -1 draws a new seed
+    seed_group.add_argument('--reproducibility_seed', dest='reproducibility_seed', nargs="+", type=int)
+    # the number of new shuffle seeds to draw, none of which exists yet
+    seed_group.add_argument('--shuffle_seed_count', dest='shuffle_seed_count', type=int)
+    parser.add_argument('--n_jobs', dest='n_jobs', type=int, default=1)
+    parser.add_argument('--data_format', dest='data_format', type=str, default=DATA_FORMAT)
 
     args = parser.parse_args()
 
     print("Generating splits with arguments: ", args.__dict__)
-    generate_splits(args.data_set_name, args.prune_technique, args.split_technique, args.num_folds,
-                    args.reproducibility_seed)
+    if args.shuffle_seed_count is not None:
+        generate_splits_seeds(args.data_set_name, args.prune_technique, args.split_technique, args.num_folds,
+                              args.shuffle_seed_count, args.n_jobs, args.data_format)
+    elif len(args.reproducibility_seed) == 1:
+        generate_splits(args.data_set_name, args.prune_technique, args.split_technique, args.num_folds,
+                        args.reproducibility_seed[0], args.data_format)
+    else:
+        generate_splits_seeds(args.data_set_name, args.prune_technique, args.split_technique, args.num_folds,
+                              args.reproducibility_seed, args.n_jobs, args.data_format)
@@ -1,299 +1,453 @@
 import argparse
 import json
+import os
 import subprocess
+import time
 from pathlib import Path
 from static import *
+from data_io import data_file
+from fit_ML import expand_ML_seeding, reproducibility_key, FOLD_STATISTICS_MODELS
+from generate_splits import convert_legacy_splits
+from artifact_cache import parse_size
+from task_pack import write_task_pack
+from pipeline import pipeline_tasks
+from artifact_catalog import connect_catalog, catalog_shuffle_seeds, catalog_artifacts
 
 
-def execute_clean_data(data_set_names, job_time, job_memory, job_cores, fail_email):
-    for data_set_name in data_set_names:
-        base_path = f"./{DATA_FOLDER}/{data_set_name}/{CLEAN_FOLDER}/{CLEAN_FILE}"
-        if not Path(base_path).exists():
-            script_name = f"_RSE_stage0_clean_{data_set_name}"
-            script = "#!/bin/bash\n" \
-                     "#SBATCH --nodes=1\n" \
-                     f"#SBATCH --cpus-per-task={job_cores}\n" \
-                     "#SBATCH --mail-type=FAIL\n" \
-                     f"#SBATCH --mail-user={fail_email}\n" \
-                     "#SBATCH --partition=short,medium,long\n" \
-                     f"#SBATCH --time={job_time}\n" \
-                     f"#SBATCH --mem={job_memory}\n" \
+def job_header(job_time, job_memory, job_cores, fail_email):
+    return "#!/bin/bash\n" \
+           "#SBATCH --nodes=1\n" \
+           f"#SBATCH --cpus-per-task={job_cores}\n" \
+           "#SBATCH --mail-type=FAIL\n" \
+           f"#SBATCH --mail-user={fail_email}\n" \
+           "#SBATCH --partition=short,medium,long\n" \
+           f"#SBATCH --time={job_time}\n" \
+           f"#SBATCH --mem={job_memory}\n"
+
+
+def submit_script(script_name, script, dependency_ids=None):
+    # with a list of dependencies, the job only starts once all of them succeeded and its job id is returned
+    with open(f"./{script_name}.sh", 'w', newline='\n') as f:
+        f.write(script)
+    sbatch_command = ["sbatch"]
+    if dependency_ids is not None:
+        sbatch_command.append("--parsable")
+        if len(dependency_ids) > 0:
+            sbatch_command += [f"--dependency=afterok:{':'.join(dependency_ids)}", "--kill-on-invalid-dep=yes"]
+    result = subprocess.run(sbatch_command + [f"./{script_name}.sh"], capture_output=True, text=True)
+    Path(f"./{script_name}.sh").unlink()
+    # a failed submission stops the stage, otherwise dependent jobs would wait on a job that does not exist
+    if result.returncode != 0 or result.stdout.strip() == "":
+        raise RuntimeError(f"Submitting {script_name} failed with return code {result.returncode}: "
+                           f"{result.stderr.strip()}")
+    if dependency_ids is None:
+        print(result.stdout.strip())
+        return None
+    return result.stdout.strip().split(";")[0]
+
+
+def submission_suffix():
+    # task lists are read by the jobs when they run, so every submission writes its own files instead of overwriting
+    # the ones of jobs of an earlier submission that are still queued
+    return f"{time.strftime('%Y%m%d%H%M%S')}_{os.getpid()}_{time.time_ns() % 1000000000:09d}"
+
+
+def submit_tasks(stage_name, tasks, job_time, job_memory, job_cores, fail_email, job_array, array_parallel,
+                 job_pack_size):
+    # tasks are a job name, the python command line of the job, and the stage function name with its arguments
+    if len(tasks) == 0:
+        print(f"No jobs to submit for {stage_name}.")
+        return
+    if int(job_pack_size) > 0:
+        # packs of tasks share one allocation and are run by a pool of one worker per core
+        Path(f"./{TASK_FOLDER}").mkdir(exist_ok=True)
+        packed_tasks = []
+        suffix = submission_suffix()
+        for pack_index, pack_start in enumerate(range(0, len(tasks), int(job_pack_size))):
+            pack_name = f"_RSE_{stage_name}_pack{pack_index}"
+            pack_path = f"./{TASK_FOLDER}/{pack_name}_{suffix}.jsonl"
+            write_task_pack(pack_path, [stage_job for _, _, stage_job in
+                                        tasks[pack_start:pack_start + int(job_pack_size)]])
+            packed_tasks.append((pack_name, f"./task_pack.py --pack {pack_path} --num_workers {job_cores}", None))
+        print(f"Packed {len(tasks)} tasks for {stage_name} into {len(packed_tasks)} packs.")
+        tasks = packed_tasks
+    if not bool(job_array):
+        for script_name, command, _ in tasks:
+            script = job_header(job_time, job_memory, job_cores, fail_email) + \
                      "#SBATCH --output=./omni_out/%x_%j.out\n" \
                      "module load singularity\n" \
                      "singularity exec --pwd /mnt --bind ./:/mnt ./rse.sif python -u " \
-                     "./clean_data.py " \
-                     f"--data_set_name {data_set_name}"
-            with open(f"./{script_name}.sh", 'w', newline='\n') as f:
-                f.write(script)
-            subprocess.run(["sbatch", f"./{script_name}.sh"])
-            Path(f"./{script_name}.sh").unlink()
+                     f"{command}"
+            submit_script(script_name, script)
+        print(f"Submitted {len(tasks)} jobs for {stage_name}.")
+        return
 
+    # one array job per chunk of tasks, every array task reads its command line from the task manifest
+    Path(f"./{TASK_FOLDER}").mkdir(exist_ok=True)
+    throttle = f"%{array_parallel}" if int(array_parallel) > 0 else ""
+    suffix = submission_suffix()
+    for chunk_index, chunk_start in enumerate(range(0, len(tasks), JOB_ARRAY_MAX_SIZE)):
+        chunk = tasks[chunk_start:chunk_start + JOB_ARRAY_MAX_SIZE]
+        script_name = f"_RSE_{stage_name}_array{chunk_index}"
+        manifest_path = f"./{TASK_FOLDER}/{script_name}_{suffix}.txt"
+        with open(manifest_path, 'w', newline='\n') as f:
+            f.write("".join(f"{command}\n" for _, command, _ in chunk))
+        script = job_header(job_time, job_memory, job_cores, fail_email) + \
+            f"#SBATCH --array=0-{len(chunk) - 1}{throttle}\n" \
+            "#SBATCH --output=./omni_out/%x_%A_%a.out\n" \
+            f"TASK=$(sed -n \"$((SLURM_ARRAY_TASK_ID + 1))p\" {manifest_path})\n" \
+            "module load singularity\n" \
+            "singularity exec --pwd /mnt --bind ./:/mnt ./rse.sif python -u " \
+            "$TASK"
+        submit_script(script_name, script)
+    print(f"Submitted {len(tasks)} tasks for {stage_name} as {chunk_index + 1} array jobs.")
 
-def execute_prune_data(data_set_names, prune_techniques, job_time, job_memory, job_cores, fail_email):
+
+def execute_clean_data(data_set_names, data_format, compact_floats, job_time, job_memory, job_cores, fail_email,
+                       job_array, array_parallel, job_pack_size):
+    tasks = []
     for data_set_name in data_set_names:
-        for prune_technique in prune_techniques:
-            base_path = f"./{DATA_FOLDER}/{data_set_name}/{PRUNE_FOLDER}/{prune_technique}_{PRUNE_FILE}"
-            if not Path(base_path).exists():
-                script_name = f"_RSE_stage1_prune_{data_set_name}_{prune_technique}"
-                script = "#!/bin/bash\n" \
-                         "#SBATCH --nodes=1\n" \
-                         f"#SBATCH --cpus-per-task={job_cores}\n" \
-                         "#SBATCH --mail-type=FAIL\n" \
-                         f"#SBATCH --mail-user={fail_email}\n" \
-                         "#SBATCH --partition=short,medium,long\n" \
-                         f"#SBATCH --time={job_time}\n" \
-                         f"#SBATCH --mem={job_memory}\n" \
-                         "#SBATCH --output=./omni_out/%x_%j.out\n" \
-                         "module load singularity\n" \
-                         "singularity exec --pwd /mnt --bind ./:/mnt ./rse.sif python -u " \
-                         "./prune_data.py " \
-                         f"--data_set_name {data_set_name} " \
-                         f"--prune_technique {prune_technique}"
-                with open(f"./{script_name}.sh", 'w', newline='\n') as f:
-                    f.write(script)
-                subprocess.run(["sbatch", f"./{script_name}.sh"])
-                Path(f"./{script_name}.sh").unlink()
+        base_path = f"./{DATA_FOLDER}/{data_set_name}/{CLEAN_FOLDER}/{data_file(CLEAN_FILE, data_format)}"
+        if not Path(base_path).exists():
+            tasks.append((f"_RSE_stage0_clean_{data_set_name}",
+                          "./clean_data.py "
+                          f"--data_set_name {data_set_name} "
+                          f"--data_format {data_format} "
+                          f"--compact_floats {compact_floats}",
+                          ("clean_data", [data_set_name, data_format, CLEAN_CHUNK_SIZE, compact_floats])))
+    submit_tasks("stage0_clean", tasks, job_time, job_memory, job_cores, fail_email, job_array, array_parallel,
+                 job_pack_size)
 
 
-def execute_generate_splits(data_set_names, prune_techniques, split_techniques, num_folds, job_time, job_memory,
-                            job_cores, fail_email, reproducibility_mode):
+def execute_prune_data(data_set_names, prune_techniques, data_format, prune_chunk_size, job_time, job_memory,
+                       job_cores, fail_email, job_array, array_parallel, job_pack_size):
+    # one task per data set prunes it with all missing techniques from a single read
+    tasks = []
+    for data_set_name in data_set_names:
+        missing_techniques = [prune_technique for prune_technique in prune_techniques if not Path(
+            f"./{DATA_FOLDER}/{data_set_name}/{PRUNE_FOLDER}/{prune_technique}_{data_file(PRUNE_FILE, data_format)}"
+        ).exists()]
+        if len(missing_techniques) > 0:
+            tasks.append((f"_RSE_stage1_prune_{data_set_name}",
+                          "./prune_data.py "
+                          f"--data_set_name {data_set_name} "
+                          f"--prune_technique {' '.join(missing_techniques)} "
+                          f"--data_format {data_format} "
+                          f"--chunk_size {prune_chunk_size}",
+                          ("prune_data", [data_set_name, missing_techniques, data_format, prune_chunk_size])))
+    submit_tasks("stage1_prune", tasks, job_time, job_memory, job_cores, fail_email, job_array, array_parallel,
+                 job_pack_size)
+
+
+def execute_generate_splits(data_set_names, prune_techniques, split_techniques, num_folds, data_format, job_time,
+                            job_memory, job_cores, fail_email, reproducibility_mode, shuffle_seed_count, job_array,
+                            array_parallel, job_pack_size):
+    tasks = []
+    # all shuffle seeds of a splitting are generated by one job with a worker per core
+    splitting_cores = 1 if int(job_pack_size) > 0 else job_cores
     for data_set_name in data_set_names:
         for prune_technique in prune_techniques:
             for split_technique in split_techniques:
-                def run_script(reproducibility_seed):
-                    script_name = f"_RSE_stage2_split_{data_set_name}_{prune_technique}_{split_technique}_{num_folds}"
-                    script = "#!/bin/bash\n" \
-                             "#SBATCH --nodes=1\n" \
-                             f"#SBATCH --cpus-per-task={job_cores}\n" \
-                             "#SBATCH --mail-type=FAIL\n" \
-                             f"#SBATCH --mail-user={fail_email}\n" \
-                             "#SBATCH --partition=short,medium,long\n" \
-                             f"#SBATCH --time={job_time}\n" \
-                             f"#SBATCH --mem={job_memory}\n" \
-                             "#SBATCH --output=./omni_out/%x_%j.out\n" \
-                             "module load singularity\n" \
-                             "singularity exec --pwd /mnt --bind ./:/mnt ./rse.sif python -u " \
-                             "./generate_splits.py " \
-                             f"--data_set_name {data_set_name} " \
-                             f"--prune_technique {prune_technique} " \
-                             f"--split_technique {split_technique} " \
-                             f"--num_folds {num_folds} " \
-                             f"--reproducibility_seed {reproducibility_seed}"
-                    with open(f"./{script_name}.sh", 'w', newline='\n') as f:
-                        f.write(script)
-                    subprocess.run(["sbatch", f"./{script_name}.sh"])
-                    Path(f"./{script_name}.sh").unlink()
-
+                convert_legacy_splits(data_set_name, prune_technique, split_technique, data_format)
                 if bool(reproducibility_mode):
                     seeds = json.loads(open(f"project_seeds.txt", "r").read())
-                    for shuffle_seed in list(seeds[data_set_name].keys()):
-                        run_script(shuffle_seed)
+                    reproducibility_seeds = [int(shuffle_seed) for shuffle_seed in seeds[data_set_name].keys()]
+                    seed_option = f"--reproducibility_seed {' '.join(str(seed) for seed in reproducibility_seeds)} "
                 else:
-                    run_script(-1)
+                    # new seeds are drawn by the job, so they do not repeat the seeds that exist when it runs
+                    reproducibility_seeds = shuffle_seed_count
+                    seed_option = f"--shuffle_seed_count {shuffle_seed_count} "
+                tasks.append((f"_RSE_stage2_split_{data_set_name}_{prune_technique}_{split_technique}_{num_folds}",
+                              "./generate_splits.py "
+                              f"--data_set_name {data_set_name} "
+                              f"--prune_technique {prune_technique} "
+                              f"--split_technique {split_technique} "
+                              f"--num_folds {num_folds} "
+                              f"{seed_option}"
+                              f"--n_jobs {splitting_cores} "
+                              f"--data_format {data_format}",
+                              ("generate_splits_seeds", [data_set_name, prune_technique, split_technique, num_folds,
+                                                         reproducibility_seeds, splitting_cores, data_format])))
+    submit_tasks("stage2_split", tasks, job_time, job_memory, job_cores, fail_email, job_array, array_parallel,
+                 job_pack_size)
 
 
-def execute_fit_recommender(data_set_names, prune_techniques, split_techniques, num_folds, recommenders,
-                            recommender_seeding, job_time, job_memory, job_cores, fail_email, reproducibility_mode):
+def execute_fit_ML(data_set_names, prune_techniques, split_techniques, num_folds, MLModels, ML_seeding, job_time,
+                   job_memory, job_cores, fail_email, reproducibility_mode, job_array, array_parallel, job_pack_size):
+    tasks = []
+    # packed fitting jobs share the cores of an allocation, so each of them fits with a single core
+    fitting_cores = 1 if int(job_pack_size) > 0 else job_cores
+    # existing artifacts are looked up in the catalog instead of probing the shared file system
+    connection = connect_catalog()
     for data_set_name in data_set_names:
         for prune_technique in prune_techniques:
             for split_technique in split_techniques:
-                shuffle_seeds = []
-                for file in Path(f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}").iterdir():
-                    _, file_seed, file_prune_technique, file_split_technique, _ = file.name.split(".")[0].split("_")
-                    if file_prune_technique == prune_technique and file_split_technique == split_technique:
-                        shuffle_seeds.append(file_seed)
-                shuffle_seeds = list(set(shuffle_seeds))
-                for recommender in recommenders:
+                shuffle_seeds = catalog_shuffle_seeds(connection, data_set_name, prune_technique, split_technique)
+                existing_models = catalog_artifacts(connection, "ml", data_set_name, prune_technique,
+                                                    split_technique)
+                for MLModel in MLModels:
                     for shuffle_seed in shuffle_seeds:
-                        for recommender_seed in recommender_seeding:
-                            for test_fold in range(num_folds):
-                                def run_script(reproducibility_seed):
-                                    base_path = f"./{DATA_FOLDER}/{data_set_name}/{RECOMMENDER_FOLDER}_{recommender}/" \
-                                                f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_" \
-                                                f"{recommender_seed}_{RECOMMENDER_FILE}"
-                                    if not Path(base_path).exists() or Path(base_path).stat().st_size == 0:
-                                        script_name = f"_RSE_stage3_fit_{data_set_name}_{prune_technique}_" \
-                                                      f"{split_technique}_{shuffle_seed}_{num_folds}_{recommender}_" \
-                                                      f"{recommender_seed}_{test_fold}"
-                                        script = "#!/bin/bash\n" \
-                                                 "#SBATCH --nodes=1\n" \
-                                                 f"#SBATCH --cpus-per-task={job_cores}\n" \
-                                                 "#SBATCH --mail-type=FAIL\n" \
-                                                 f"#SBATCH --mail-user={fail_email}\n" \
-                                                 "#SBATCH --partition=short,medium,long\n" \
-                                                 f"#SBATCH --time={job_time}\n" \
-                                                 f"#SBATCH --mem={job_memory}\n" \
-                                                 "#SBATCH --output=./omni_out/%x_%j.out\n" \
-                                                 "module load singularity\n" \
-                                                 "singularity exec --pwd /mnt --bind ./:/mnt ./rse.sif python -u " \
-                                                 "./fit_recommender.py " \
-                                                 f"--data_set_name {data_set_name} " \
-                                                 f"--prune_technique {prune_technique} " \
-                                                 f"--split_technique {split_technique} " \
-                                                 f"--num_folds {num_folds} " \
-                                                 f"--test_fold {test_fold} " \
-                                                 f"--shuffle_seed {shuffle_seed} " \
-                                                 f"--recommender {recommender} " \
-                                                 f"--recommender_seed {recommender_seed} " \
-                                                 f"--reproducibility_seed {reproducibility_seed}"
-                                        with open(f"./{script_name}.sh", 'w', newline='\n') as f:
-                                            f.write(script)
-                                        subprocess.run(["sbatch", f"./{script_name}.sh"])
-                                        Path(f"./{script_name}.sh").unlink()
-
+                        fold_models = []
+                        for test_fold in range(num_folds):
+                            # all missing seeds of a fold are fitted in parallel by one job
+                            missing_seeds = []
+                            reproducibility_seeds = []
+                            for ML_seed in ML_seeding:
+                                if (test_fold, shuffle_seed, MLModel, ML_seed, None, None) in existing_models:
+                                    continue
                                 if bool(reproducibility_mode):
                                     seeds = json.loads(open(f"project_seeds.txt", "r").read())
-                                    run_script(seeds[data_set_name][shuffle_seed][recommender][str(test_fold)])
+                                    try:
+                                        reproducibility_seed = seeds[data_set_name][shuffle_seed][MLModel][
+                                            reproducibility_key(test_fold, ML_seed)]
+                                    except KeyError:
+                                        print(f"Key not found for data_set_name: {data_set_name}, shuffle_seed: {shuffle_seed}, MLModel: {MLModel}, test_fold: {test_fold}, ML_seed: {ML_seed}")
+                                        continue
                                 else:
-                                    run_script(-1)
+                                    reproducibility_seed = -1
+                                missing_seeds.append(ML_seed)
+                                reproducibility_seeds.append(f"{reproducibility_seed}")
+                            if len(missing_seeds) == 0:
+                                continue
+                            if MLModel in FOLD_STATISTICS_MODELS:
+                                fold_models += [(f"{test_fold}", ML_seed, reproducibility_seed) for ML_seed,
+                                                reproducibility_seed in zip(missing_seeds, reproducibility_seeds)]
+                                continue
+                            tasks.append((f"_RSE_stage3_fit_{data_set_name}_{prune_technique}_{split_technique}_"
+                                          f"{shuffle_seed}_{num_folds}_{MLModel}_{test_fold}",
+                                          "./fit_ML.py "
+                                          f"--data_set_name {data_set_name} "
+                                          f"--prune_technique {prune_technique} "
+                                          f"--split_technique {split_technique} "
+                                          f"--num_folds {num_folds} "
+                                          f"--test_fold {test_fold} "
+                                          f"--shuffle_seed {shuffle_seed} "
+                                          f"--MLModel {MLModel} "
+                                          f"--ML_seeding {' '.join(missing_seeds)} "
+                                          f"--reproducibility_seed {' '.join(reproducibility_seeds)} "
+                                          f"--n_jobs {fitting_cores}",
+                                          ("fit_ML_seeds", [data_set_name, prune_technique, split_technique,
+                                                            num_folds, test_fold, int(shuffle_seed), MLModel,
+                                                            missing_seeds,
+                                                            [int(seed) for seed in reproducibility_seeds],
+                                                            fitting_cores])))
+                        # the models of all folds are fitted by one job that reads every fold once
+                        if len(fold_models) == 0:
+                            continue
+                        test_folds, fold_seeds, fold_reproducibility_seeds = zip(*fold_models)
+                        tasks.append((f"_RSE_stage3_fit_{data_set_name}_{prune_technique}_{split_technique}_"
+                                      f"{shuffle_seed}_{num_folds}_{MLModel}",
+                                      "./fit_ML.py "
+                                      f"--data_set_name {data_set_name} "
+                                      f"--prune_technique {prune_technique} "
+                                      f"--split_technique {split_technique} "
+                                      f"--num_folds {num_folds} "
+                                      f"--test_fold {' '.join(test_folds)} "
+                                      f"--shuffle_seed {shuffle_seed} "
+                                      f"--MLModel {MLModel} "
+                                      f"--ML_seeding {' '.join(fold_seeds)} "
+                                      f"--reproducibility_seed {' '.join(fold_reproducibility_seeds)} "
+                                      f"--fold_statistics 1",
+                                      ("fit_ML_folds", [data_set_name, prune_technique, split_technique, num_folds,
+                                                        [int(fold) for fold in test_folds], int(shuffle_seed),
+                                                        MLModel, list(fold_seeds),
+                                                        [int(seed) for seed in fold_reproducibility_seeds]])))
+    connection.close()
+    submit_tasks("stage3_fit", tasks, job_time, job_memory, job_cores, fail_email, job_array, array_parallel,
+                 job_pack_size)
 
 
-def execute_make_predictions(data_set_names, prune_techniques, split_techniques, num_folds, recommenders,
-                             recommender_seeding, num_batches, job_time, job_memory, job_cores, fail_email):
+def execute_make_predictions(data_set_names, prune_techniques, split_techniques, num_folds, MLModels, ML_seeding,
+                             num_batches, job_time, job_memory, job_cores, fail_email, job_array, array_parallel,
+                             job_pack_size):
+    tasks = []
+    connection = connect_catalog()
     for data_set_name in data_set_names:
         for prune_technique in prune_techniques:
             for split_technique in split_techniques:
-                shuffle_seeds = []
-                for file in Path(f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}").iterdir():
-                    _, file_seed, file_prune_technique, file_split_technique, _ = file.name.split(".")[0].split("_")
-                    if file_prune_technique == prune_technique and file_split_technique == split_technique:
-                        shuffle_seeds.append(file_seed)
-                shuffle_seeds = list(set(shuffle_seeds))
-                for recommender in recommenders:
+                shuffle_seeds = catalog_shuffle_seeds(connection, data_set_name, prune_technique, split_technique)
+                existing_predictions = catalog_artifacts(connection, "predictions", data_set_name,
+                                                         prune_technique, split_technique)
+                for MLModel in MLModels:
                     for shuffle_seed in shuffle_seeds:
-                        for recommender_seed in recommender_seeding:
+                        for ML_seed in ML_seeding:
                             for test_fold in range(num_folds):
+                                missing_batches = []
                                 for run_batch in range(num_batches):
-                                    base_path = f"./{DATA_FOLDER}/{data_set_name}/{PREDICTION_FOLDER}_{recommender}/" \
-                                                f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_" \
-                                                f"{recommender_seed}_{num_batches}_{run_batch}_{PREDICTION_FILE}"
-                                    if not Path(base_path).exists() or Path(base_path).stat().st_size == 0:
-                                        script_name = f"_RSE_stage4_predict_{data_set_name}_{prune_technique}_" \
-                                                      f"{split_technique}_{shuffle_seed}_{num_folds}_{recommender}_" \
-                                                      f"{recommender_seed}_{test_fold}_{num_batches}_{run_batch}"
-                                        script = "#!/bin/bash\n" \
-                                                 "#SBATCH --nodes=1\n" \
-                                                 f"#SBATCH --cpus-per-task={job_cores}\n" \
-                                                 "#SBATCH --mail-type=FAIL\n" \
-                                                 f"#SBATCH --mail-user={fail_email}\n" \
-                                                 "#SBATCH --partition=short,medium,long\n" \
-                                                 f"#SBATCH --time={job_time}\n" \
-                                                 f"#SBATCH --mem={job_memory}\n" \
-                                                 "#SBATCH --output=./omni_out/%x_%j.out\n" \
-                                                 "module load singularity\n" \
-                                                 "singularity exec --pwd /mnt --bind ./:/mnt ./rse.sif python -u " \
-                                                 "./make_predictions.py " \
-                                                 f"--data_set_name {data_set_name} " \
-                                                 f"--prune_technique {prune_technique} " \
-                                                 f"--split_technique {split_technique} " \
-                                                 f"--test_fold {test_fold} " \
-                                                 f"--shuffle_seed {shuffle_seed} " \
-                                                 f"--recommender {recommender} " \
-                                                 f"--recommender_seed {recommender_seed} " \
-                                                 f"--num_batches {num_batches} " \
-                                                 f"--run_batch {run_batch}"
-                                        with open(f"./{script_name}.sh", 'w', newline='\n') as f:
-                                            f.write(script)
-                                        subprocess.run(["sbatch", f"./{script_name}.sh"])
-                                        Path(f"./{script_name}.sh").unlink()
+                                    if (test_fold, shuffle_seed, MLModel, ML_seed, num_batches,
+                                            str(run_batch)) not in existing_predictions:
+                                        missing_batches.append(run_batch)
+                                # one job per fold predicts once for all batches, existing batches are not rewritten
+                                if len(missing_batches) > 1:
+                                    missing_batches = [-1]
+                                for run_batch in missing_batches:
+                                    tasks.append((f"_RSE_stage4_predict_{data_set_name}_{prune_technique}_"
+                                                  f"{split_technique}_{shuffle_seed}_{num_folds}_{MLModel}_"
+                                                  f"{ML_seed}_{test_fold}_{num_batches}_{run_batch}",
+                                                  "./make_predictions.py "
+                                                  f"--data_set_name {data_set_name} "
+                                                  f"--prune_technique {prune_technique} "
+                                                  f"--split_technique {split_technique} "
+                                                  f"--test_fold {test_fold} "
+                                                  f"--shuffle_seed {shuffle_seed} "
+                                                  f"--MLModel {MLModel} "
+                                                  f"--ML_seeding {ML_seed} "
+                                                  f"--num_batches {num_batches} "
+                                                  f"--run_batch {run_batch}",
+                                                  ("make_predictions", [data_set_name, prune_technique,
+                                                                        split_technique, test_fold, int(shuffle_seed),
+                                                                        MLModel, ML_seed, num_batches, run_batch])))
+    connection.close()
+    submit_tasks("stage4_predict", tasks, job_time, job_memory, job_cores, fail_email, job_array, array_parallel,
+                 job_pack_size)
 
 
-def execute_evaluate_predictions(data_set_names, prune_techniques, split_techniques, num_folds, recommenders,
-                                 recommender_seeding, num_batches, topn_scores, job_time, job_memory, job_cores,
-                                 fail_email):
+def execute_evaluate_predictions(data_set_names, prune_techniques, split_techniques, num_folds, MLModels,
+                                 ML_seeding, num_batches, topn_scores, job_time, job_memory, job_cores, fail_email,
+                                 job_array, array_parallel, job_pack_size):
     topn_scores_string = '-'.join([str(x) for x in topn_scores])
     topn_scores_script = ' '.join([str(x) for x in topn_scores])
+    tasks = []
+    connection = connect_catalog()
     for data_set_name in data_set_names:
         for prune_technique in prune_techniques:
             for split_technique in split_techniques:
-                shuffle_seeds = []
-                for file in Path(f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}").iterdir():
-                    _, file_seed, file_prune_technique, file_split_technique, _ = file.name.split(".")[0].split("_")
-                    if file_prune_technique == prune_technique and file_split_technique == split_technique:
-                        shuffle_seeds.append(file_seed)
-                shuffle_seeds = list(set(shuffle_seeds))
-                for recommender in recommenders:
+                shuffle_seeds = catalog_shuffle_seeds(connection, data_set_name, prune_technique, split_technique)
+                existing_evaluations = catalog_artifacts(connection, "evaluations", data_set_name,
+                                                         prune_technique, split_technique)
+                for MLModel in MLModels:
                     for shuffle_seed in shuffle_seeds:
-                        for recommender_seed in recommender_seeding:
+                        for ML_seed in ML_seeding:
                             for test_fold in range(num_folds):
-                                base_path = f"./{DATA_FOLDER}/{data_set_name}/{EVALUATION_FOLDER}_" \
-                                            f"{recommender}/{test_fold}_{shuffle_seed}_{prune_technique}_" \
-                                            f"{split_technique}_{recommender_seed}_{num_batches}_" \
-                                            f"{topn_scores_string}_{EVALUATION_FILE}"
-                                if not Path(base_path).exists() or Path(base_path).stat().st_size == 0:
-                                    script_name = \
-                                        f"_RSE_stage5_evaluate_{data_set_name}_{prune_technique}_" \
-                                        f"{split_technique}_{shuffle_seed}_{num_folds}_{recommender}_" \
-                                        f"{recommender_seed}_{test_fold}_{num_batches}_{topn_scores_string}"
-                                    script = "#!/bin/bash\n" \
-                                             "#SBATCH --nodes=1\n" \
-                                             f"#SBATCH --cpus-per-task={job_cores}\n" \
-                                             "#SBATCH --mail-type=FAIL\n" \
-                                             f"#SBATCH --mail-user={fail_email}\n" \
-                                             "#SBATCH --partition=short,medium,long\n" \
-                                             f"#SBATCH --time={job_time}\n" \
-                                             f"#SBATCH --mem={job_memory}\n" \
-                                             "#SBATCH --output=./omni_out/%x_%j.out\n" \
-                                             "module load singularity\n" \
-                                             "singularity exec --pwd /mnt --bind ./:/mnt ./rse.sif python -u " \
-                                             "./evaluate_predictions.py " \
-                                             f"--data_set_name {data_set_name} " \
-                                             f"--prune_technique {prune_technique} " \
-                                             f"--split_technique {split_technique} " \
-                                             f"--test_fold {test_fold} " \
-                                             f"--shuffle_seed {shuffle_seed} " \
-                                             f"--recommender {recommender} " \
-                                             f"--recommender_seed {recommender_seed} " \
-                                             f"--num_batches {num_batches} " \
-                                             f"--topn_scores {topn_scores_script}"
-                                    with open(f"./{script_name}.sh", 'w', newline='\n') as f:
-                                        f.write(script)
-                                    subprocess.run(["sbatch", f"./{script_name}.sh"])
-                                    Path(f"./{script_name}.sh").unlink()
+                                if (test_fold, shuffle_seed, MLModel, ML_seed, num_batches,
+                                        topn_scores_string) in existing_evaluations:
+                                    continue
+                                tasks.append((f"_RSE_stage5_evaluate_{data_set_name}_{prune_technique}_"
+                                              f"{split_technique}_{shuffle_seed}_{num_folds}_{MLModel}_"
+                                              f"{ML_seed}_{test_fold}_{num_batches}_{topn_scores_string}",
+                                              "./evaluate_predictions.py "
+                                              f"--data_set_name {data_set_name} "
+                                              f"--prune_technique {prune_technique} "
+                                              f"--split_technique {split_technique} "
+                                              f"--test_fold {test_fold} "
+                                              f"--shuffle_seed {shuffle_seed} "
+                                              f"--MLModel {MLModel} "
+                                              f"--ML_seeding {ML_seed} "
+                                              f"--num_batches {num_batches} "
+                                              f"--topn_scores {topn_scores_script}",
+                                              ("evaluate_predictions", [data_set_name, prune_technique,
+                                                                        split_technique, test_fold, int(shuffle_seed),
+                                                                        MLModel, ML_seed, num_batches, topn_scores])))
+    connection.close()
+    submit_tasks("stage5_evaluate", tasks, job_time, job_memory, job_cores, fail_email, job_array, array_parallel,
+                 job_pack_size)
+
+
+def execute_pipeline(data_set_names, prune_techniques, split_techniques, num_folds, MLModels, ML_seeding, num_batches,
+                     topn_scores, data_format, stage_resources, fail_email, reproducibility_mode, fused_execution,
+                     persist_models, persist_predictions, prune_chunk_size, shuffle_seed_count, compact_floats):
+    # stage resources are the job time, memory and cores of stages 0 to 5
+    tasks = pipeline_tasks(data_set_names, prune_techniques, split_techniques, num_folds, MLModels, ML_seeding,
+                           reproducibility_mode, num_batches, topn_scores, fused_execution, persist_models,
+                           persist_predictions, data_format, "", stage_resources[3][2], prune_chunk_size,
+                           shuffle_seed_count, compact_floats)
+    if len(tasks) == 0:
+        print("No jobs to submit for the pipeline.")
+        return
+    # every job runs one task of the pipeline task list and waits for the jobs of the tasks it depends on
+    Path(f"./{TASK_FOLDER}").mkdir(exist_ok=True)
+    pack_path = f"./{TASK_FOLDER}/_RSE_pipeline_{submission_suffix()}.jsonl"
+    write_task_pack(pack_path, [(function_name, job) for _, function_name, job, _ in tasks.values()])
+    job_ids = {}
+    for task_index, (task_id, (stage, _, _, dependencies)) in enumerate(tasks.items()):
+        job_time, job_memory, job_cores = stage_resources[stage]
+        script = job_header(job_time, job_memory, job_cores, fail_email) + \
+            "#SBATCH --output=./omni_out/%x_%j.out\n" \
+            "module load singularity\n" \
+            "singularity exec --pwd /mnt --bind ./:/mnt ./rse.sif python -u " \
+            f"./task_pack.py --pack {pack_path} --task {task_index} --num_workers 1"
+        job_ids[task_id] = submit_script(f"_RSE_stage{stage}_{task_id}", script,
+                                         [job_ids[dependency] for dependency in dependencies])
+    print(f"Submitted {len(tasks)} dependent jobs for the pipeline.")
 
 
-parser = argparse.ArgumentParser("HPC Executor Script for Random Seed Effects!")
-parser.add_argument('--experiment', dest='experiment', type=str, default="template")
-parser.add_argument('--stage', dest='stage', type=int, default=-1)
-args = parser.parse_args()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("HPC Executor Script for Random Seed Effects!")
+    parser.add_argument('--experiment', dest='experiment', type=str, default="template")
+    parser.add_argument('--stage', dest='stage', type=int, default=-1)
+    parser.add_argument('--pipeline', dest='pipeline', type=int, default=0)
+    args = parser.parse_args()
 
-experiment_settings = json.load(open(f"./experiment_{args.experiment}.json"))
-if args.stage == 0:
-    execute_clean_data(experiment_settings["DATA_SET_NAMES"], experiment_settings["STAGE0_CLEANING_TIME"],
-                       experiment_settings["STAGE0_CLEANING_MEMORY"], experiment_settings["STAGE0_CLEANING_CORES"],
-                       experiment_settings["JOB_FAIL_EMAIL"])
-elif args.stage == 1:
-    execute_prune_data(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
-                       experiment_settings["STAGE1_PRUNING_TIME"], experiment_settings["STAGE1_PRUNING_MEMORY"],
-                       experiment_settings["STAGE1_PRUNING_CORES"], experiment_settings["JOB_FAIL_EMAIL"])
-elif args.stage == 2:
-    execute_generate_splits(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
-                            experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
-                            experiment_settings["STAGE2_SPLITTING_TIME"],
-                            experiment_settings["STAGE2_SPLITTING_MEMORY"],
-                            experiment_settings["STAGE2_SPLITTING_CORES"], experiment_settings["JOB_FAIL_EMAIL"],
-                            experiment_settings["REPRODUCIBILITY_MODE"])
-elif args.stage == 3:
-    execute_fit_recommender(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
-                            experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
-                            experiment_settings["RECOMMENDERS"], experiment_settings["RECOMMENDER_SEEDING"],
-                            experiment_settings["STAGE3_FITTING_TIME"], experiment_settings["STAGE3_FITTING_MEMORY"],
-                            experiment_settings["STAGE3_FITTING_CORES"], experiment_settings["JOB_FAIL_EMAIL"],
-                            experiment_settings["REPRODUCIBILITY_MODE"])
-elif args.stage == 4:
-    execute_make_predictions(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
-                             experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
-                             experiment_settings["RECOMMENDERS"], experiment_settings["RECOMMENDER_SEEDING"],
-                             experiment_settings["NUM_BATCHES"], experiment_settings["STAGE4_PREDICTING_TIME"],
-                             experiment_settings["STAGE4_PREDICTING_MEMORY"],
-                             experiment_settings["STAGE4_PREDICTING_CORES"], experiment_settings["JOB_FAIL_EMAIL"])
-elif args.stage == 5:
-    execute_evaluate_predictions(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
+    experiment_settings = json.load(open(f"./experiment_{args.experiment}.json"))
+    data_format = experiment_settings.get("DATA_FORMAT", DATA_FORMAT)
+    if parse_size(experiment_settings.get("ARTIFACT_CACHE_SIZE", "")) is not None:
+        print("Warning: ARTIFACT_CACHE_SIZE is ignored by the SLURM executor, whose jobs do not share a cache index.")
+    ML_seeding = expand_ML_seeding(experiment_settings["ML_SEEDING"], experiment_settings.get("ML_SEED_COUNT", 0))
+    # submit the jobs of a stage as job arrays, optionally limited to a number of simultaneously running tasks
+    job_array = experiment_settings.get("JOB_ARRAY", 0)
+    array_parallel = experiment_settings.get("JOB_ARRAY_PARALLEL", 0)
+    # run this many tasks in one allocation with a worker per core, 0 submits every task on its own
+    job_pack_size = experiment_settings.get("JOB_PACK_SIZE", 0)
+    # prune in chunks of this many rows with approximate quantiles, 0 prunes the whole data set in memory
+    prune_chunk_size = experiment_settings.get("PRUNE_CHUNK_SIZE", 0)
+    # store scaled features that the models do not read as float32, which changes the pruning
+    compact_floats = experiment_settings.get("COMPACT_FLOATS", 0)
+    # number of shuffle seeds drawn per splitting outside of reproducibility mode
+    shuffle_seed_count = experiment_settings.get("SHUFFLE_SEED_COUNT", 1)
+    if bool(args.pipeline):
+        execute_pipeline(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
+                         experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
+                         experiment_settings["MLMODELS"], ML_seeding, experiment_settings["NUM_BATCHES"],
+                         experiment_settings["TOPN_SCORES"], data_format,
+                         [(experiment_settings[f"{stage_prefix}_TIME"], experiment_settings[f"{stage_prefix}_MEMORY"],
+                           experiment_settings[f"{stage_prefix}_CORES"]) for stage_prefix in
+                          ["STAGE0_CLEANING", "STAGE1_PRUNING", "STAGE2_SPLITTING", "STAGE3_FITTING",
+                           "STAGE4_PREDICTING", "STAGE5_EVALUATING"]],
+                         experiment_settings["JOB_FAIL_EMAIL"], experiment_settings["REPRODUCIBILITY_MODE"],
+                         experiment_settings.get("FUSED_EXECUTION", 0), experiment_settings.get("SAVE_MODELS", 0),
+                         experiment_settings.get("SAVE_PREDICTIONS", 0), prune_chunk_size, shuffle_seed_count,
+                         compact_floats)
+    elif args.stage == 0:
+        execute_clean_data(experiment_settings["DATA_SET_NAMES"], data_format, compact_floats,
+                           experiment_settings["STAGE0_CLEANING_TIME"], experiment_settings["STAGE0_CLEANING_MEMORY"],
+                           experiment_settings["STAGE0_CLEANING_CORES"], experiment_settings["JOB_FAIL_EMAIL"],
+                           job_array, array_parallel, job_pack_size)
+    elif args.stage == 1:
+        execute_prune_data(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"], data_format,
+                           prune_chunk_size, experiment_settings["STAGE1_PRUNING_TIME"], experiment_settings["STAGE1_PRUNING_MEMORY"],
+                           experiment_settings["STAGE1_PRUNING_CORES"], experiment_settings["JOB_FAIL_EMAIL"],
+                           job_array, array_parallel, job_pack_size)
+    elif args.stage == 2:
+        execute_generate_splits(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
+                                experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"], data_format,
+                                experiment_settings["STAGE2_SPLITTING_TIME"],
+                                experiment_settings["STAGE2_SPLITTING_MEMORY"],
+                                experiment_settings["STAGE2_SPLITTING_CORES"], experiment_settings["JOB_FAIL_EMAIL"],
+                                experiment_settings["REPRODUCIBILITY_MODE"], shuffle_seed_count, job_array,
+                                array_parallel, job_pack_size)
+    elif args.stage == 3:
+        execute_fit_ML(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
+                       experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
+                       experiment_settings["MLMODELS"], ML_seeding,
+                       experiment_settings["STAGE3_FITTING_TIME"], experiment_settings["STAGE3_FITTING_MEMORY"],
+                       experiment_settings["STAGE3_FITTING_CORES"], experiment_settings["JOB_FAIL_EMAIL"],
+                       experiment_settings["REPRODUCIBILITY_MODE"], job_array, array_parallel, job_pack_size)
+    elif args.stage == 4:
+        execute_make_predictions(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
                                  experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
-                                 experiment_settings["RECOMMENDERS"], experiment_settings["RECOMMENDER_SEEDING"],
-                                 experiment_settings["NUM_BATCHES"], experiment_settings["TOPN_SCORES"],
-                                 experiment_settings["STAGE5_EVALUATING_TIME"],
-                                 experiment_settings["STAGE5_EVALUATING_MEMORY"],
-                                 experiment_settings["STAGE5_EVALUATING_CORES"], experiment_settings["JOB_FAIL_EMAIL"])
-else:
-    print("No valid stage selected!")
+                                 experiment_settings["MLMODELS"], ML_seeding, experiment_settings["NUM_BATCHES"],
+                                 experiment_settings["STAGE4_PREDICTING_TIME"],
+                                 experiment_settings["STAGE4_PREDICTING_MEMORY"],
+                                 experiment_settings["STAGE4_PREDICTING_CORES"], experiment_settings["JOB_FAIL_EMAIL"],
+                                 job_array, array_parallel, job_pack_size)
+    elif args.stage == 5:
+        execute_evaluate_predictions(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
+                                     experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
+                                     experiment_settings["MLMODELS"], ML_seeding, experiment_settings["NUM_BATCHES"],
+                                     experiment_settings["TOPN_SCORES"],
+                                     experiment_settings["STAGE5_EVALUATING_TIME"],
+                                     experiment_settings["STAGE5_EVALUATING_MEMORY"],
+                                     experiment_settings["STAGE5_EVALUATING_CORES"],
+                                     experiment_settings["JOB_FAIL_EMAIL"], job_array, array_parallel, job_pack_size)
+    else:
+        print("No valid stage selected!")
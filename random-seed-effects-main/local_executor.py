@@ -1,190 +1,307 @@
 import json
-import subprocess
+import os
 from pathlib import Path
-from select_experiment import file, stage
+from select_experiment import file, stage, pipeline
+from clean_data import clean_data
+from prune_data import prune_data
+from generate_splits import convert_legacy_splits, generate_splits_seeds
+from fit_ML import fit_ML, fit_ML_seeds, fit_ML_folds, expand_ML_seeding, reproducibility_key, FOLD_STATISTICS_MODELS
+from make_predictions import make_predictions
+from evaluate_predictions import evaluate_predictions
+from fold_worker import fit_predict_evaluate
 from evaluation_report import evaluation_report
 from plot_results import plot_results
+from stage_runner import run_jobs, resolve_num_workers
+from pipeline import pipeline_tasks, run_pipeline
+from data_io import data_file
+from artifact_catalog import connect_catalog, catalog_shuffle_seeds, catalog_artifacts
+from artifact_cache import parse_size
 from static import *
-import os
-import sklearn
-import sys
 
 
-def execute_clean_data(data_set_names):
+def execute_clean_data(data_set_names, data_format, compact_floats, num_workers):
+    jobs = []
     for data_set_name in data_set_names:
-        base_path = f"./{DATA_FOLDER}/{data_set_name}/{CLEAN_FOLDER}/{CLEAN_FILE}"
+        base_path = f"./{DATA_FOLDER}/{data_set_name}/{CLEAN_FOLDER}/{data_file(CLEAN_FILE, data_format)}"
         if not Path(base_path).exists():
-            subprocess.run([sys.executable, "clean_data.py", "--data_set_name", f"{data_set_name}"])
+            jobs.append((data_set_name, data_format, CLEAN_CHUNK_SIZE, compact_floats))
+    run_jobs(clean_data, jobs, num_workers)
 
 
-def execute_prune_data(data_set_names, prune_techniques):
+def execute_prune_data(data_set_names, prune_techniques, data_format, prune_chunk_size, num_workers):
+    # one job per data set prunes it with all missing techniques from a single read
+    jobs = []
     for data_set_name in data_set_names:
-        for prune_technique in prune_techniques:
-            base_path = f"./{DATA_FOLDER}/{data_set_name}/{PRUNE_FOLDER}/{prune_technique}_{PRUNE_FILE}"
-            if not Path(base_path).exists():
-                subprocess.run(
-                    [sys.executable, "prune_data.py", "--data_set_name", f"{data_set_name}", "--prune_technique",
-                     f"{prune_technique}"])
+        missing_techniques = [prune_technique for prune_technique in prune_techniques if not Path(
+            f"./{DATA_FOLDER}/{data_set_name}/{PRUNE_FOLDER}/{prune_technique}_{data_file(PRUNE_FILE, data_format)}"
+        ).exists()]
+        if len(missing_techniques) > 0:
+            jobs.append((data_set_name, missing_techniques, data_format, prune_chunk_size))
+    run_jobs(prune_data, jobs, num_workers)
 
 
-def execute_generate_splits(data_set_names, prune_techniques, split_techniques, num_folds, reproducibility_mode):
+def execute_generate_splits(data_set_names, prune_techniques, split_techniques, num_folds, reproducibility_mode,
+                            shuffle_seed_count, data_format, num_workers):
+    # all shuffle seeds of a splitting are generated by one job, the cores are shared between the jobs
+    splitting_cores = max(1, (os.cpu_count() or 1) // resolve_num_workers(num_workers))
+    jobs = []
     for data_set_name in data_set_names:
         for prune_technique in prune_techniques:
             for split_technique in split_techniques:
-                def run_script(reproducibility_seed):
-                    subprocess.run(
-                        [sys.executable, "generate_splits.py", "--data_set_name", f"{data_set_name}", "--prune_technique",
-                         f"{prune_technique}", "--split_technique", f"{split_technique}", "--num_folds",
-                         f"{num_folds}", "--reproducibility_seed", f"{reproducibility_seed}"])
-
+                convert_legacy_splits(data_set_name, prune_technique, split_technique, data_format)
                 if bool(reproducibility_mode):
                     seeds = json.loads(open(f"project_seeds.txt", "r").read())
-                    for shuffle_seed in list(seeds[data_set_name].keys()):
-                        run_script(shuffle_seed)
+                    reproducibility_seeds = [int(shuffle_seed) for shuffle_seed in seeds[data_set_name].keys()]
                 else:
-                    run_script(-1)
+                    reproducibility_seeds = [-1] * shuffle_seed_count
+                jobs.append((data_set_name, prune_technique, split_technique, num_folds, reproducibility_seeds,
+                             splitting_cores, data_format))
+    run_jobs(generate_splits_seeds, jobs, num_workers)
 
 
 def execute_fit_ML(data_set_names, prune_techniques, split_techniques, num_folds, MLModels,
-                   ML_seeding, reproducibility_mode):
+                   ML_seeding, reproducibility_mode, cache_size, num_workers):
+    jobs = []
+    seed_jobs = []
+    fold_jobs = []
+    # the cores of the machine are shared between the worker processes of the seed jobs
+    fitting_cores = max(1, (os.cpu_count() or 1) // resolve_num_workers(num_workers))
+    # existing artifacts are looked up in the catalog instead of probing the file system
+    connection = connect_catalog()
     for data_set_name in data_set_names:
         for prune_technique in prune_techniques:
             for split_technique in split_techniques:
-                shuffle_seeds = []
-                for file in Path(f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}").iterdir():
-                    _, file_seed, file_prune_technique, file_split_technique, _ = file.name.split(".")[0].split("_")
-                    if file_prune_technique == prune_technique and file_split_technique == split_technique:
-                        shuffle_seeds.append(file_seed)
-                shuffle_seeds = list(set(shuffle_seeds))
+                shuffle_seeds = catalog_shuffle_seeds(connection, data_set_name, prune_technique, split_technique)
+                existing_models = catalog_artifacts(connection, "ml", data_set_name, prune_technique,
+                                                    split_technique)
                 for MLModel in MLModels:
                     for shuffle_seed in shuffle_seeds:
-                        for ML_seed in ML_seeding:
-                            for test_fold in range(num_folds):
-                                def run_script(reproducibility_seed):
-                                    base_path = f"./{DATA_FOLDER}/{data_set_name}/{ML_FOLDER}_{MLModel}/" \
-                                                f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_" \
-                                                f"{ML_seed}_{ML_FILE}"
-                                    if not Path(base_path).exists():
-                                        subprocess.run(
-                                            [sys.executable, "fit_ML.py", "--data_set_name",
-                                             f"{data_set_name}", "--prune_technique", f"{prune_technique}",
-                                             "--split_technique", f"{split_technique}", "--num_folds", f"{num_folds}",
-                                             "--test_fold", f"{test_fold}", "--shuffle_seed", f"{shuffle_seed}",
-                                             "--MLModel", f"{MLModel}", "--ML_seeding",
-                                             f"{ML_seed}", "--reproducibility_seed",
-                                             f"{reproducibility_seed}"])
-
+                        fold_models = []
+                        for test_fold in range(num_folds):
+                            missing_seeds = []
+                            reproducibility_seeds = []
+                            for ML_seed in ML_seeding:
+                                if (test_fold, shuffle_seed, MLModel, ML_seed, None, None) in existing_models:
+                                    continue
                                 if bool(reproducibility_mode):
                                     seeds = json.loads(open(f"project_seeds.txt", "r").read())
                                     try:
-                                        run_script(seeds[data_set_name][shuffle_seed][MLModel][str(test_fold)])
+                                        reproducibility_seed = int(seeds[data_set_name][shuffle_seed][MLModel][
+                                                                       reproducibility_key(test_fold, ML_seed)])
                                     except KeyError:
-                                        print(f"Key not found for data_set_name: {data_set_name}, shuffle_seed: {shuffle_seed}, MLModel: {MLModel}, test_fold: {test_fold}")
+                                        print(f"Key not found for data_set_name: {data_set_name}, shuffle_seed: {shuffle_seed}, MLModel: {MLModel}, test_fold: {test_fold}, ML_seed: {ML_seed}")
+                                        continue
                                 else:
-                                    run_script(-1)
+                                    reproducibility_seed = -1
+                                missing_seeds.append(ML_seed)
+                                reproducibility_seeds.append(reproducibility_seed)
+                            # several seeds of a fold are fitted by one job that loads the training data once
+                            if MLModel in FOLD_STATISTICS_MODELS:
+                                fold_models += [(test_fold, ML_seed, reproducibility_seed) for ML_seed,
+                                                reproducibility_seed in zip(missing_seeds, reproducibility_seeds)]
+                            elif len(missing_seeds) == 1:
+                                jobs.append((data_set_name, prune_technique, split_technique, num_folds, test_fold,
+                                             int(shuffle_seed), MLModel, missing_seeds[0], reproducibility_seeds[0],
+                                             cache_size))
+                            elif len(missing_seeds) > 1:
+                                seed_jobs.append((data_set_name, prune_technique, split_technique, num_folds,
+                                                  test_fold, int(shuffle_seed), MLModel, missing_seeds,
+                                                  reproducibility_seeds, fitting_cores, cache_size))
+                        # the models of all folds are fitted by one job that reads every fold once
+                        if len(fold_models) > 0:
+                            fold_jobs.append((data_set_name, prune_technique, split_technique, num_folds,
+                                              [model[0] for model in fold_models], int(shuffle_seed), MLModel,
+                                              [model[1] for model in fold_models],
+                                              [model[2] for model in fold_models], cache_size))
+    connection.close()
+    run_jobs(fit_ML, jobs, num_workers)
+    run_jobs(fit_ML_seeds, seed_jobs, num_workers)
+    run_jobs(fit_ML_folds, fold_jobs, num_workers)
 
 
 def execute_make_predictions(data_set_names, prune_techniques, split_techniques, num_folds, MLModels,
-                             ML_seeding, num_batches):
+                             ML_seeding, num_batches, cache_size, num_workers):
+    jobs = []
+    # existing artifacts are looked up in the catalog instead of probing the file system
+    connection = connect_catalog()
     for data_set_name in data_set_names:
         for prune_technique in prune_techniques:
             for split_technique in split_techniques:
-                shuffle_seeds = []
-                for file in Path(f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}").iterdir():
-                    _, file_seed, file_prune_technique, file_split_technique, _ = file.name.split(".")[0].split("_")
-                    if file_prune_technique == prune_technique and file_split_technique == split_technique:
-                        shuffle_seeds.append(file_seed)
-                shuffle_seeds = list(set(shuffle_seeds))
+                shuffle_seeds = catalog_shuffle_seeds(connection, data_set_name, prune_technique, split_technique)
+                existing_predictions = catalog_artifacts(connection, "predictions", data_set_name,
+                                                         prune_technique, split_technique)
                 for MLModel in MLModels:
                     for shuffle_seed in shuffle_seeds:
                         for ML_seed in ML_seeding:
                             for test_fold in range(num_folds):
+                                missing_batches = []
                                 for run_batch in range(num_batches):
-                                    base_path = f"./{DATA_FOLDER}/{data_set_name}/{PREDICTION_FOLDER}_{MLModel}/" \
-                                                f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_" \
-                                                f"{ML_seed}_{num_batches}_{run_batch}_{PREDICTION_FILE}"
-                                    if not Path(base_path).exists():
-                                        subprocess.run(
-                                            [sys.executable, "make_predictions.py", "--data_set_name",
-                                             f"{data_set_name}", "--prune_technique", f"{prune_technique}",
-                                             "--split_technique", f"{split_technique}", "--test_fold", f"{test_fold}",
-                                             "--shuffle_seed", f"{shuffle_seed}", "--MLModel", f"{MLModel}",
-                                             "--ML_seeding", f"{ML_seed}", "--num_batches",
-                                             f"{num_batches}", "--run_batch", f"{run_batch}"])
+                                    if (test_fold, shuffle_seed, MLModel, ML_seed, num_batches,
+                                            str(run_batch)) not in existing_predictions:
+                                        missing_batches.append(run_batch)
+                                # one job per fold predicts once for all batches, existing batches are not rewritten
+                                if len(missing_batches) > 1:
+                                    missing_batches = [-1]
+                                for run_batch in missing_batches:
+                                    jobs.append((data_set_name, prune_technique, split_technique, test_fold,
+                                                 int(shuffle_seed), MLModel, ML_seed, num_batches, run_batch,
+                                                 cache_size))
+    connection.close()
+    run_jobs(make_predictions, jobs, num_workers)
 
 
 def execute_evaluate_predictions(data_set_names, prune_techniques, split_techniques, num_folds, MLModels,
-                                 ML_seeding, num_batches, topn_scores):
+                                 ML_seeding, num_batches, topn_scores, num_workers):
     topn_scores_string = '-'.join([str(x) for x in topn_scores])
+    jobs = []
+    # existing artifacts are looked up in the catalog instead of probing the file system
+    connection = connect_catalog()
     for data_set_name in data_set_names:
         for prune_technique in prune_techniques:
             for split_technique in split_techniques:
-                shuffle_seeds = []
-                for file in Path(f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}").iterdir():
-                    _, file_seed, file_prune_technique, file_split_technique, _ = file.name.split(".")[0].split("_")
-                    if file_prune_technique == prune_technique and file_split_technique == split_technique:
-                        shuffle_seeds.append(file_seed)
-                shuffle_seeds = list(set(shuffle_seeds))
+                shuffle_seeds = catalog_shuffle_seeds(connection, data_set_name, prune_technique, split_technique)
+                existing_evaluations = catalog_artifacts(connection, "evaluations", data_set_name,
+                                                         prune_technique, split_technique)
                 for MLModel in MLModels:
                     for shuffle_seed in shuffle_seeds:
                         for ML_seed in ML_seeding:
                             for test_fold in range(num_folds):
-                                base_path = f"./{DATA_FOLDER}/{data_set_name}/{EVALUATION_FOLDER}_{MLModel}/" \
-                                            f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_" \
-                                            f"{ML_seed}_{num_batches}_{topn_scores_string}_" \
-                                            f"{EVALUATION_FILE}"
-                                if not Path(base_path).exists():
-                                    subprocess.run(
-                                        [sys.executable, "evaluate_predictions.py", "--data_set_name",
-                                         f"{data_set_name}", "--prune_technique", f"{prune_technique}",
-                                         "--split_technique", f"{split_technique}", "--test_fold",
-                                         f"{test_fold}", "--shuffle_seed", f"{shuffle_seed}", "--MLModel",
-                                         f"{MLModel}", "--ML_seeding", f"{ML_seed}",
-                                         "--num_batches", f"{num_batches}", "--topn_scores"] + [f"{r}" for r in
-                                                                                                topn_scores])
+                                if (test_fold, shuffle_seed, MLModel, ML_seed, num_batches,
+                                        topn_scores_string) not in existing_evaluations:
+                                    jobs.append((data_set_name, prune_technique, split_technique, test_fold,
+                                                 int(shuffle_seed), MLModel, ML_seed, num_batches, topn_scores))
+    connection.close()
+    run_jobs(evaluate_predictions, jobs, num_workers)
+
+
+def execute_fit_predict_evaluate(data_set_names, prune_techniques, split_techniques, num_folds, MLModels,
+                                 ML_seeding, reproducibility_mode, num_batches, topn_scores, persist_models,
+                                 persist_predictions, num_workers):
+    topn_scores_string = '-'.join([str(x) for x in topn_scores])
+    jobs = []
+    # existing artifacts are looked up in the catalog instead of probing the file system
+    connection = connect_catalog()
+    for data_set_name in data_set_names:
+        for prune_technique in prune_techniques:
+            for split_technique in split_techniques:
+                shuffle_seeds = catalog_shuffle_seeds(connection, data_set_name, prune_technique, split_technique)
+                existing_evaluations = catalog_artifacts(connection, "evaluations", data_set_name,
+                                                         prune_technique, split_technique)
+                for MLModel in MLModels:
+                    for shuffle_seed in shuffle_seeds:
+                        for ML_seed in ML_seeding:
+                            for test_fold in range(num_folds):
+                                if (test_fold, shuffle_seed, MLModel, ML_seed, num_batches,
+                                        topn_scores_string) in existing_evaluations:
+                                    continue
+                                if bool(reproducibility_mode):
+                                    seeds = json.loads(open(f"project_seeds.txt", "r").read())
+                                    try:
+                                        reproducibility_seed = int(seeds[data_set_name][shuffle_seed][MLModel][
+                                                                       reproducibility_key(test_fold, ML_seed)])
+                                    except KeyError:
+                                        print(f"Key not found for data_set_name: {data_set_name}, shuffle_seed: {shuffle_seed}, MLModel: {MLModel}, test_fold: {test_fold}, ML_seed: {ML_seed}")
+                                        continue
+                                else:
+                                    reproducibility_seed = -1
+                                jobs.append((data_set_name, prune_technique, split_technique, num_folds, test_fold,
+                                             int(shuffle_seed), MLModel, ML_seed, reproducibility_seed, num_batches,
+                                             topn_scores, persist_models, persist_predictions))
+    connection.close()
+    run_jobs(fit_predict_evaluate, jobs, num_workers)
+
+
+def execute_pipeline(data_set_names, prune_techniques, split_techniques, num_folds, MLModels, ML_seeding,
+                     reproducibility_mode, num_batches, topn_scores, fused_execution, persist_models,
+                     persist_predictions, data_format, cache_size, prune_chunk_size, shuffle_seed_count, compact_floats,
+                     num_workers):
+    fitting_cores = max(1, (os.cpu_count() or 1) // resolve_num_workers(num_workers))
+    tasks = pipeline_tasks(data_set_names, prune_techniques, split_techniques, num_folds, MLModels, ML_seeding,
+                           reproducibility_mode, num_batches, topn_scores, fused_execution, persist_models,
+                           persist_predictions, data_format, cache_size, fitting_cores, prune_chunk_size,
+                           shuffle_seed_count, compact_floats)
+    run_pipeline(tasks, num_workers)
 
 
 def execute_evaluation_report(data_set_names, prune_techniques, split_techniques, num_folds, MLModels,
-                              ML_seeding, num_batches, topn_scores):
+                              ML_seeding, num_batches, topn_scores, num_workers):
     evaluation_report(data_set_names, prune_techniques, split_techniques, num_folds, MLModels,
-                      ML_seeding, num_batches, topn_scores)
+                      ML_seeding, num_batches, topn_scores, num_workers)
 
 
 def execute_plot_results():
     plot_results()
 
 
-experiment_settings = json.load(open(f"./experiment_full.json"))
-if stage == 0:
-    execute_clean_data(experiment_settings["DATA_SET_NAMES"])
-elif stage == 1:
-    execute_prune_data(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"])
-elif stage == 2:
-    execute_generate_splits(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
-                            experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
-                            experiment_settings["REPRODUCIBILITY_MODE"])
-elif stage == 3:
-    execute_fit_ML(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
-                   experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
-                   experiment_settings["MLMODELS"], experiment_settings["ML_SEEDING"],
-                   experiment_settings["REPRODUCIBILITY_MODE"])
-elif stage == 4:
-    execute_make_predictions(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
-                             experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
-                             experiment_settings["MLMODELS"], experiment_settings["ML_SEEDING"],
-                             experiment_settings["NUM_BATCHES"])
-elif stage == 5:
-    execute_evaluate_predictions(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
+if __name__ == "__main__":
+    experiment_settings = json.load(open(f"./experiment_full.json"))
+    # number of worker processes for local execution, non-positive values use all cores
+    num_workers = experiment_settings.get("LOCAL_NUM_WORKERS", 0)
+    data_format = experiment_settings.get("DATA_FORMAT", DATA_FORMAT)
+    # size limit of the artifact cache for models and predictions, empty to disable the cache
+    cache_size = experiment_settings.get("ARTIFACT_CACHE_SIZE", "")
+    if parse_size(cache_size) is not None and bool(experiment_settings.get("FUSED_EXECUTION", 0)):
+        print("Warning: ARTIFACT_CACHE_SIZE is ignored with fused execution, which fits, predicts and evaluates a fold "
+              "in memory.")
+    # prune in chunks of this many rows with approximate quantiles, 0 prunes the whole data set in memory
+    prune_chunk_size = experiment_settings.get("PRUNE_CHUNK_SIZE", 0)
+    # store scaled features that the models do not read as float32, which changes the pruning
+    compact_floats = experiment_settings.get("COMPACT_FLOATS", 0)
+    # number of shuffle seeds drawn per splitting outside of reproducibility mode
+    shuffle_seed_count = experiment_settings.get("SHUFFLE_SEED_COUNT", 1)
+    # a seed count turns the random seeding into a sweep over that many seeds
+    ML_seeding = expand_ML_seeding(experiment_settings["ML_SEEDING"], experiment_settings.get("ML_SEED_COUNT", 0))
+    if bool(pipeline):
+        execute_pipeline(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
+                         experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
+                         experiment_settings["MLMODELS"], ML_seeding, experiment_settings["REPRODUCIBILITY_MODE"],
+                         experiment_settings["NUM_BATCHES"], experiment_settings["TOPN_SCORES"],
+                         experiment_settings.get("FUSED_EXECUTION", 0), experiment_settings.get("SAVE_MODELS", 0),
+                         experiment_settings.get("SAVE_PREDICTIONS", 0), data_format, cache_size, prune_chunk_size,
+                         shuffle_seed_count, compact_floats, num_workers)
+    elif stage == 0:
+        execute_clean_data(experiment_settings["DATA_SET_NAMES"], data_format, compact_floats, num_workers)
+    elif stage == 1:
+        execute_prune_data(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
+                           data_format, prune_chunk_size, num_workers)
+    elif stage == 2:
+        execute_generate_splits(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
+                                experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
+                                experiment_settings["REPRODUCIBILITY_MODE"], shuffle_seed_count, data_format,
+                                num_workers)
+    elif stage == 3 and bool(experiment_settings.get("FUSED_EXECUTION", 0)):
+        execute_fit_predict_evaluate(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
+                                     experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
+                                     experiment_settings["MLMODELS"], ML_seeding,
+                                     experiment_settings["REPRODUCIBILITY_MODE"], experiment_settings["NUM_BATCHES"],
+                                     experiment_settings["TOPN_SCORES"], experiment_settings.get("SAVE_MODELS", 0),
+                                     experiment_settings.get("SAVE_PREDICTIONS", 0), num_workers)
+    elif stage in [4, 5] and bool(experiment_settings.get("FUSED_EXECUTION", 0)):
+        print("Predicting and evaluating are part of stage 3 with fused execution.")
+    elif stage == 3:
+        execute_fit_ML(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
+                       experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
+                       experiment_settings["MLMODELS"], ML_seeding,
+                       experiment_settings["REPRODUCIBILITY_MODE"], cache_size, num_workers)
+    elif stage == 4:
+        execute_make_predictions(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
                                  experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
-                                 experiment_settings["MLMODELS"], experiment_settings["ML_SEEDING"],
-                                 experiment_settings["NUM_BATCHES"], experiment_settings["TOPN_SCORES"])
-elif stage == 6:
-    execute_evaluation_report(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
-                              experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
-                              experiment_settings["MLMODELS"], experiment_settings["ML_SEEDING"],
-                              experiment_settings["NUM_BATCHES"], experiment_settings["TOPN_SCORES"])
-elif stage == 7:
-    execute_plot_results()
-
-else:
-    print("No valid stage selected!")
+                                 experiment_settings["MLMODELS"], ML_seeding,
+                                 experiment_settings["NUM_BATCHES"], cache_size, num_workers)
+    elif stage == 5:
+        execute_evaluate_predictions(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
+                                     experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
+                                     experiment_settings["MLMODELS"], ML_seeding,
+                                     experiment_settings["NUM_BATCHES"], experiment_settings["TOPN_SCORES"],
+                                     num_workers)
+    elif stage == 6:
+        execute_evaluation_report(experiment_settings["DATA_SET_NAMES"], experiment_settings["PRUNE_TECHNIQUES"],
+                                  experiment_settings["SPLIT_TECHNIQUES"], experiment_settings["NUM_FOLDS"],
+                                  experiment_settings["MLMODELS"], ML_seeding,
+                                  experiment_settings["NUM_BATCHES"], experiment_settings["TOPN_SCORES"],
+                                  num_workers)
+    elif stage == 7:
+        execute_plot_results()
+
+    else:
+        print("No valid stage selected!")
@@ -1,47 +1,58 @@
 import argparse
 from pathlib import Path
-import binpickle
 import numpy as np
 import pandas as pd
 import pickle as pkl
 from static import *
+from data_io import read_split, split_path, split_base_path
+from artifact_cache import parse_size, connect_cache, artifact_key, fetch_artifact, store_artifact, stage_code_files
+from artifact_catalog import register_artifact
+from model_pool import load_model
+import ml_engines
+from telemetry import telemetry_job, telemetry_phase, telemetry_rows
 
 
-def make_predictions(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel,
-                     ML_seed, num_batches, run_batch):
-    # get test data
-    test_data_path = f"./{DATA_FOLDER}/{data_set_name}/{SPLIT_FOLDER}/" \
-                     f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_{SPLIT_FILE}"
-    test_data = pd.read_csv(test_data_path, header=0, sep=",")
-
-    # clean the data
-    for column in test_data.columns:
-        if test_data[column].dtype == 'object':
-            test_data[column] = pd.to_numeric(test_data[column], errors='coerce')
+def read_test_data(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed):
+    # get test data, splits are read from the typed split base
+    return read_split(data_set_name, prune_technique, split_technique, [test_fold], shuffle_seed)
+
+
+def clean_test_data(test_data):
     test_data.dropna(inplace=True)
+    return test_data
+
 
+def load_test_data(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed):
+    test_data = read_test_data(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed)
+    return clean_test_data(test_data)
+
+
+def predict_batches(ML_alg, test_data, num_batches, run_batches):
     users = test_data["X"].unique()
     user_batches = np.array_split(users, num_batches)
 
-    # load ML Model
-    base_path_ML = f"./{DATA_FOLDER}/{data_set_name}/{ML_FOLDER}_{MLModel}"
-    ML_file_path = f"{base_path_ML}/" \
-        f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_" \
-        f"{ML_seed}_{ML_FILE}"
-    ML_alg = binpickle.load(ML_file_path)
-
+    # the predictions do not depend on the user, so they are computed once and shared by all users of all batches
     X_test = test_data["X"].values.reshape(-1, 1)
-    y_test = test_data["y"]
+    test_predictions = ML_alg.predict(X_test)
+
+    return {run_batch: {user: test_predictions for user in user_batches[run_batch]} for run_batch in run_batches}
+
+
+def prediction_path(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                    num_batches, run_batch):
+    return f"./{DATA_FOLDER}/{data_set_name}/{PREDICTION_FOLDER}_{MLModel}/" \
+           f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_" \
+           f"{ML_seed}_{num_batches}_{run_batch}_{PREDICTION_FILE}"
 
-    MLPredictions = {user: ML_alg.predict(X_test) for user in user_batches[run_batch]}
 
+def save_predictions(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                     num_batches, run_batch, MLPredictions):
     # save predictions to file
     base_path_predictions = f"./{DATA_FOLDER}/{data_set_name}/{PREDICTION_FOLDER}_{MLModel}"
     Path(base_path_predictions).mkdir(parents=True, exist_ok=True)
 
-    prediction_file_path = f"{base_path_predictions}/" \
-                           f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_" \
-                           f"{ML_seed}_{num_batches}_{run_batch}_{PREDICTION_FILE}"
+    prediction_file_path = prediction_path(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed,
+                                           MLModel, ML_seed, num_batches, run_batch)
     # Check if the prediction file already exists to avoid overwriting
     if not Path(prediction_file_path).exists():
         with open(prediction_file_path, "wb") as f:
@@ -49,6 +60,66 @@ def make_predictions(data_set_name, prune_technique, split_technique, test_fold,
         print(f"Predictions generated and saved: {prediction_file_path}")
     else:
         print(f"Predictions already exist: {prediction_file_path}")
+    register_artifact("predictions", prediction_file_path, data_set_name, prune_technique, split_technique, test_fold,
+                      shuffle_seed, MLModel, ML_seed, num_batches, run_batch)
+
+
+@telemetry_job
+def make_predictions(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel,
+                     ML_seed, num_batches, run_batch, cache_size=""):
+    # a run batch of -1 predicts once and writes the predictions of all batches
+    if run_batch == -1:
+        run_batches = list(range(num_batches))
+    else:
+        run_batches = [run_batch]
+
+    base_path_ML = f"./{DATA_FOLDER}/{data_set_name}/{ML_FOLDER}_{MLModel}"
+    ML_file_path = f"{base_path_ML}/" \
+        f"{test_fold}_{shuffle_seed}_{prune_technique}_{split_technique}_" \
+        f"{ML_seed}_{ML_FILE}"
+
+    # look up predictions of an identical model on identical test data, an empty cache size disables the cache
+    cache_limit = parse_size(cache_size)
+    if cache_limit is not None:
+        connection = connect_cache()
+        test_data_paths = [split_base_path(data_set_name, prune_technique),
+                           split_path(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed)]
+        # the model is unpickled with the engine classes, whose code makes the predictions
+        code_files = stage_code_files(__file__, ml_engines.__file__)
+        cache_keys = {batch: artifact_key(connection, "make_predictions",
+                                          {"num_batches": num_batches, "run_batch": batch},
+                                          [ML_file_path] + test_data_paths, code_files) for batch in run_batches}
+        cached_batches = [batch for batch in run_batches if fetch_artifact(
+            connection, cache_keys[batch], prediction_path(data_set_name, prune_technique, split_technique,
+                                                           test_fold, shuffle_seed, MLModel, ML_seed, num_batches,
+                                                           batch))]
+        for batch in cached_batches:
+            register_artifact("predictions", prediction_path(data_set_name, prune_technique, split_technique,
+                                                             test_fold, shuffle_seed, MLModel, ML_seed, num_batches,
+                                                             batch), data_set_name, prune_technique, split_technique,
+                              test_fold, shuffle_seed, MLModel, ML_seed, num_batches, batch)
+        run_batches = [batch for batch in run_batches if batch not in cached_batches]
+        if len(run_batches) == 0:
+            return
+
+    with telemetry_phase("load"):
+        test_data = load_test_data(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed)
+
+        # load ML Model from the model pool of this worker
+        ML_alg = load_model(ML_file_path)
+    telemetry_rows("load", len(test_data))
+
+    with telemetry_phase("compute"):
+        batch_predictions = predict_batches(ML_alg, test_data, num_batches, run_batches)
+    telemetry_rows("compute", len(test_data))
+    with telemetry_phase("save"):
+        for batch, MLPredictions in batch_predictions.items():
+            save_predictions(data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel,
+                             ML_seed, num_batches, batch, MLPredictions)
+            if cache_limit is not None:
+                store_artifact(connection, cache_keys[batch], prediction_path(
+                    data_set_name, prune_technique, split_technique, test_fold, shuffle_seed, MLModel, ML_seed,
+                    num_batches, batch), cache_limit)
 
     return
 
@@ -64,8 +135,10 @@ if __name__ == "__main__":
     parser.add_argument('--ML_seeding', dest='ML_seeding', type=str, required=True)
     parser.add_argument('--num_batches', dest='num_batches', type=int, required=True)
     parser.add_argument('--run_batch', dest='run_batch', type=int, required=True)
+    parser.add_argument('--cache_size', dest='cache_size', type=str, default="")
     args = parser.parse_args()
 
     print("Making predictions with arguments: ", args.__dict__)
     make_predictions(args.data_set_name, args.prune_technique, args.split_technique, args.test_fold,
-                     args.shuffle_seed, args.MLModel, args.ML_seeding, args.num_batches, args.run_batch)
+                     args.shuffle_seed, args.MLModel, args.ML_seeding, args.num_batches, args.run_batch,
+                     args.cache_size)
@@ -0,0 +1,240 @@
+import numpy as np
+from sklearn.linear_model import LinearRegression
+from sklearn.neighbors import KNeighborsRegressor
+
+# the models of the experiments have a single feature, for which these engines fit and predict the same models as
+# sklearn from a sorted feature, only differing in the rounding of sums
+
+# sklearn does not split between float32 feature values closer than this in float32 arithmetic, and stops splitting
+# nodes with a smaller impurity
+FEATURE_THRESHOLD = np.float32(1e-7)
+EPSILON = np.finfo(np.float64).eps
+
+
+class SortedKNNRegressor:
+    # k nearest neighbors by binary search in the sorted training feature
+
+    def __init__(self, n_neighbors=5):
+        self.n_neighbors = n_neighbors
+
+    def fit(self, X, y):
+        # the sklearn model for ties is fitted on the feature in its own type, as sklearn computes distances of integer
+        # and float32 features differently
+        self.X_dtype_ = np.asarray(X).dtype
+        X = np.asarray(X, dtype=np.float64)[:, 0]
+        self.order_ = np.argsort(X, kind="stable")
+        self.sorted_X_ = X[self.order_]
+        self.sorted_y_ = np.asarray(y)[self.order_]
+        return self
+
+    def __getstate__(self):
+        # the sklearn model for ties is rebuilt when needed instead of stored
+        state = self.__dict__.copy()
+        state.pop("_tie_model", None)
+        return state
+
+    def tie_model(self):
+        # sklearn breaks ties between equally distant neighbors by the layout of its tree, which depends on the order
+        # of the training data, so ties are predicted by an sklearn model fitted on the data in its original order
+        if getattr(self, "_tie_model", None) is None:
+            X = np.empty_like(self.sorted_X_)
+            X[self.order_] = self.sorted_X_
+            y = np.empty_like(self.sorted_y_)
+            y[self.order_] = self.sorted_y_
+            self._tie_model = KNeighborsRegressor(n_neighbors=self.n_neighbors).fit(
+                X.astype(getattr(self, "X_dtype_", np.float64)).reshape(-1, 1), y)
+        return self._tie_model
+
+    def predict(self, X):
+        X_dtype = np.asarray(X).dtype
+        X = np.asarray(X, dtype=np.float64)[:, 0]
+        num_rows = len(self.sorted_X_)
+        k = self.n_neighbors
+        # sklearn searches small training sets by brute force, whose rounding of distances differs
+        if num_rows < 2 * k + 2:
+            return self.tie_model().predict(X.astype(X_dtype).reshape(-1, 1))
+
+        # equal features have equal neighbors, so every distinct feature is predicted once
+        queries, query_index = np.unique(X, return_inverse=True)
+        # the k + 1 nearest neighbors are among the k + 1 training rows on either side of the query
+        insert = np.searchsorted(self.sorted_X_, queries)
+        window = insert[:, None] + np.arange(-k - 1, k + 1)
+        in_range = (window >= 0) & (window < num_rows)
+        window = np.clip(window, 0, num_rows - 1)
+        # squared distances as computed by sklearn, stable sorting keeps the order of equal distances
+        distances = np.where(in_range, (self.sorted_X_[window] - queries[:, None]) ** 2, np.inf)
+        nearest = np.argsort(distances, axis=1, kind="stable")[:, :k + 1]
+        nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+        neighbors = np.take_along_axis(window, nearest[:, :k], axis=1)
+        predictions = np.mean(self.sorted_y_[neighbors], axis=1)
+
+        # the k nearest neighbors are only unique if the k-th neighbor is closer than the next one
+        tied = nearest_distances[:, k - 1] == nearest_distances[:, k]
+        if tied.any():
+            predictions[tied] = self.tie_model().predict(queries[tied].astype(X_dtype).reshape(-1, 1))
+        return predictions[query_index]
+
+
+def range_sums(array, starts, ends):
+    # the sums of array[start:end] for sorted, disjoint and non-empty ranges, each summed on its own
+    bounds = np.column_stack([starts, ends]).ravel()
+    return np.add.reduceat(np.append(array, 0), bounds)[::2]
+
+
+class SortedTreeRegressor:
+    # a squared error regression tree grown like sklearn's best splitter on the distinct sorted feature values, where
+    # all nodes of a depth are split at once by prefix sums over their values
+
+    def fit(self, X, y):
+        # sklearn fits trees on float32 features and float64 targets
+        X = np.asarray(X, dtype=np.float32)[:, 0]
+        y = np.asarray(y, dtype=np.float64)
+        values_float32, value_index = np.unique(X, return_inverse=True)
+        values = values_float32.astype(np.float64)
+        counts = np.bincount(value_index, minlength=len(values)).astype(np.float64)
+        sums = np.bincount(value_index, weights=y, minlength=len(values))
+        square_sums = np.bincount(value_index, weights=y * y, minlength=len(values))
+        num_rows = len(y)
+        # the split search is invariant to shifting the target, centered prefix sums lose less to rounding
+        count_prefix = np.concatenate([[0], np.cumsum(counts)])
+        centered_prefix = np.concatenate([[0], np.cumsum(sums - counts * y.mean())])
+
+        # nodes are ranges of distinct values, the impurity of the root is computed, of other nodes by their parent
+        starts, ends = np.array([0]), np.array([len(values)])
+        impurities = np.array([square_sums.sum() / num_rows - (sums.sum() / num_rows) ** 2])
+        leaf_starts, leaf_values, thresholds = [], [], []
+        while len(starts) > 0:
+            node_rows = range_sums(counts, starts, ends)
+            node_sums = range_sums(sums, starts, ends)
+            node_square_sums = range_sums(square_sums, starts, ends)
+            is_leaf = ((node_rows < 2) | (impurities <= EPSILON)
+                       | (values_float32[ends - 1] <= values_float32[starts] + FEATURE_THRESHOLD))
+
+            # the first split with the largest proxy improvement between values further apart than the threshold,
+            # over the flattened candidate splits of all nodes
+            split_nodes = np.flatnonzero(~is_leaf)
+            num_candidates = ends[split_nodes] - starts[split_nodes] - 1
+            offsets = np.concatenate([[0], np.cumsum(num_candidates)[:-1]])
+            candidate_node = np.repeat(np.arange(len(split_nodes)), num_candidates)
+            candidate_start = starts[split_nodes][candidate_node]
+            splits = candidate_start + np.arange(len(candidate_node)) - offsets[candidate_node] + 1
+            left_rows = count_prefix[splits] - count_prefix[candidate_start]
+            left_sums = centered_prefix[splits] - centered_prefix[candidate_start]
+            node_centered_sums = (centered_prefix[ends] - centered_prefix[starts])[split_nodes][candidate_node]
+            right_rows = node_rows[split_nodes][candidate_node] - left_rows
+            proxy_improvements = left_sums ** 2 / left_rows + (node_centered_sums - left_sums) ** 2 / right_rows
+            proxy_improvements[values_float32[splits] <= values_float32[splits - 1] + FEATURE_THRESHOLD] = -np.inf
+            best_splits = np.zeros(len(starts), dtype=np.int64)
+            if len(split_nodes) > 0:
+                best_proxy_improvements = np.maximum.reduceat(proxy_improvements, offsets)
+                best = proxy_improvements == best_proxy_improvements[candidate_node]
+                best_splits[split_nodes] = splits[np.minimum.reduceat(
+                    np.where(best, np.arange(len(candidate_node)), len(candidate_node)), offsets)]
+                # a node whose values are all closer than the threshold to their neighbors has no split
+                is_leaf[split_nodes[best_proxy_improvements == -np.inf]] = True
+
+            # the children impurities and the improvement of the splits as sklearn computes them
+            split_starts = np.where(is_leaf, starts, best_splits)
+            left_rows = range_sums(counts, starts, np.maximum(split_starts, starts + 1))
+            left_sums = range_sums(sums, starts, np.maximum(split_starts, starts + 1))
+            left_square_sums = range_sums(square_sums, starts, np.maximum(split_starts, starts + 1))
+            right_rows = np.maximum(node_rows - left_rows, 1)
+            left_impurities = left_square_sums / left_rows - (left_sums / left_rows) ** 2
+            right_impurities = ((node_square_sums - left_square_sums) / right_rows
+                                - ((node_sums - left_sums) / right_rows) ** 2)
+            improvements = node_rows / num_rows * (impurities - right_rows / node_rows * right_impurities
+                                                   - left_rows / node_rows * left_impurities)
+            is_leaf |= improvements + EPSILON < 0
+
+            leaf_starts.append(starts[is_leaf])
+            leaf_values.append(node_sums[is_leaf] / node_rows[is_leaf])
+            split_starts = split_starts[~is_leaf]
+            node_thresholds = values[split_starts - 1] / 2.0 + values[split_starts] / 2.0
+            at_value = (node_thresholds == values[split_starts]) | np.isinf(node_thresholds)
+            thresholds.append(np.where(at_value, values[split_starts - 1], node_thresholds))
+            # the children stay sorted by their start, so the range sums only pass over the values once
+            starts = np.column_stack([starts[~is_leaf], split_starts]).ravel()
+            ends = np.column_stack([split_starts, ends[~is_leaf]]).ravel()
+            impurities = np.column_stack([left_impurities[~is_leaf], right_impurities[~is_leaf]]).ravel()
+
+        # in one dimension the leaves are intervals between the sorted thresholds
+        self.thresholds_ = np.sort(np.concatenate(thresholds))
+        self.leaf_values_ = np.concatenate(leaf_values)[np.argsort(np.concatenate(leaf_starts))]
+        return self
+
+    def predict(self, X):
+        # a row goes left if its float32 feature is at most the threshold
+        X = np.asarray(X, dtype=np.float32)[:, 0].astype(np.float64)
+        return self.leaf_values_[np.searchsorted(self.thresholds_, X, side="left")]
+
+
+def feature_type(X):
+    # sklearn keeps float32 features for linear models and fits everything else in float64
+    return np.float32 if np.asarray(X).dtype == np.float32 else np.float64
+
+
+def linear_statistics(X, y):
+    # the number of rows, the means, and the centered sums of squares and products of a single feature and the target
+    X = np.asarray(X, dtype=np.float64)[:, 0]
+    y = np.asarray(y, dtype=np.float64)
+    if len(X) == 0:
+        return 0, 0.0, 0.0, 0.0, 0.0
+    X_mean = X.mean()
+    y_mean = y.mean()
+    return len(X), X_mean, y_mean, ((X - X_mean) ** 2).sum(), ((X - X_mean) * (y - y_mean)).sum()
+
+
+def merge_linear_statistics(statistics, other_statistics):
+    # the statistics of two disjoint parts of the data combined by the pairwise update of Chan et al., which avoids
+    # the cancellation of subtracting raw sums
+    num_rows, X_mean, y_mean, X_square_sum, Xy_sum = statistics
+    other_rows, other_X_mean, other_y_mean, other_X_square_sum, other_Xy_sum = other_statistics
+    if num_rows == 0 or other_rows == 0:
+        return other_statistics if num_rows == 0 else statistics
+    merged_rows = num_rows + other_rows
+    X_delta = other_X_mean - X_mean
+    y_delta = other_y_mean - y_mean
+    return (merged_rows, X_mean + X_delta * other_rows / merged_rows, y_mean + y_delta * other_rows / merged_rows,
+            X_square_sum + other_X_square_sum + X_delta * X_delta * num_rows * other_rows / merged_rows,
+            Xy_sum + other_Xy_sum + X_delta * y_delta * num_rows * other_rows / merged_rows)
+
+
+class ClosedFormLinearRegression:
+    # ordinary least squares of a single centered feature
+
+    def fit_statistics(self, statistics, dtype=np.float64):
+        # the same model from the linear statistics of the training data
+        num_rows, X_mean, y_mean, X_square_sum, Xy_sum = statistics
+        self.constant_model_ = None
+        self.dtype_ = dtype
+        coef = Xy_sum / X_square_sum if X_square_sum > 0 else 0.0
+        self.coef_ = dtype(coef)
+        self.intercept_ = dtype(y_mean - X_mean * coef)
+        return self
+
+    def fit(self, X, y):
+        # the slope sklearn fits to a constant feature comes from the rounding of its centering, so a constant feature
+        # is fitted by sklearn itself
+        self.constant_model_ = None
+        if np.ptp(np.asarray(X)[:, 0]) == 0:
+            self.constant_model_ = LinearRegression().fit(X, y)
+            return self
+
+        # sklearn casts the target to the feature type
+        X = np.asarray(X)[:, 0]
+        self.dtype_ = feature_type(X)
+        X = X.astype(self.dtype_)
+        y = np.asarray(y).astype(self.dtype_)
+        X_mean = X.mean()
+        y_mean = y.mean()
+        X_centered = X - X_mean
+        X_square_sum = X_centered @ X_centered
+        # a constant feature has the minimum norm solution without slope
+        self.coef_ = (X_centered @ (y - y_mean)) / X_square_sum if X_square_sum > 0 else self.dtype_(0)
+        self.intercept_ = y_mean - X_mean * self.coef_
+        return self
+
+    def predict(self, X):
+        if getattr(self, "constant_model_", None) is not None:
+            return self.constant_model_.predict(X)
+        return np.asarray(X)[:, 0].astype(self.dtype_) * self.coef_ + self.intercept_
@@ -0,0 +1,27 @@
+from collections import OrderedDict
+from pathlib import Path
+import binpickle
+from static import *
+
+# the models loaded by this process, least recently used first, as (path, modification time) -> model
+_model_pool = OrderedDict()
+
+
+def load_model(ML_file_path, pool_size=MODEL_POOL_SIZE):
+    # the model arrays are memory-mapped from the model file instead of copied, so processes that load the same model
+    # share its pages, and a worker keeps the last pool size models so that later jobs on them skip the loading
+    pool_key = (str(ML_file_path), Path(ML_file_path).stat().st_mtime_ns)
+    if pool_key in _model_pool:
+        _model_pool.move_to_end(pool_key)
+        return _model_pool[pool_key]
+
+    # a refitted model replaces the pooled one, the file is not closed as the mapping is released with the last
+    # reference to the model
+    for stale_key in [key for key in _model_pool if key[0] == pool_key[0]]:
+        del _model_pool[stale_key]
+    ML_alg = binpickle.BinPickleFile(ML_file_path, direct=True).load()
+    if pool_size > 0:
+        _model_pool[pool_key] = ML_alg
+        while len(_model_pool) > pool_size:
+            _model_pool.popitem(last=False)
+    return ML_alg
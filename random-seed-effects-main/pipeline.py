@@ -0,0 +1,198 @@
+import json
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from static import *
+from data_io import data_file
+from fit_ML import reproducibility_key, FOLD_STATISTICS_MODELS
+from generate_splits import convert_legacy_splits, draw_shuffle_seeds, existing_shuffle_seeds
+from artifact_catalog import connect_catalog, catalog_shuffle_seeds, catalog_artifacts
+from stage_runner import run_job, resolve_num_workers
+from task_pack import STAGE_FUNCTIONS
+
+
+def pipeline_tasks(data_set_names, prune_techniques, split_techniques, num_folds, MLModels, ML_seeding,
+                   reproducibility_mode, num_batches, topn_scores, fused_execution, persist_models,
+                   persist_predictions, data_format, cache_size, fitting_cores, prune_chunk_size=0,
+                   shuffle_seed_count=1, compact_floats=0):
+    # all missing tasks of stages 0 to 5 in an order where every task comes after the tasks it depends on, as
+    # task id -> (stage, stage function name, arguments, ids of the tasks it depends on)
+    topn_scores_string = '-'.join([str(x) for x in topn_scores])
+    seeds = json.loads(open(f"project_seeds.txt", "r").read()) if bool(reproducibility_mode) else {}
+    connection = connect_catalog()
+    tasks = {}
+
+    def add_task(task_id, stage, function_name, job, dependencies):
+        # tasks whose output already exists are not part of the graph, so nothing has to wait for them
+        tasks[task_id] = (stage, function_name, job, [dependency for dependency in dependencies if dependency in tasks])
+
+    for data_set_name in data_set_names:
+        clean_id = f"clean_{data_set_name}"
+        if not Path(f"./{DATA_FOLDER}/{data_set_name}/{CLEAN_FOLDER}/{data_file(CLEAN_FILE, data_format)}").exists():
+            add_task(clean_id, 0, "clean_data", [data_set_name, data_format, CLEAN_CHUNK_SIZE, compact_floats], [])
+        # the missing prune techniques of a data set are one task, so the cleaned data is read once
+        prune_id = f"prune_{data_set_name}"
+        missing_techniques = [prune_technique for prune_technique in prune_techniques if not Path(
+            f"./{DATA_FOLDER}/{data_set_name}/{PRUNE_FOLDER}/{prune_technique}_{data_file(PRUNE_FILE, data_format)}"
+        ).exists()]
+        if len(missing_techniques) > 0:
+            add_task(prune_id, 1, "prune_data", [data_set_name, missing_techniques, data_format, prune_chunk_size],
+                     [clean_id])
+        for prune_technique in prune_techniques:
+            for split_technique in split_techniques:
+                convert_legacy_splits(data_set_name, prune_technique, split_technique, data_format)
+                # the shuffle seeds have to be known before splitting, so that later tasks know their input files
+                if bool(reproducibility_mode):
+                    shuffle_seeds = list(seeds[data_set_name].keys())
+                else:
+                    shuffle_seeds = catalog_shuffle_seeds(connection, data_set_name, prune_technique, split_technique)
+                    if len(shuffle_seeds) == 0:
+                        shuffle_seeds = [str(shuffle_seed) for shuffle_seed in draw_shuffle_seeds(
+                            shuffle_seed_count, existing_shuffle_seeds(data_set_name, prune_technique,
+                                                                       split_technique))]
+                existing_splits = catalog_artifacts(connection, "split", data_set_name, prune_technique,
+                                                    split_technique)
+                existing_models = catalog_artifacts(connection, "ml", data_set_name, prune_technique,
+                                                    split_technique)
+                existing_predictions = catalog_artifacts(connection, "predictions", data_set_name, prune_technique,
+                                                         split_technique)
+                existing_evaluations = catalog_artifacts(connection, "evaluations", data_set_name, prune_technique,
+                                                         split_technique)
+                # the missing shuffle seeds of a splitting are one task, which shuffles them all from one base
+                split_id = f"split_{data_set_name}_{prune_technique}_{split_technique}"
+                missing_seeds = [int(shuffle_seed) for shuffle_seed in shuffle_seeds if any(
+                    (test_fold, shuffle_seed, None, None, None, None) not in existing_splits
+                    for test_fold in range(num_folds))]
+                if len(missing_seeds) > 0:
+                    add_task(split_id, 2, "generate_splits_seeds",
+                             [data_set_name, prune_technique, split_technique, num_folds, missing_seeds,
+                              fitting_cores, data_format], [prune_id])
+                for shuffle_seed in shuffle_seeds:
+                    run_id = f"{data_set_name}_{prune_technique}_{split_technique}_{shuffle_seed}"
+                    for MLModel in MLModels:
+                        fold_seeds = {}
+                        for test_fold in range(num_folds):
+                            # evaluated seeds need no fitting, the other seeds of a fold are fitted together
+                            missing_seeds = []
+                            fit_seeds = []
+                            reproducibility_seeds = []
+                            for ML_seed in ML_seeding:
+                                if (test_fold, shuffle_seed, MLModel, ML_seed, num_batches,
+                                        topn_scores_string) in existing_evaluations:
+                                    continue
+                                if bool(reproducibility_mode):
+                                    try:
+                                        reproducibility_seed = int(seeds[data_set_name][shuffle_seed][MLModel][
+                                                                       reproducibility_key(test_fold, ML_seed)])
+                                    except KeyError:
+                                        print(f"Key not found for data_set_name: {data_set_name}, shuffle_seed: {shuffle_seed}, MLModel: {MLModel}, test_fold: {test_fold}, ML_seed: {ML_seed}")
+                                        continue
+                                else:
+                                    reproducibility_seed = -1
+                                if bool(fused_execution):
+                                    add_task(f"fused_{run_id}_{MLModel}_{ML_seed}_{test_fold}", 3,
+                                             "fit_predict_evaluate",
+                                             [data_set_name, prune_technique, split_technique, num_folds, test_fold,
+                                              int(shuffle_seed), MLModel, ML_seed, reproducibility_seed, num_batches,
+                                              topn_scores, persist_models, persist_predictions],
+                                             [split_id])
+                                    continue
+                                missing_seeds.append(ML_seed)
+                                if (test_fold, shuffle_seed, MLModel, ML_seed, None, None) not in existing_models:
+                                    fit_seeds.append(ML_seed)
+                                    reproducibility_seeds.append(reproducibility_seed)
+                            if len(missing_seeds) > 0:
+                                fold_seeds[test_fold] = (missing_seeds, fit_seeds, reproducibility_seeds)
+
+                        # the models of all folds are fitted by one task that reads every fold once
+                        fold_statistics = MLModel in FOLD_STATISTICS_MODELS
+                        fold_models = [(test_fold, ML_seed, reproducibility_seed) for test_fold, (
+                            _, fit_seeds, reproducibility_seeds) in fold_seeds.items() for ML_seed,
+                            reproducibility_seed in zip(fit_seeds, reproducibility_seeds)]
+                        if fold_statistics and len(fold_models) > 0:
+                            add_task(f"fit_{run_id}_{MLModel}", 3, "fit_ML_folds",
+                                     [data_set_name, prune_technique, split_technique, num_folds,
+                                      [model[0] for model in fold_models], int(shuffle_seed), MLModel,
+                                      [model[1] for model in fold_models], [model[2] for model in fold_models],
+                                      cache_size], [split_id])
+
+                        for test_fold, (missing_seeds, fit_seeds, reproducibility_seeds) in fold_seeds.items():
+                            fit_id = f"fit_{run_id}_{MLModel}_{test_fold}"
+                            if fold_statistics:
+                                fit_id = f"fit_{run_id}_{MLModel}"
+                            elif len(fit_seeds) == 1:
+                                add_task(fit_id, 3, "fit_ML",
+                                         [data_set_name, prune_technique, split_technique, num_folds, test_fold,
+                                          int(shuffle_seed), MLModel, fit_seeds[0], reproducibility_seeds[0],
+                                          cache_size], [split_id])
+                            elif len(fit_seeds) > 1:
+                                add_task(fit_id, 3, "fit_ML_seeds",
+                                         [data_set_name, prune_technique, split_technique, num_folds, test_fold,
+                                          int(shuffle_seed), MLModel, fit_seeds, reproducibility_seeds,
+                                          fitting_cores, cache_size], [split_id])
+
+                            for ML_seed in missing_seeds:
+                                seed_id = f"{run_id}_{MLModel}_{ML_seed}_{test_fold}"
+                                missing_batches = [run_batch for run_batch in range(num_batches) if (
+                                    test_fold, shuffle_seed, MLModel, ML_seed, num_batches,
+                                    str(run_batch)) not in existing_predictions]
+                                if len(missing_batches) > 1:
+                                    missing_batches = [-1]
+                                for run_batch in missing_batches:
+                                    add_task(f"predict_{seed_id}_{run_batch}", 4, "make_predictions",
+                                             [data_set_name, prune_technique, split_technique, test_fold,
+                                              int(shuffle_seed), MLModel, ML_seed, num_batches, run_batch,
+                                              cache_size], [fit_id])
+                                add_task(f"evaluate_{seed_id}", 5, "evaluate_predictions",
+                                         [data_set_name, prune_technique, split_technique, test_fold,
+                                          int(shuffle_seed), MLModel, ML_seed, num_batches, topn_scores],
+                                         [f"predict_{seed_id}_{run_batch}" for run_batch in missing_batches])
+    connection.close()
+    return tasks
+
+
+def run_pipeline(tasks, num_workers):
+    # run every task as soon as all tasks it depends on succeeded, tasks depending on a failed task are skipped
+    num_workers = resolve_num_workers(num_workers)
+    print(f"Running pipeline of {len(tasks)} tasks with {num_workers} workers.")
+    waiting_for = {task_id: set(task[3]) for task_id, task in tasks.items()}
+    dependents = {task_id: [] for task_id in tasks}
+    for task_id, task in tasks.items():
+        for dependency in task[3]:
+            dependents[dependency].append(task_id)
+
+    failed_tasks = []
+    skipped_tasks = []
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        def submit(task_id):
+            _, function_name, job, _ = tasks[task_id]
+            return executor.submit(run_job, STAGE_FUNCTIONS[function_name], job)
+
+        running = {submit(task_id): task_id for task_id in tasks if len(waiting_for[task_id]) == 0}
+        while len(running) > 0:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task_id = running.pop(future)
+                try:
+                    error = future.result()
+                except Exception:
+                    error = traceback.format_exc()
+                if error is not None:
+                    print(f"Task {task_id} failed:\n{error}")
+                    failed_tasks.append(task_id)
+                    # everything downstream of a failed task can not run
+                    blocked = list(dependents[task_id])
+                    while len(blocked) > 0:
+                        blocked_id = blocked.pop()
+                        if blocked_id not in skipped_tasks:
+                            skipped_tasks.append(blocked_id)
+                            blocked += dependents[blocked_id]
+                    continue
+                for dependent in dependents[task_id]:
+                    waiting_for[dependent].discard(task_id)
+                    if len(waiting_for[dependent]) == 0 and dependent not in skipped_tasks:
+                        running[submit(dependent)] = dependent
+
+    print(f"Finished pipeline: {len(tasks) - len(failed_tasks) - len(skipped_tasks)} succeeded, "
+          f"{len(failed_tasks)} failed, {len(skipped_tasks)} skipped.")
+    return failed_tasks
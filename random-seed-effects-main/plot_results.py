@@ -3,143 +3,66 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 from matplotlib import pyplot as plt
-import pickle as pkl
 from scipy.stats import wilcoxon
+from evaluation_report import load_evaluation_report
+
+
+def plot_table(results, topn_limiter):
+    # build the long plotting table with holdout and cross-validation metrics per seed combination
+    run_keys = ["data_set_name", "prune_technique", "split_technique", "recommender", "recommender_seed",
+                "shuffle_seed"]
+    results = results[results["topn_score"].isin(topn_limiter)]
+    fold_results = results.groupby(run_keys + ["test_fold", "topn_score"], sort=False,
+                                   observed=True)[["mae", "rmse"]].mean().reset_index()
+
+    # the holdout result is the one of the last fold of a run, which does not depend on the order of the report rows
+    last_folds = results.groupby(run_keys, sort=False, observed=True)["test_fold"].max()
+    fold_results = fold_results.merge(last_folds.rename("holdout_fold").reset_index(), on=run_keys, sort=False)
+    holdout_results = fold_results[fold_results["test_fold"] == fold_results["holdout_fold"]]
+    holdout_results = holdout_results[run_keys + ["topn_score", "mae", "rmse"]].assign(validation_type="holdout")
+    cv_results = fold_results.groupby(run_keys + ["topn_score"], sort=False,
+                                      observed=True)[["mae", "rmse"]].mean().reset_index()
+    cv_results = cv_results.assign(validation_type="cross-validation")
+
+    table = pd.concat([holdout_results, cv_results], ignore_index=True)
+    table = table.rename(columns={"mae": "MAE", "rmse": "RMSE"})
+    table = table.melt(id_vars=run_keys + ["topn_score", "validation_type"], value_vars=["MAE", "RMSE"],
+                       var_name="metric", value_name="metric_value")
+
+    # normalize metric values within every data set, recommender seed, cutoff, validation and metric
+    metric_groups = table.groupby(["data_set_name", "prune_technique", "split_technique", "recommender",
+                                   "recommender_seed", "topn_score", "validation_type", "metric"],
+                                  sort=False, observed=True)["metric_value"]
+    min_val = metric_groups.transform("min")
+    max_val = metric_groups.transform("max")
+    mean_val = metric_groups.transform("mean")
+    table["metric_value_relative_min"] = ((table["metric_value"] / min_val) - 1) * 100
+    table["metric_value_relative_max"] = table["metric_value"] / max_val
+    table["metric_value_relative_mean"] = (table["metric_value"] / mean_val) * 100
+    table["metric_value_absolute_mean"] = abs(100 - ((table["metric_value"] / mean_val) * 100))
+    return table.rename(columns={'recommender_seed': "Training Seed", 'shuffle_seed': "Data Shuffle Seed",
+                                 'topn_score': "k", 'validation_type': "Validation",
+                                 'metric': "Metric", 'metric_value': "Metric Value",
+                                 "metric_value_relative_min": "Relative Metric Value (Min)",
+                                 "metric_value_relative_max": "Relative Metric Value (Max)",
+                                 "metric_value_relative_mean": "Relative Metric Value (Mean)",
+                                 "metric_value_absolute_mean": "Absolute Metric Value (Mean)"})
 
 
 def plot_results():
     Path("./plots").mkdir(exist_ok=True)
     topn_limiter = [1, 5, 10]
-    report = pkl.load(open("evaluation_report.pkl", "rb"))
-    plot_tables = {}
-
-    for data_set_name in report.keys():
-        for prune_technique in report[data_set_name].keys():
-            for split_technique in report[data_set_name][prune_technique].keys():
-                for recommender in report[data_set_name][prune_technique][split_technique].keys():
-                    plot_rows = []
-                    for recommender_seed in report[data_set_name][prune_technique][split_technique][recommender].keys():
-                        for shuffle_seed in report[data_set_name][prune_technique][split_technique][recommender][
-                                recommender_seed].keys():
-                            aggregated_results = {}
-                            for test_fold in \
-                                    report[data_set_name][prune_technique][split_technique][recommender][
-                                        recommender_seed][shuffle_seed].keys():
-                                for run_batch in \
-                                        report[data_set_name][prune_technique][split_technique][recommender][
-                                            recommender_seed][shuffle_seed][test_fold].keys():
-                                    for topn_score in \
-                                            report[data_set_name][prune_technique][split_technique][recommender][
-                                                recommender_seed][shuffle_seed][test_fold][run_batch].keys():
-                                        if topn_score in topn_limiter:
-                                            if test_fold not in aggregated_results:
-                                                aggregated_results[test_fold] = {}
-                                            if topn_score not in aggregated_results[test_fold]:
-                                                aggregated_results[test_fold][topn_score] = []
-                                            aggregated_results[test_fold][topn_score].append(
-                                                report[data_set_name][prune_technique][split_technique][recommender][
-                                                    recommender_seed][shuffle_seed][test_fold][run_batch][topn_score])
-                            for test_fold in aggregated_results.keys():
-                                for topn_score in aggregated_results[test_fold].keys():
-                                    aggregated_results[test_fold][topn_score] = pd.DataFrame(
-                                        aggregated_results[test_fold][topn_score])
-                            print(aggregated_results)
-                            topn_scores = list(aggregated_results[test_fold].keys())
-                            # go through entries and create plotting table
-                            for topn_score in topn_scores:
-                                holdout_mae = aggregated_results[test_fold][topn_score]["mae"].mean()
-                                holdout_rmse = aggregated_results[test_fold][topn_score]["rmse"].mean()
-                                cv_mae = np.array(
-                                    [aggregated_results[fold][topn_score]["mae"].mean() for fold in
-                                     aggregated_results.keys()]).mean()
-                                cv_rmse = np.array([aggregated_results[fold][topn_score]["rmse"].mean() for fold in
-                                                    aggregated_results.keys()]).mean()
-                                new_row = {"recommender_seed": recommender_seed, "shuffle_seed": shuffle_seed,
-                                           "topn_score": topn_score, "validation_type": "holdout",
-                                           "metric": "MAE", "metric_value": holdout_mae}
-                                plot_rows.append(new_row)
-                                new_row = {"recommender_seed": recommender_seed, "shuffle_seed": shuffle_seed,
-                                           "topn_score": topn_score, "validation_type": "holdout",
-                                           "metric": "RMSE", "metric_value": holdout_rmse}
-                                plot_rows.append(new_row)
-                                new_row = {"recommender_seed": recommender_seed, "shuffle_seed": shuffle_seed,
-                                           "topn_score": topn_score, "validation_type": "cross-validation",
-                                           "metric": "MAE", "metric_value": cv_mae}
-                                plot_rows.append(new_row)
-                                new_row = {"recommender_seed": recommender_seed, "shuffle_seed": shuffle_seed,
-                                           "topn_score": topn_score, "validation_type": "cross-validation",
-                                           "metric": "RMSE", "metric_value": cv_rmse}
-                                plot_rows.append(new_row)
-                    plot_table = pd.DataFrame(plot_rows)
-                    # normalize metric values
-                    for recommender_seed in plot_table["recommender_seed"].unique():
-                        for k in plot_table["topn_score"].unique():
-                            for validation in plot_table["validation_type"].unique():
-                                for metric in plot_table["metric"].unique():
-                                    metric_vals = \
-                                        plot_table[(plot_table["recommender_seed"] == recommender_seed) &
-                                                   (plot_table["topn_score"] == k) &
-                                                   (plot_table["validation_type"] == validation) &
-                                                   (plot_table["metric"] == metric)]["metric_value"]
-                                    min_val = metric_vals.min()
-                                    max_val = metric_vals.max()
-                                    mean_val = metric_vals.mean()
-                                    plot_table.loc[
-                                        (plot_table["recommender_seed"] == recommender_seed) &
-                                        (plot_table["topn_score"] == k) &
-                                        (plot_table["validation_type"] == validation) &
-                                        (plot_table["metric"] == metric),
-                                        "metric_value_relative_min"] = ((metric_vals / min_val) - 1) * 100
-                                    plot_table.loc[
-                                        (plot_table["recommender_seed"] == recommender_seed) &
-                                        (plot_table["topn_score"] == k) &
-                                        (plot_table["validation_type"] == validation) &
-                                        (plot_table["metric"] == metric),
-                                        "metric_value_relative_max"] = metric_vals / max_val
-                                    plot_table.loc[
-                                        (plot_table["recommender_seed"] == recommender_seed) &
-                                        (plot_table["topn_score"] == k) &
-                                        (plot_table["validation_type"] == validation) &
-                                        (plot_table["metric"] == metric),
-                                        "metric_value_relative_mean"] = (metric_vals / mean_val) * 100
-                                    plot_table.loc[
-                                        (plot_table["recommender_seed"] == recommender_seed) &
-                                        (plot_table["topn_score"] == k) &
-                                        (plot_table["validation_type"] == validation) &
-                                        (plot_table["metric"] == metric),
-                                        "metric_value_absolute_mean"] = abs(100 - ((metric_vals / mean_val) * 100))
-                    plot_table.rename(columns={'recommender_seed': "Training Seed", 'shuffle_seed': "Data Shuffle Seed",
-                                               'topn_score': "k", 'validation_type': "Validation",
-                                               'metric': "Metric", 'metric_value': "Metric Value",
-                                               "metric_value_relative_min": "Relative Metric Value (Min)",
-                                               "metric_value_relative_max": "Relative Metric Value (Max)",
-                                               "metric_value_relative_mean": "Relative Metric Value (Mean)",
-                                               "metric_value_absolute_mean": "Absolute Metric Value (Mean)"},
-                                      inplace=True)
-                    if data_set_name not in plot_tables:
-                        plot_tables[data_set_name] = {}
-                    if prune_technique not in plot_tables[data_set_name]:
-                        plot_tables[data_set_name][prune_technique] = {}
-                    if split_technique not in plot_tables[data_set_name][prune_technique]:
-                        plot_tables[data_set_name][prune_technique][split_technique] = {}
-                    if recommender not in plot_tables[data_set_name][prune_technique][split_technique]:
-                        plot_tables[data_set_name][prune_technique][split_technique][recommender] = plot_table
+    results = load_evaluation_report(filters=[("topn_score", "in", topn_limiter)])
+    table = plot_table(results, topn_limiter)
 
     aggregated_results = {}
-    for data_set_name in plot_tables.keys():
-        for prune_technique in plot_tables[data_set_name].keys():
-            if prune_technique not in aggregated_results:
-                aggregated_results[prune_technique] = {}
-            for split_technique in plot_tables[data_set_name][prune_technique].keys():
-                if split_technique not in aggregated_results[prune_technique]:
-                    aggregated_results[prune_technique][split_technique] = {}
-                for recommender in plot_tables[data_set_name][prune_technique][split_technique].keys():
-                    if recommender not in aggregated_results[prune_technique][split_technique]:
-                        aggregated_results[prune_technique][split_technique][recommender] = pd.DataFrame()
-                    aggregated_results[prune_technique][split_technique][recommender] = pd.concat(
-                        [aggregated_results[prune_technique][split_technique][recommender],
-                         plot_tables[data_set_name][prune_technique][split_technique][recommender]],
-                        ignore_index=True)
+    for (prune_technique, split_technique, recommender), relevant_data in table.groupby(
+            ["prune_technique", "split_technique", "recommender"], sort=False, observed=True):
+        if prune_technique not in aggregated_results:
+            aggregated_results[prune_technique] = {}
+        if split_technique not in aggregated_results[prune_technique]:
+            aggregated_results[prune_technique][split_technique] = {}
+        aggregated_results[prune_technique][split_technique][recommender] = relevant_data.reset_index(drop=True)
 
     for prune_technique in aggregated_results.keys():
         for split_technique in aggregated_results[prune_technique].keys():
@@ -1,46 +1,188 @@
 import argparse
 from collections import Counter
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from static import *
+from data_io import data_file, data_schema, read_data, write_data, common_type, read_data_chunks, open_data_writer, \
+    write_data_chunk, close_data_writer
+from telemetry import telemetry_job, telemetry_phase, telemetry_rows
 
 
-def prune_data(data_set_name, prune_technique):
-    # load the data
-    data = pd.read_csv(f"./{DATA_FOLDER}/{data_set_name}/{CLEAN_FOLDER}/{CLEAN_FILE}", header=0, sep=",")
-    if prune_technique == "remove-outliers":
-        # apply outlier removal using IQR
-        Q1 = data.quantile(0.25)
-        Q3 = data.quantile(0.75)
+def outlier_mask(data):
+    # IQR bounds per column, combined into one mask of the rows without an outlier in any column
+    keep = np.ones(len(data), dtype=bool)
+    for column in data.columns:
+        Q1, Q3 = data[column].quantile([0.25, 0.75])
         IQR = Q3 - Q1
-        data = data[~((data < (Q1 - 1.5 * IQR)) | (data > (Q3 + 1.5 * IQR))).any(axis=1)]
-    elif prune_technique == "remove-duplicates":
-        # remove duplicate rows
-        data.drop_duplicates(inplace=True)
-        data.dropna()
+        # float32 columns are compared in float64, so values on a bound are treated the same as in the whole frame
+        values = data[column].to_numpy(dtype=np.float64)
+        keep &= ~((values < (Q1 - 1.5 * IQR)) | (values > (Q3 + 1.5 * IQR)))
+    return keep
 
-    elif prune_technique == "none":
-        # apply no pruning
-        pass
-    else:
-        raise ValueError("Prune technique not recognized.")
 
-    print(f"Pruned data with technique: {prune_technique}.")
+def duplicate_mask(data):
+    # rows are compared by hash, rows that share a hash are compared by value, so a hash collision never removes a row
+    row_hashes = pd.util.hash_pandas_object(data, index=False)
+    duplicated = row_hashes.duplicated().values
+    if duplicated.any():
+        shared = row_hashes.isin(row_hashes[duplicated]).values
+        duplicated[shared] = data[shared].duplicated().values
+    return ~duplicated
+
+
+def sketch_update(levels, values, rng):
+    # a mergeable quantile sketch: level i holds sorted samples that each stand for 2^i values, a full level is
+    # compacted by keeping every other value from a random start and moving them one level up
+    values = values[~np.isnan(values)]
+    if len(levels) == 0:
+        levels.append(np.empty(0))
+    levels[0] = np.concatenate([levels[0], values])
+    level = 0
+    while level < len(levels):
+        if len(levels[level]) > QUANTILE_SKETCH_SIZE:
+            items = np.sort(levels[level])
+            num_compacted = len(items) - len(items) % 2
+            if level + 1 == len(levels):
+                levels.append(np.empty(0))
+            levels[level + 1] = np.concatenate([levels[level + 1], items[rng.integers(2):num_compacted:2]])
+            levels[level] = items[num_compacted:]
+        level += 1
+
+
+def sketch_quantiles(levels, quantiles):
+    # without compaction the sketch holds all values, so the quantiles are exact and interpolated like pandas
+    if len(levels) == 0 or sum(len(items) for items in levels) == 0:
+        return [np.nan] * len(quantiles)
+    if len(levels) == 1:
+        return np.quantile(levels[0], quantiles)
+    items = np.concatenate(levels)
+    weights = np.concatenate([np.full(len(level_items), 2 ** level) for level, level_items in enumerate(levels)])
+    order = np.argsort(items, kind="stable")
+    ranks = np.cumsum(weights[order])
+    positions = np.searchsorted(ranks, np.asarray(quantiles) * (ranks[-1] - 1), side="right")
+    return items[order][np.minimum(positions, len(items) - 1)]
+
+
+def unseen_rows(seen_hashes, chunk):
+    # seen hashes are sorted arrays whose sizes halve from first to last, merged like a binary counter, so
+    # checking a chunk is a binary search per array, rows are compared by 64 bit hash only
+    row_hashes = pd.util.hash_pandas_object(chunk, index=False).values
+    duplicated = pd.Series(row_hashes).duplicated().values
+    for hashes in seen_hashes:
+        positions = np.minimum(np.searchsorted(hashes, row_hashes), len(hashes) - 1)
+        duplicated |= hashes[positions] == row_hashes
+    if not duplicated.all():
+        seen_hashes.append(np.sort(row_hashes[~duplicated]))
+    while len(seen_hashes) > 1 and len(seen_hashes[-2]) <= len(seen_hashes[-1]):
+        seen_hashes.append(np.sort(np.concatenate([seen_hashes.pop(), seen_hashes.pop()])))
+    return ~duplicated
+
+
+def prune_data_chunks(data_set_name, prune_techniques, data_format, chunk_size):
+    # prune data larger than memory in two passes over chunks of the cleaned data: the first pass collects the column
+    # types and a quantile sketch per column, the second pass filters every chunk and appends it to the pruned files
+    cleaned_path = f"./{DATA_FOLDER}/{data_set_name}/{CLEAN_FOLDER}/{data_file(CLEAN_FILE, data_format)}"
+    schema = data_schema(data_set_name)
+    for prune_technique in prune_techniques:
+        if prune_technique not in ["remove-outliers", "remove-duplicates", "none"]:
+            raise ValueError("Prune technique not recognized.")
+
+    bounds = {}
+    if "remove-outliers" in prune_techniques or data_format == "csv":
+        types = {}
+        sketches = {}
+        rng = np.random.default_rng(0)
+        with telemetry_phase("load"):
+            for chunk in read_data_chunks(cleaned_path, data_format, chunk_size, schema):
+                telemetry_rows("load", len(chunk))
+                for column in chunk.columns:
+                    types.setdefault(column, []).append(chunk[column].dtype)
+                    if "remove-outliers" in prune_techniques:
+                        sketch_update(sketches.setdefault(column, []), chunk[column].to_numpy(dtype=np.float64),
+                                      rng)
+        # text chunks are read with the types of the whole file, so equal rows have equal hashes in all chunks
+        schema = {column: schema.get(column, common_type(column_types)) for column, column_types in types.items()}
+        for column, levels in sketches.items():
+            Q1, Q3 = sketch_quantiles(levels, [0.25, 0.75])
+            IQR = Q3 - Q1
+            bounds[column] = (Q1 - 1.5 * IQR, Q3 + 1.5 * IQR)
 
-    # write data to file
     base_path_pruned = f"./{DATA_FOLDER}/{data_set_name}/{PRUNE_FOLDER}"
     Path(base_path_pruned).mkdir(exist_ok=True)
-    data.to_csv(f"{base_path_pruned}/{prune_technique}_{PRUNE_FILE}", index=False)
+    writers = {prune_technique: open_data_writer(
+        f"{base_path_pruned}/{prune_technique}_{data_file(PRUNE_FILE, data_format)}", data_format)
+        for prune_technique in prune_techniques}
+    seen_hashes = []
+    # the second pass reads, filters and writes chunk by chunk, so all of it is the save phase
+    with telemetry_phase("save"):
+        for chunk in read_data_chunks(cleaned_path, data_format, chunk_size, schema):
+            for prune_technique, writer in writers.items():
+                if prune_technique == "remove-outliers":
+                    keep = np.ones(len(chunk), dtype=bool)
+                    for column, (lower, upper) in bounds.items():
+                        values = chunk[column].to_numpy(dtype=np.float64)
+                        keep &= ~((values < lower) | (values > upper))
+                    pruned_chunk = chunk[keep]
+                elif prune_technique == "remove-duplicates":
+                    pruned_chunk = chunk[unseen_rows(seen_hashes, chunk)]
+                else:
+                    pruned_chunk = chunk
+                write_data_chunk(writer, pruned_chunk)
+                telemetry_rows("save", len(pruned_chunk))
+        for prune_technique, writer in writers.items():
+            close_data_writer(writer)
+            print(f"Pruned data with technique: {prune_technique}.")
     print(f"Written pruned data set to file.")
 
+
+@telemetry_job
+def prune_data(data_set_name, prune_techniques, data_format=DATA_FORMAT, chunk_size=0):
+    # with a chunk size, the data is pruned in chunks with approximate quantiles, so it does not have to fit in memory
+    if chunk_size > 0:
+        prune_data_chunks(data_set_name, prune_techniques, data_format, chunk_size)
+        return
+
+    # load the data once for all prune techniques
+    with telemetry_phase("load"):
+        data = read_data(f"./{DATA_FOLDER}/{data_set_name}/{CLEAN_FOLDER}/{data_file(CLEAN_FILE, data_format)}",
+                         data_format, data_schema(data_set_name))
+    telemetry_rows("load", len(data))
+    base_path_pruned = f"./{DATA_FOLDER}/{data_set_name}/{PRUNE_FOLDER}"
+    Path(base_path_pruned).mkdir(exist_ok=True)
+    for prune_technique in prune_techniques:
+        with telemetry_phase("compute"):
+            if prune_technique == "remove-outliers":
+                # apply outlier removal using IQR
+                pruned_data = data[outlier_mask(data)]
+            elif prune_technique == "remove-duplicates":
+                # remove duplicate rows
+                pruned_data = data[duplicate_mask(data)]
+            elif prune_technique == "none":
+                # apply no pruning
+                pruned_data = data
+            else:
+                raise ValueError("Prune technique not recognized.")
+
+        print(f"Pruned data with technique: {prune_technique}.")
+
+        # write data to file
+        with telemetry_phase("save"):
+            write_data(pruned_data, f"{base_path_pruned}/{prune_technique}_{data_file(PRUNE_FILE, data_format)}",
+                       data_format)
+        telemetry_rows("save", len(pruned_data))
+        print(f"Written pruned data set to file.")
+
     return
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("Random Seed Effects prune data!")
     parser.add_argument('--data_set_name', dest='data_set_name', type=str, required=True)
-    parser.add_argument('--prune_technique', dest='prune_technique', type=str, required=True)
+    parser.add_argument('--prune_technique', dest='prune_technique', nargs="+", type=str, required=True)
+    parser.add_argument('--data_format', dest='data_format', type=str, default=DATA_FORMAT)
+    parser.add_argument('--chunk_size', dest='chunk_size', type=int, default=0)
     args = parser.parse_args()
 
     print("Pruning data with arguments: ", args.__dict__)
-    prune_data(args.data_set_name, args.prune_technique)
+    prune_data(args.data_set_name, args.prune_technique, args.data_format, args.chunk_size)
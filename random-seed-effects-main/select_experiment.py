@@ -2,3 +2,5 @@
 file = "full"
 # select local execution stage
 stage = 7
+# run stages 0 to 5 as one task graph, every task starts as soon as its inputs exist
+pipeline = 0
@@ -0,0 +1,59 @@
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def resolve_num_workers(num_workers):
+    # a non-positive number of workers selects all available cores
+    if num_workers is None or int(num_workers) <= 0:
+        return os.cpu_count() or 1
+    return int(num_workers)
+
+
+def run_job(stage_function, job):
+    # run a single job in the current process and return the error message on failure
+    try:
+        stage_function(*job)
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+def run_jobs(stage_function, jobs, num_workers, on_success=None):
+    # run all jobs of a stage with the stage function imported once per worker process, finished jobs are passed to
+    # the optional callback as soon as they succeed
+    jobs = list(jobs)
+    stage_name = stage_function.__name__
+    if len(jobs) == 0:
+        print(f"No jobs to run for {stage_name}.")
+        return []
+
+    num_workers = min(resolve_num_workers(num_workers), len(jobs))
+    print(f"Running {len(jobs)} jobs for {stage_name} with {num_workers} workers.")
+    failed_jobs = []
+    if num_workers == 1:
+        for job in jobs:
+            error = run_job(stage_function, job)
+            if error is not None:
+                failed_jobs.append((job, error))
+                print(f"Job {stage_name}{job} failed:\n{error}")
+            elif on_success is not None:
+                on_success(job)
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = {executor.submit(run_job, stage_function, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    error = future.result()
+                except Exception:
+                    # the worker process itself died, e.g. because it ran out of memory
+                    error = traceback.format_exc()
+                if error is not None:
+                    failed_jobs.append((job, error))
+                    print(f"Job {stage_name}{job} failed:\n{error}")
+                elif on_success is not None:
+                    on_success(job)
+
+    print(f"Finished {stage_name}: {len(jobs) - len(failed_jobs)} succeeded, {len(failed_jobs)} failed.")
+    return failed_jobs
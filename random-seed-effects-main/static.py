@@ -2,10 +2,14 @@ DATA_FOLDER = "data"
 ORIGINAL_FOLDER = "original"
 CLEAN_FOLDER = "cleaned"
 CLEAN_FILE = "cleaned.csv"
+SCHEMA_FILE = "schema.json"
 PRUNE_FOLDER = "pruned"
 PRUNE_FILE = "pruned.csv"
 SPLIT_FOLDER = "split"
-SPLIT_FILE = "split.csv"
+SPLIT_FILE = "split.npy"
+SPLIT_BASE_FILE = "base.arrow"
+# splits of earlier versions, which stored the shuffled rows of every fold
+LEGACY_SPLIT_FILE = "split.csv"
 ML_FOLDER = "ml"
 ML_FILE = "ml.bpk"
 ML_SEED_FILE = "seed.txt"
@@ -13,3 +17,25 @@ PREDICTION_FOLDER = "predictions"
 PREDICTION_FILE = "predictions.pkl"
 EVALUATION_FOLDER = "evaluations"
 EVALUATION_FILE = "evaluations.pkl"
+EVALUATION_REPORT_FILE = "evaluation_report.parquet"
+EVALUATION_MANIFEST_FILE = "evaluation_report_manifest.json"
+DATA_FORMAT = "csv"
+DATA_FORMATS = ["csv", "parquet", "feather"]
+MODEL_COLUMNS = ["X", "y"]
+CACHE_FOLDER = "cache"
+CACHE_OBJECT_FOLDER = "objects"
+CACHE_INDEX_FILE = "cache_index.sqlite"
+CATALOG_FILE = "catalog.sqlite"
+CATALOG_JOURNAL_FOLDER = "catalog_journal"
+CATALOG_SNAPSHOT_PREFIX = "_snapshot_"
+CATALOG_COMPACT_JOURNALS = 64
+CATALOG_JOURNAL_IDLE = 600
+TELEMETRY_FILE = "telemetry.jsonl"
+TASK_FOLDER = "omni_tasks"
+JOB_ARRAY_MAX_SIZE = 1000
+CLEAN_CHUNK_SIZE = 100000
+QUANTILE_SKETCH_SIZE = 4096
+MODEL_POOL_SIZE = 8
+BENCHMARK_FOLDER = "benchmark"
+BENCHMARK_DATA_SET_NAME = "SyntheticData"
+BENCHMARK_RESULTS_FILE = "benchmark_results.csv"
@@ -0,0 +1,66 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+from clean_data import clean_data
+from prune_data import prune_data
+from generate_splits import generate_splits, generate_splits_seeds
+from fit_ML import fit_ML, fit_ML_seeds, fit_ML_folds
+from make_predictions import make_predictions
+from evaluate_predictions import evaluate_predictions
+from fold_worker import fit_predict_evaluate
+from stage_runner import run_jobs
+
+STAGE_FUNCTIONS = {stage_function.__name__: stage_function for stage_function in
+                   [clean_data, prune_data, generate_splits, generate_splits_seeds, fit_ML, fit_ML_seeds,
+                    fit_ML_folds, make_predictions, evaluate_predictions, fit_predict_evaluate]}
+
+
+def run_pack_task(task_index, function_name, job):
+    STAGE_FUNCTIONS[function_name](*job)
+
+
+def write_task_pack(pack_path, jobs):
+    # one stage function name and its arguments per line, a new pack starts without finished tasks
+    with open(pack_path, 'w', newline='\n') as f:
+        f.write("".join(f"{json.dumps([function_name, job])}\n" for function_name, job in jobs))
+    Path(f"{pack_path}.done").unlink(missing_ok=True)
+
+
+def run_task_pack(pack_path, num_workers, task_index=-1):
+    # the indices of finished tasks are appended to a done file, so a resubmitted pack only runs the remaining tasks,
+    # a task index selects a single task of the pack, which SLURM tracks on its own, so jobs on many nodes never
+    # append to the same done file
+    done_path = f"{pack_path}.done" if task_index == -1 else None
+    done_tasks = set()
+    if done_path is not None and Path(done_path).exists():
+        done_tasks = set(int(line) for line in open(done_path).read().split())
+    jobs = []
+    for line_index, line in enumerate(open(pack_path).read().splitlines()):
+        if line_index not in done_tasks and task_index in [-1, line_index]:
+            function_name, job = json.loads(line)
+            jobs.append((line_index, function_name, job))
+    print(f"Running {len(jobs)} tasks of {pack_path}, skipping {len(done_tasks)} finished tasks.")
+
+    if done_path is None:
+        return run_jobs(run_pack_task, jobs, num_workers)
+    with open(done_path, "a") as done_file:
+        def mark_done(job):
+            done_file.write(f"{job[0]}\n")
+            done_file.flush()
+
+        failed_jobs = run_jobs(run_pack_task, jobs, num_workers, mark_done)
+    return failed_jobs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Random Seed Effects run a pack of tasks!")
+    parser.add_argument('--pack', dest='pack', type=str, required=True)
+    parser.add_argument('--num_workers', dest='num_workers', type=int, default=0)
+    parser.add_argument('--task', dest='task', type=int, default=-1)
+    args = parser.parse_args()
+
+    print("Running task pack with arguments: ", args.__dict__)
+    # a failed task fails the whole job, so SLURM reports it
+    if len(run_task_pack(args.pack, args.num_workers, args.task)) > 0:
+        sys.exit(1)
@@ -0,0 +1,168 @@
+import argparse
+import functools
+import inspect
+import json
+import os
+import resource
+import socket
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import pandas as pd
+from static import *
+
+# the arguments of a stage function that identify its job in the telemetry
+TELEMETRY_LABELS = ["data_set_name", "prune_technique", "prune_techniques", "split_technique", "test_fold",
+                    "test_folds", "shuffle_seed", "reproducibility_seeds", "MLModel", "ML_seed", "ML_seeds",
+                    "num_batches", "run_batch", "data_format"]
+TELEMETRY_MEASURES = ["wall_time", "cpu_time", "read_bytes", "written_bytes"]
+
+# the records of the running jobs of this process, innermost last
+_running_jobs = []
+
+
+def reset_peak_memory():
+    # the peak resident memory of the process is reset, so it can be measured per job and phase of a worker process
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def measure():
+    # wall time, cpu time of the process and its finished children, bytes read and written through system calls, and
+    # the peak resident memory since the last reset, memory-mapped reads are not counted as read bytes
+    times = os.times()
+    measures = {"wall_time": time.perf_counter(),
+                "cpu_time": times.user + times.system + times.children_user + times.children_system,
+                "read_bytes": 0, "written_bytes": 0, "peak_rss": 0}
+    try:
+        io = dict(line.split(": ") for line in open("/proc/self/io").read().splitlines())
+        measures["read_bytes"] = int(io["rchar"])
+        measures["written_bytes"] = int(io["wchar"])
+        status = dict(line.split(":", 1) for line in open("/proc/self/status").read().splitlines())
+        measures["peak_rss"] = int(status["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        measures["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return measures
+
+
+def new_phase():
+    return {measure_name: 0 for measure_name in TELEMETRY_MEASURES + ["rows", "peak_rss"]}
+
+
+def measure_since(start):
+    end = measure()
+    measures = {measure_name: end[measure_name] - start[measure_name] for measure_name in TELEMETRY_MEASURES}
+    measures["peak_rss"] = end["peak_rss"]
+    return measures
+
+
+def telemetry_job(stage_function):
+    # a stage function decorated with this writes one record per call to the telemetry file, with the measures of the
+    # whole call and of the phases and rows it reports
+    @functools.wraps(stage_function)
+    def run_stage_function(*args, **kwargs):
+        arguments = inspect.signature(stage_function).bind(*args, **kwargs).arguments
+        record = {"stage": stage_function.__name__, "host": socket.gethostname(), "pid": os.getpid(),
+                  "started": time.time()}
+        record.update({label: arguments[label] for label in TELEMETRY_LABELS if label in arguments})
+        record["status"] = "failed"
+        record["phases"] = {}
+        _running_jobs.append(record)
+        reset_peak_memory()
+        start = measure()
+        try:
+            result = stage_function(*args, **kwargs)
+            record["status"] = "succeeded"
+            return result
+        finally:
+            _running_jobs.pop()
+            record.update(measure_since(start))
+            record["peak_rss"] = max([record["peak_rss"]] + [phase["peak_rss"] for phase in
+                                                             record["phases"].values()])
+            write_telemetry(record)
+
+    return run_stage_function
+
+
+@contextmanager
+def telemetry_phase(phase_name):
+    # the measures of a load, compute or save phase of the running job, repeated phases add up
+    if len(_running_jobs) == 0:
+        yield
+        return
+    phases = _running_jobs[-1]["phases"]
+    reset_peak_memory()
+    start = measure()
+    try:
+        yield
+    finally:
+        measures = measure_since(start)
+        phase = phases.setdefault(phase_name, new_phase())
+        for measure_name in TELEMETRY_MEASURES:
+            phase[measure_name] += measures[measure_name]
+        phase["peak_rss"] = max(phase["peak_rss"], measures["peak_rss"])
+
+
+def telemetry_rows(phase_name, num_rows):
+    # the rows loaded, computed on or saved in a phase of the running job
+    if len(_running_jobs) > 0:
+        _running_jobs[-1]["phases"].setdefault(phase_name, new_phase())["rows"] += int(num_rows)
+
+
+def write_telemetry(record):
+    # one line per record, written at once so that records of parallel jobs do not interleave
+    Path(f"./{DATA_FOLDER}").mkdir(exist_ok=True)
+    with open(f"./{DATA_FOLDER}/{TELEMETRY_FILE}", "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+
+def telemetry_summary(group_by, telemetry_path=f"./{DATA_FOLDER}/{TELEMETRY_FILE}"):
+    # the records aggregated per group, with the phase measures as columns
+    records = [json.loads(line) for line in open(telemetry_path).read().splitlines() if line.strip()]
+    if len(records) == 0:
+        return pd.DataFrame()
+    rows = []
+    for record in records:
+        row = {key: value for key, value in record.items() if key != "phases"}
+        for phase_name, phase in record["phases"].items():
+            row.update({f"{phase_name}_{measure_name}": value for measure_name, value in phase.items()})
+        rows.append(row)
+    data = pd.DataFrame(rows)
+    group_by = [column for column in group_by if column in data.columns]
+    for column in group_by:
+        data[column] = data[column].fillna("-").astype(str)
+
+    sums = [column for column in data.columns if column in TELEMETRY_MEASURES or column.endswith(tuple(
+        f"_{measure_name}" for measure_name in TELEMETRY_MEASURES + ["rows"]))]
+    peaks = [column for column in data.columns if column == "peak_rss" or column.endswith("_peak_rss")]
+    data["jobs"] = 1
+    data["failed"] = (data["status"] != "succeeded").astype(int)
+    summary = data.groupby(group_by).agg({"jobs": "sum", "failed": "sum", **{column: "sum" for column in sums},
+                                          **{column: "max" for column in peaks}})
+    # rows per second of wall time of the phases that report rows
+    for column in [column for column in summary.columns if column.endswith("_rows")]:
+        phase_name = column[:-len("_rows")]
+        summary[f"{phase_name}_rows_per_second"] = summary[column].where(summary[column] > 0) / summary[
+            f"{phase_name}_wall_time"].where(summary[f"{phase_name}_wall_time"] > 0)
+    return summary.reset_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Random Seed Effects telemetry summary!")
+    parser.add_argument('--group_by', dest='group_by', nargs="+", type=str,
+                        default=["stage", "data_set_name", "MLModel"])
+    parser.add_argument('--telemetry_file', dest='telemetry_file', type=str,
+                        default=f"./{DATA_FOLDER}/{TELEMETRY_FILE}")
+    parser.add_argument('--output', dest='output', type=str, default="")
+    args = parser.parse_args()
+
+    summary = telemetry_summary(args.group_by, args.telemetry_file)
+    if args.output != "":
+        summary.to_csv(args.output, index=False)
+        print(f"Written telemetry summary to {args.output}.")
+    else:
+        with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 200):
+            print(summary)
@@ -0,0 +1,80 @@
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+PROJECT_FOLDER = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_FOLDER))
+
+import artifact_catalog
+from artifact_catalog import connect_catalog, register_artifact
+from static import *
+
+JOURNAL_FOLDER = Path(f"./{DATA_FOLDER}/{CATALOG_JOURNAL_FOLDER}")
+
+
+def write_records(journal_name, records):
+    JOURNAL_FOLDER.mkdir(parents=True, exist_ok=True)
+    with open(JOURNAL_FOLDER / journal_name, "a") as f:
+        f.write("".join(json.dumps(record) + "\n" for record in records))
+
+
+def register_record(path, record_time):
+    return {"register": [str(Path(path).resolve()), "split", "TestData", "remove-outliers", "weak-generalization", 0,
+                         "11", None, None, None, None], "time": record_time}
+
+
+def forget_record(path, record_time):
+    return {"forget": str(Path(path).resolve()), "time": record_time}
+
+
+def catalog_paths(connection):
+    return sorted(Path(row[0]).name for row in connection.execute("SELECT path FROM artifacts").fetchall())
+
+
+def test_journals_are_replayed_in_time_order(tmp_path, monkeypatch):
+    # a forget written before a register of the same path must not remove it, whichever journal is merged first
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("RSE_CATALOG_FOLDER", str(tmp_path / "catalog"))
+    Path(f"./{DATA_FOLDER}").mkdir()
+    connect_catalog().close()
+    write_records("a_1.jsonl", [register_record("first", 2), register_record("second", 3)])
+    write_records("b_1.jsonl", [forget_record("first", 1)])
+    connection = connect_catalog()
+    assert catalog_paths(connection) == ["first", "second"]
+
+    # a record merged after a newer record of the same path is ignored
+    write_records("c_1.jsonl", [forget_record("second", 2)])
+    write_records("b_1.jsonl", [forget_record("first", 4)])
+    artifact_catalog.merge_journals(connection)
+    assert catalog_paths(connection) == ["second"]
+    connection.close()
+
+
+def test_idle_journals_are_compacted(tmp_path, monkeypatch):
+    # finished jobs leave one journal each, idle journals are moved into one snapshot that new catalogs still read
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("RSE_CATALOG_FOLDER", str(tmp_path / "catalog"))
+    monkeypatch.setattr(artifact_catalog, "CATALOG_COMPACT_JOURNALS", 3)
+    Path(f"./{DATA_FOLDER}").mkdir()
+    for compaction in range(2):
+        for job in range(3):
+            write_records(f"node{job}_{compaction}.jsonl", [register_record(f"split{compaction}_{job}", job)])
+            idle_time = time.time() - CATALOG_JOURNAL_IDLE - 1
+            os.utime(JOURNAL_FOLDER / f"node{job}_{compaction}.jsonl", (idle_time, idle_time))
+        register_artifact("split", f"running{compaction}", "TestData", "remove-outliers", "weak-generalization", 0, 11)
+        connection = connect_catalog()
+        assert len(catalog_paths(connection)) == 4 * (compaction + 1)
+        connection.close()
+
+    # the running journal is kept, the snapshot holds the sections of all compacted journals
+    journals = sorted(journal.name for journal in JOURNAL_FOLDER.glob("*.jsonl"))
+    assert len(journals) == 2 and journals[0].startswith(CATALOG_SNAPSHOT_PREFIX)
+    sections = artifact_catalog.snapshot_sections((JOURNAL_FOLDER / journals[0]).read_bytes())
+    assert len(sections) == 6 and all(len(lines) == 1 for _, _, lines in sections)
+
+    monkeypatch.setenv("RSE_CATALOG_FOLDER", str(tmp_path / "other_catalog"))
+    connection = connect_catalog()
+    assert len(catalog_paths(connection)) == 8
+    connection.close()
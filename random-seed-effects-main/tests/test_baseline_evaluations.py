@@ -0,0 +1,52 @@
+import json
+import math
+import os
+import pickle as pkl
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_FOLDER = Path(__file__).resolve().parent.parent
+# the bundled data sets, whose original files are part of the repository
+DATA_SET_NAMES = ["WhoData", "CancerData2", "AdultData", "SpamData"]
+
+
+def test_evaluations_match_baseline(tmp_path):
+    # the whole pipeline on the reproducibility shuffle seeds of the stored evaluations gives the evaluations of the
+    # original code, which were computed with full precision data and sklearn models, up to the rounding of sums
+    baseline = json.load(open(Path(__file__).parent / "baseline_evaluations.json"))
+    baseline_seeds = {}
+    for evaluation_file in baseline:
+        data_set_name, _, file_name = evaluation_file.split("/")
+        baseline_seeds.setdefault(data_set_name, set()).add(file_name.split("_")[1])
+
+    for file in PROJECT_FOLDER.glob("*.py"):
+        shutil.copy(file, tmp_path)
+    seeds = json.load(open(PROJECT_FOLDER / "project_seeds.txt"))
+    json.dump({data_set_name: {shuffle_seed: model_seeds for shuffle_seed, model_seeds in seeds[data_set_name].items()
+                               if shuffle_seed in shuffle_seeds} for data_set_name, shuffle_seeds in
+               baseline_seeds.items()}, open(tmp_path / "project_seeds.txt", "w"))
+    experiment_settings = json.load(open(PROJECT_FOLDER / "experiment_full.json"))
+    experiment_settings.update({"REPRODUCIBILITY_MODE": 1, "DATA_SET_NAMES": DATA_SET_NAMES, "DATA_FORMAT": "csv",
+                                "NUM_BATCHES": 10, "TOPN_SCORES": [1, 5, 10], "ML_SEEDING": ["random"],
+                                "ML_SEED_COUNT": 0, "FUSED_EXECUTION": 0, "ARTIFACT_CACHE_SIZE": "",
+                                "PRUNE_CHUNK_SIZE": 0, "COMPACT_FLOATS": 0})
+    json.dump(experiment_settings, open(tmp_path / "experiment_full.json", "w"))
+    (tmp_path / "select_experiment.py").write_text('file = "full"\nstage = 0\npipeline = 1\n')
+    for data_set_name in DATA_SET_NAMES:
+        shutil.copytree(PROJECT_FOLDER / "data" / data_set_name / "original",
+                        tmp_path / "data" / data_set_name / "original")
+
+    subprocess.run([sys.executable, "local_executor.py"], cwd=tmp_path, check=True, capture_output=True,
+                   env=dict(os.environ, RSE_CATALOG_FOLDER=str(tmp_path / "catalog")))
+
+    for evaluation_file, baseline_evaluation in baseline.items():
+        evaluation = pkl.load(open(tmp_path / "data" / evaluation_file, "rb"))
+        for run_batch, batch_evaluation in baseline_evaluation.items():
+            for topn_score, scores in batch_evaluation.items():
+                for score_name, baseline_score in scores.items():
+                    score = evaluation[int(run_batch)][int(topn_score)][score_name]
+                    assert (math.isnan(score) and math.isnan(baseline_score)) or math.isclose(
+                        score, baseline_score, rel_tol=1e-12, abs_tol=1e-12), \
+                        f"{evaluation_file} batch {run_batch} top {topn_score} {score_name}: {score} != {baseline_score}"
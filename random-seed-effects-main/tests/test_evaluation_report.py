@@ -0,0 +1,66 @@
+import os
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+PROJECT_FOLDER = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_FOLDER))
+
+from artifact_catalog import register_artifact
+from data_io import split_path
+from evaluate_predictions import save_evaluation
+from evaluation_report import evaluation_report, load_evaluation_report
+from plot_results import plot_table
+
+SHUFFLE_SEEDS = [11, 22]
+TOPN_SCORES = [1, 5, 10]
+
+
+def write_evaluation(shuffle_seed, test_fold, rng):
+    save_evaluation("TestData", "remove-outliers", "weak-generalization", test_fold, shuffle_seed, "knn", "random", 2,
+                    TOPN_SCORES, {run_batch: {topn_score: {"mae": rng.random(), "rmse": rng.random()}
+                                              for topn_score in TOPN_SCORES} for run_batch in range(2)})
+
+
+def build_report():
+    evaluation_report(["TestData"], ["remove-outliers"], ["weak-generalization"], 5, ["knn"], ["random"], 2,
+                      TOPN_SCORES)
+    return plot_table(load_evaluation_report(), TOPN_SCORES)
+
+
+def sorted_table(table):
+    return table.astype(str).sort_values(list(table.columns)).reset_index(drop=True)
+
+
+def test_plot_table_ignores_report_order(tmp_path, monkeypatch):
+    # rows of an updated evaluation file move to a new part of the report, which must not change the holdout fold
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("RSE_CATALOG_FOLDER", str(tmp_path / "catalog"))
+    rng = np.random.default_rng(0)
+    Path("./data/TestData/split").mkdir(parents=True)
+    for shuffle_seed in SHUFFLE_SEEDS:
+        for test_fold in range(5):
+            path = split_path("TestData", "remove-outliers", "weak-generalization", test_fold, shuffle_seed)
+            Path(path).touch()
+            register_artifact("split", path, "TestData", "remove-outliers", "weak-generalization", test_fold,
+                              shuffle_seed)
+            write_evaluation(shuffle_seed, test_fold, rng)
+    table = build_report()
+
+    # the same evaluation written again counts as changed
+    evaluation_file = next(Path("./data/TestData/evaluations_knn").glob(f"1_{SHUFFLE_SEEDS[0]}_*"))
+    stat = os.stat(evaluation_file)
+    os.utime(evaluation_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    updated_table = build_report()
+
+    assert len(list(Path("./evaluation_report.parquet").glob("part-*"))) == 2
+    pd.testing.assert_frame_equal(sorted_table(table.round(12)), sorted_table(updated_table.round(12)))
+
+
+def test_report_without_evaluations(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("RSE_CATALOG_FOLDER", str(tmp_path / "catalog"))
+    table = build_report()
+    assert len(table) == 0
+    assert list(load_evaluation_report(columns=["recommender", "mae"]).dtypes) == ["category", "float64"]
@@ -0,0 +1,115 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_FOLDER = Path(__file__).resolve().parent.parent
+# the stand-in sbatch runs submitted scripts on this machine
+SLURM_FOLDER = Path(__file__).resolve().parent / "slurm"
+DATA_SET_NAMES = ["WhoData", "CancerData2", "SpamData"]
+
+
+def project_copy(tmp_path, experiment_settings):
+    for file in PROJECT_FOLDER.glob("*.py"):
+        shutil.copy(file, tmp_path)
+    settings = json.load(open(PROJECT_FOLDER / "experiment_full.json"))
+    settings.update(experiment_settings)
+    json.dump(settings, open(tmp_path / "experiment_full.json", "w"))
+    return dict(os.environ, PATH=os.pathsep.join([str(SLURM_FOLDER), str(Path(sys.executable).parent),
+                                                  os.environ["PATH"]]),
+                SBATCH_LOG=str(tmp_path / "sbatch.log"), RSE_CATALOG_FOLDER=str(tmp_path / "catalog"))
+
+
+def submitted_arrays(tmp_path):
+    return [line.rsplit("array=", 1)[1] for line in (tmp_path / "sbatch.log").read_text().splitlines()]
+
+
+def test_stage_runs_as_job_array(tmp_path):
+    # every array task finds its command line in the task manifest by its SLURM_ARRAY_TASK_ID
+    env = project_copy(tmp_path, {"DATA_SET_NAMES": DATA_SET_NAMES, "JOB_ARRAY": 1, "JOB_ARRAY_PARALLEL": 2})
+    for data_set_name in DATA_SET_NAMES:
+        shutil.copytree(PROJECT_FOLDER / "data" / data_set_name / "original",
+                        tmp_path / "data" / data_set_name / "original")
+
+    subprocess.run([sys.executable, "hpc_executor.py", "--experiment", "full", "--stage", "0"], cwd=tmp_path,
+                   env=env, check=True, capture_output=True)
+
+    assert submitted_arrays(tmp_path) == ["0-2%2"]
+    manifest = next((tmp_path / "omni_tasks").glob("_RSE_stage0_clean_array0_*.txt")).read_text().splitlines()
+    assert len(manifest) == len(DATA_SET_NAMES)
+    for task_id, data_set_name in enumerate(DATA_SET_NAMES):
+        assert f"--data_set_name {data_set_name} " in manifest[task_id]
+        task_output = next((tmp_path / "omni_out").glob(f"_RSE_stage0_clean_array0_*_{task_id}.out")).read_text()
+        assert f"'data_set_name': '{data_set_name}'" in task_output
+        assert (tmp_path / "data" / data_set_name / "cleaned" / "cleaned.csv").exists()
+
+
+def test_array_tasks_are_throttled(tmp_path):
+    # a task counts the tasks running next to it, which must never be more than the throttle of the array
+    env = project_copy(tmp_path, {})
+    (tmp_path / "running").mkdir()
+    (tmp_path / "count_running.py").write_text(
+        "import os, sys, time\n"
+        "open(f'running/{sys.argv[1]}', 'w').close()\n"
+        "time.sleep(0.3)\n"
+        "print(len(os.listdir('running')), file=open('counts.txt', 'a'))\n"
+        "os.remove(f'running/{sys.argv[1]}')\n")
+    subprocess.run([sys.executable, "-c", "from hpc_executor import submit_tasks; submit_tasks('throttle', "
+                    "[(f'task{i}', f'./count_running.py {i}', None) for i in range(6)], '00:01:00', '1G', 1, '', 1, "
+                    "2, 0)"], cwd=tmp_path, env=env, check=True, capture_output=True)
+
+    assert submitted_arrays(tmp_path) == ["0-5%2"]
+    counts = [int(count) for count in (tmp_path / "counts.txt").read_text().split()]
+    assert len(counts) == 6 and max(counts) <= 2
+
+
+def test_arrays_are_split_at_maximum_size(tmp_path):
+    # more tasks than the maximum array size of the cluster are submitted as several arrays with their own manifests,
+    # and submitting again does not overwrite the manifests that queued arrays still read
+    env = project_copy(tmp_path, {})
+    env["SBATCH_DRY_RUN"] = "1"
+    for first_task in [0, 5000]:
+        subprocess.run([sys.executable, "-c", "from hpc_executor import submit_tasks; submit_tasks('chunks', "
+                        f"[(f'task{{i}}', f'./task.py {{i}}', None) for i in range({first_task}, "
+                        f"{first_task + 1001})], '00:01:00', '1G', 1, '', 1, 4, 0)"], cwd=tmp_path, env=env,
+                       check=True, capture_output=True)
+
+    assert submitted_arrays(tmp_path) == ["0-999%4", "0-0%4"] * 2
+    first_chunks = sorted((tmp_path / "omni_tasks").glob("_RSE_chunks_array0_*.txt"), key=os.path.getmtime)
+    last_chunks = sorted((tmp_path / "omni_tasks").glob("_RSE_chunks_array1_*.txt"), key=os.path.getmtime)
+    assert len(first_chunks) == 2 and len(last_chunks) == 2
+    assert [chunk.read_text().splitlines()[-1] for chunk in first_chunks] == ["./task.py 999", "./task.py 5999"]
+    assert [chunk.read_text().splitlines() for chunk in last_chunks] == [["./task.py 1000"], ["./task.py 6000"]]
+
+
+def test_packs_of_every_submission_are_kept(tmp_path):
+    # packs are read by the jobs when they run, so a second submission writes new packs next to the queued ones
+    env = project_copy(tmp_path, {})
+    env["SBATCH_DRY_RUN"] = "1"
+    for first_task in [0, 10]:
+        subprocess.run([sys.executable, "-c", "from hpc_executor import submit_tasks; submit_tasks('packs', "
+                        f"[(f'task{{i}}', '', ('clean_data', [f'Data{{i}}'])) for i in range({first_task}, "
+                        f"{first_task + 3})], '00:01:00', '1G', 1, '', 0, 0, 2)"], cwd=tmp_path, env=env,
+                       check=True, capture_output=True)
+
+    packs = sorted((tmp_path / "omni_tasks").glob("_RSE_packs_pack0_*.jsonl"), key=os.path.getmtime)
+    assert len(packs) == 2
+    assert [json.loads(pack.read_text().splitlines()[0])[1] for pack in packs] == [["Data0"], ["Data10"]]
+
+
+def test_pipeline_runs_as_dependent_jobs(tmp_path):
+    # every job of the pipeline runs one task of its own pack, without a shared done file
+    env = project_copy(tmp_path, {"DATA_SET_NAMES": ["WhoData"], "MLMODELS": ["knn"], "REPRODUCIBILITY_MODE": 1})
+    seeds = json.load(open(PROJECT_FOLDER / "project_seeds.txt"))["WhoData"]
+    shuffle_seed = next(iter(seeds))
+    json.dump({"WhoData": {shuffle_seed: seeds[shuffle_seed]}}, open(tmp_path / "project_seeds.txt", "w"))
+    shutil.copytree(PROJECT_FOLDER / "data" / "WhoData" / "original", tmp_path / "data" / "WhoData" / "original")
+
+    subprocess.run([sys.executable, "hpc_executor.py", "--experiment", "full", "--pipeline", "1"], cwd=tmp_path,
+                   env=env, check=True, capture_output=True)
+
+    assert len(list((tmp_path / "omni_tasks").glob("_RSE_pipeline_*.jsonl"))) == 1
+    assert len(list((tmp_path / "omni_tasks").glob("*.done"))) == 0
+    assert len(list((tmp_path / "data" / "WhoData" / "evaluations_knn").glob(f"*_{shuffle_seed}_*"))) == 5
@@ -0,0 +1,20 @@
+import sys
+from pathlib import Path
+import numpy as np
+from sklearn.neighbors import KNeighborsRegressor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ml_engines import SortedKNNRegressor
+
+
+def test_sorted_knn_matches_sklearn():
+    # small training sets and tied neighbors fall back to sklearn, which must see the features in their own type
+    rng = np.random.default_rng(0)
+    for num_rows in [6, 11, 40]:
+        for dtype in [np.int8, np.int16, np.float32, np.float64]:
+            X = rng.integers(-20, 20, (num_rows, 1)).astype(dtype)
+            y = rng.normal(size=num_rows)
+            queries = rng.integers(-25, 25, (50, 1)).astype(dtype)
+            np.testing.assert_allclose(SortedKNNRegressor().fit(X, y).predict(queries),
+                                       KNeighborsRegressor().fit(X, y).predict(queries), rtol=0, atol=1e-12)